@@ -6,41 +6,76 @@
 
 import json
 import logging
+from address import AddressTable, addresses
 from router import Router
 from packet import Packet
 
+# Mức log chung cho mọi router DV. Đặt mức cho từng logger con sẽ xóa cache của mọi logger (O(số router))
+logging.getLogger("DV").setLevel(logging.INFO)
+
 class DVrouter(Router):
-    """Giao thức định tuyến Distance Vector."""
+    """Giao thức định tuyến Distance Vector.
+
+    Các tùy chọn chống count-to-infinity (truyền qua "router_options" của kịch bản):
+
+    - split_horizon: không quảng bá tuyến qua cổng mà tuyến đó được học.
+    - poison_reverse: quảng bá INFINITY cho các tuyến đó thay vì bỏ qua.
+    - triggered_updates: gửi ngay khi bảng định tuyến thay đổi (nếu không thì chờ
+      chu kỳ heartbeat).
+    - triggered_withdrawals: luôn gửi ngay khi có đích trở thành không tới được.
+    - hold_down: số chu kỳ heartbeat bỏ qua các tuyến tệ hơn đến một đích vừa bị
+      tăng chi phí hoặc mất tuyến (0 là tắt).
+    - ecmp: giữ mọi bước nhảy kế tiếp có cùng chi phí nhỏ nhất và chọn cổng theo băm
+      (nguồn, đích, luồng) của gói tin.
+    - min_update_interval, heartbeat_jitter, max_heartbeat_backoff: điều tiết cập
+      nhật kích hoạt và gửi định kỳ (xem lớp Router).
+    - hello_interval, dead_multiplier: phát hiện liên kết hỏng âm thầm bằng gói hello;
+      cổng bị coi là hỏng được xử lý như liên kết bị gỡ (xem lớp Router).
+    """
 
     INFINITY = 16  # Giới hạn khoảng cách tối đa để ngăn count-to-infinity
 
-    def __init__(self, addr, heartbeat_time):
-        super().__init__(addr)
+    def __init__(self, addr, heartbeat_time, split_horizon=True, poison_reverse=True,
+                 triggered_updates=True, triggered_withdrawals=True, hold_down=0, ecmp=False, **pacing):
+        super().__init__(addr, heartbeat_time, **pacing)
         self.heartbeat_time = heartbeat_time  # Thời gian gửi bảng định tuyến định kỳ (ms)
-        self.last_time = 0  # Thời điểm xử lý cuối
-        self.distance_vector = {addr: 0}  # Bảng định tuyến: {đích: khoảng cách}
-        self.forwarding_table = {}  # Bảng chuyển tiếp: {đích: cổng}
+        self.distance_vector = AddressTable({addr: 0})  # Bảng định tuyến: {đích: khoảng cách}, lưu theo ID địa chỉ
+        self.forwarding_table = AddressTable()  # Bảng chuyển tiếp: {đích: cổng}, lưu theo ID địa chỉ
         self.neighbors = {}  # Hàng xóm: {cổng: (địa chỉ, chi phí)}
-        self.neighbor_dv = {}  # Bảng định tuyến của hàng xóm: {địa chỉ: {đích: khoảng cách}}
+        self.neighbor_dv = {}  # Bảng định tuyến của hàng xóm: {địa chỉ: AddressTable {đích: khoảng cách}}
         self.INFINITY = 16  # Giới hạn khoảng cách
-        self.last_broadcast_dv = {}  # Lưu bảng định tuyến đã gửi để tránh gửi trùng
-
-        # Thiết lập logging
-        self.logger = logging.getLogger(f"DV_{addr}")
-        self.logger.setLevel(logging.INFO)
-        file_handler = logging.FileHandler(f"router_{addr}.log", mode='w')
-        formatter = logging.Formatter('[%(asctime)s] [DV_%(name)s] %(message)s')
-        file_handler.setFormatter(formatter)
-        self.logger.handlers = []
-        self.logger.addHandler(file_handler)
-        self.logger.info(f"Khoi dong router {addr} voi thoi gian phat {heartbeat_time} ms")
+        self.last_broadcast_dv = {}  # Bảng định tuyến đã gửi qua từng cổng: {cổng: {đích: khoảng cách}}
+        self.split_horizon = split_horizon
+        self.poison_reverse = poison_reverse
+        self.triggered_updates = triggered_updates
+        self.triggered_withdrawals = triggered_withdrawals
+        self.hold_down_time = hold_down * heartbeat_time  # Thời gian hold-down (ms)
+        self.hold_down = {}  # Các đích đang hold-down: {đích: (hết hạn (ms), chi phí trước đó)}
+        self.ecmp = ecmp
+        self.multipath = {}  # Các cổng cùng chi phí (khi bật ECMP): {ID đích: [cổng]}
+
+        # Thiết lập logging: logger con của "DV" (mức INFO đặt một lần cho cả lớp), tệp log chỉ được mở khi ghi dòng đầu tiên.
+        # Bỏ qua khi đã được truyền một logger (ví dụ logger im lặng của Network khi tắt log)
+        if self.logger is None:
+            self.logger = logging.getLogger(f"DV.{addr}")
+            file_handler = logging.FileHandler(f"router_{addr}.log", mode='w', delay=True)
+            formatter = logging.Formatter('[%(asctime)s] [%(name)s] %(message)s')
+            file_handler.setFormatter(formatter)
+            self.logger.handlers = []
+            self.logger.addHandler(file_handler)
+
+    def setup(self):
+        """Ghi log khởi động trong luồng của router, ngay trước tick đầu tiên."""
+        self.logger.info(f"Khoi dong router {self.addr} voi thoi gian phat {self.heartbeat_time} ms")
 
     def handle_packet(self, port, packet):
         """Xử lý gói tin đến từ cổng."""
         self.logger.info(f"Nhan goi tu cong {port}, nguon {packet.src_addr}, dich {packet.dst_addr}")
-        if packet.is_traceroute:
-            if packet.dst_addr in self.forwarding_table:
-                out_port = self.forwarding_table[packet.dst_addr]
+        if packet.is_traceroute or packet.is_data:
+            out_port = self.forwarding_table.get_id(packet.dst_id)
+            if out_port is not None:
+                if packet.dst_id in self.multipath:
+                    out_port = self.select_port(self.multipath[packet.dst_id], packet)
                 self.logger.info(f"Chuyen goi traceroute den {packet.dst_addr} qua cong {out_port}")
                 self.send(out_port, packet)
             else:
@@ -54,10 +89,9 @@ class DVrouter(Router):
                 self.logger.info(f"Bo bang tu {src} vi khong phai hang xom")
                 return
             if src not in self.neighbor_dv or self.neighbor_dv[src] != received_dv:
-                self.neighbor_dv[src] = received_dv
+                self.neighbor_dv[src] = AddressTable(received_dv)
                 self.logger.info(f"Nhan bang dinh tuyen tu {src}: {received_dv}")
-                self.update_distance_vector()
-                self.broadcast_distance_vector()
+                self.handle_dv_change()
         except json.JSONDecodeError:
             self.logger.info(f"Goi tu cong {port} khong dung dinh dang")
 
@@ -68,7 +102,7 @@ class DVrouter(Router):
         self.forwarding_table[endpoint] = port
         self.logger.info(f"Them lien ket den {endpoint} qua cong {port}, chi phi {cost}")
         self.update_distance_vector()
-        self.broadcast_distance_vector()
+        self.request_update()
 
     def handle_remove_link(self, port):
         """Xóa liên kết với hàng xóm."""
@@ -78,30 +112,55 @@ class DVrouter(Router):
         neighbor, _ = self.neighbors[port]
         self.logger.info(f"Xoa lien ket den {neighbor} tai cong {port}")
         del self.neighbors[port]
+        self.last_broadcast_dv.pop(port, None)
         self.neighbor_dv.pop(neighbor, None)
         self.distance_vector.pop(neighbor, None)
         self.forwarding_table.pop(neighbor, None)
         self.update_distance_vector()
-        self.broadcast_distance_vector()
+        self.request_update()
 
     def handle_time(self, time_ms):
         """Xử lý thời gian để gửi bảng định tuyến định kỳ."""
-        if time_ms - self.last_time >= self.heartbeat_time:
-            self.last_time = time_ms
-            current_dv = {dst: dist for dst, dist in self.distance_vector.items() if dist < self.INFINITY}
-            if self.update_distance_vector() or current_dv != self.last_broadcast_dv:
-                self.broadcast_distance_vector()
+        if any(until <= time_ms for until, _ in self.hold_down.values()):
+            self.logger.info("Het thoi gian hold-down, tinh lai bang dinh tuyen")
+            self.handle_dv_change()
+        if self.heartbeat_due(time_ms):
+            # Gửi toàn bộ bảng mỗi chu kỳ để sửa các cập nhật bị mất trên đường truyền
+            self.update_distance_vector()
+            self.broadcast_distance_vector()
+
+    def handle_dv_change(self):
+        """Tính lại bảng định tuyến và gửi cập nhật kích hoạt nếu cần."""
+        old_dv = self.distance_vector
+        if not self.update_distance_vector():
+            return
+        withdrawn = any(cost < self.INFINITY and self.distance_vector.get(dest, self.INFINITY) >= self.INFINITY
+                        for dest, cost in old_dv.items())
+        if self.triggered_updates or (self.triggered_withdrawals and withdrawn):
+            self.request_update()
+
+    def send_update(self):
+        """Gửi cập nhật kích hoạt (được Router điều tiết và gộp), chỉ qua các cổng có nội dung thay đổi."""
+        self.broadcast_distance_vector(only_changed=True)
 
     def update_distance_vector(self):
         """Cập nhật bảng định tuyến và bảng chuyển tiếp, trả về True nếu có thay đổi."""
         changed = False
-        new_dv = {self.addr: 0}
-        new_ft = {}
+        # Tính trên danh sách đánh chỉ số theo ID địa chỉ để tránh băm chuỗi
+        MISSING = AddressTable.MISSING
+        neighbor_ids = {port: addresses.intern(neighbor) for port, (neighbor, _) in self.neighbors.items()}
+        size = max([self.addr_id, *neighbor_ids.values()]) + 1
+        size = max([size] + [len(routes.values_array) for routes in self.neighbor_dv.values()])
+        new_dv = [MISSING] * size
+        new_ft = [MISSING] * size
+        new_dv[self.addr_id] = 0
+        multipath = {}
 
         # Thêm hàng xóm trực tiếp
         for port, (neighbor, cost) in self.neighbors.items():
-            new_dv[neighbor] = cost
-            new_ft[neighbor] = port
+            neighbor_id = neighbor_ids[port]
+            new_dv[neighbor_id] = cost
+            new_ft[neighbor_id] = port
 
         # Cập nhật các đích khác qua hàng xóm
         for neighbor, routes in self.neighbor_dv.items():
@@ -113,33 +172,95 @@ class DVrouter(Router):
                     neighbor_port = port
                     break
             if neighbor_cost < float('inf'):
-                for dest, dest_cost in routes.items():
+                for dest_id, dest_cost in routes.id_items():
                     total_cost = neighbor_cost + dest_cost
                     if total_cost >= self.INFINITY:
                         total_cost = self.INFINITY
-                    if dest not in new_dv or total_cost < new_dv[dest]:
-                        new_dv[dest] = total_cost
-                        if total_cost < self.INFINITY and dest != self.addr:
-                            new_ft[dest] = neighbor_port
+                    current_cost = new_dv[dest_id]
+                    if current_cost == MISSING or total_cost < current_cost:
+                        new_dv[dest_id] = total_cost
+                        if total_cost < self.INFINITY and dest_id != self.addr_id:
+                            new_ft[dest_id] = neighbor_port
+                            multipath.pop(dest_id, None)
+                    elif self.ecmp and total_cost == current_cost < self.INFINITY and dest_id != self.addr_id:
+                        # Thêm bước nhảy cùng chi phí
+                        ports = multipath.setdefault(dest_id, [new_ft[dest_id]])
+                        if neighbor_port not in ports:
+                            ports.append(neighbor_port)
+        new_dv = AddressTable.from_values(new_dv)
+        new_ft = AddressTable.from_values(new_ft)
+
+        if self.hold_down_time:
+            self.apply_hold_down(new_dv, new_ft)
+        multipath = {dest_id: sorted(ports) for dest_id, ports in multipath.items()
+                     if len(ports) > 1 and new_ft.get_id(dest_id) is not None}
 
         # Kiểm tra thay đổi
-        if new_dv != self.distance_vector or new_ft != self.forwarding_table:
+        if new_dv != self.distance_vector or new_ft != self.forwarding_table or multipath != self.multipath:
             changed = True
             self.distance_vector = new_dv
             self.forwarding_table = new_ft
+            self.multipath = multipath
             self.logger.info(f"Cap nhat bang dinh tuyen: {self.distance_vector}")
             self.logger.info(f"Cap nhat bang chuyen tiep: {self.forwarding_table}")
 
         return changed
 
-    def broadcast_distance_vector(self):
-        """Gửi bảng định tuyến đến tất cả hàng xóm."""
-        dv_content = {dst: dist for dst, dist in self.distance_vector.items() if dist < self.INFINITY}
-        packet = Packet(Packet.ROUTING, self.addr, None, json.dumps(dv_content))
+    def apply_hold_down(self, new_dv, new_ft):
+        """Bắt đầu hold-down cho các đích bị tăng chi phí và chặn các tuyến tệ hơn trong lúc hold-down."""
+        now = int(round(self.clock() * 1000))
+        for dest, cost in self.distance_vector.items():
+            if dest not in self.hold_down and cost < self.INFINITY and new_dv.get(dest, self.INFINITY) > cost:
+                self.hold_down[dest] = (now + self.hold_down_time, cost)
+                self.logger.info(f"Bat dau hold-down cho {dest}, chi phi truoc do {cost}")
+        for dest, (until, cost) in list(self.hold_down.items()):
+            if until <= now:
+                del self.hold_down[dest]
+            elif new_dv.get(dest, self.INFINITY) > cost:
+                new_dv[dest] = self.INFINITY
+                new_ft.pop(dest, None)
+
+    def advertisement_for(self, port):
+        """Bảng định tuyến quảng bá qua cổng `port` (áp dụng split horizon / poison reverse)."""
+        neighbor, _ = self.neighbors[port]
+        advertisement = {}
+        for dest, dist in self.distance_vector.items():
+            learned_here = dest != neighbor and (
+                self.forwarding_table.get(dest) == port
+                or (self.multipath and port in self.multipath.get(addresses.lookup(dest), ())))
+            if learned_here and self.poison_reverse:
+                advertisement[dest] = self.INFINITY
+            elif learned_here and self.split_horizon:
+                continue
+            elif dist < self.INFINITY:
+                advertisement[dest] = dist
+        return advertisement
+
+    def broadcast_distance_vector(self, only_changed=False):
+        """Gửi bảng định tuyến đến tất cả hàng xóm (chỉ các cổng có nội dung thay đổi nếu `only_changed`)."""
         for port in self.neighbors:
+            dv_content = self.advertisement_for(port)
+            if only_changed and self.last_broadcast_dv.get(port) == dv_content:
+                continue
+            packet = Packet(Packet.ROUTING, self.addr, None, json.dumps(dv_content))
             self.send(port, packet)
+            self.last_broadcast_dv[port] = dv_content
             self.logger.info(f"Da gui bang dinh tuyen den hang xom qua cong {port}: {dv_content}")
-        self.last_broadcast_dv = dv_content
+
+    def get_state(self):
+        """Trạng thái định tuyến để lưu checkpoint."""
+        return {
+            'distance_vector': dict(self.distance_vector),
+            'forwarding_table': dict(self.forwarding_table),
+            'neighbor_dv': {neighbor: dict(dv) for neighbor, dv in self.neighbor_dv.items()},
+        }
+
+    def set_state(self, state):
+        """Khôi phục trạng thái định tuyến từ checkpoint (hàng xóm được thêm lại qua liên kết)."""
+        self.distance_vector = AddressTable(state['distance_vector'])
+        self.forwarding_table = AddressTable(state['forwarding_table'])
+        self.neighbor_dv = {neighbor: AddressTable(dv) for neighbor, dv in state['neighbor_dv'].items()}
+        self.logger.info(f"Khoi phuc trang thai tu checkpoint: {self.distance_vector}")
 
     def __repr__(self):
         """Trạng thái router."""
@@ -149,5 +270,6 @@ class DVrouter(Router):
             output += f"  {dest}: {cost}\n"
         output += "Forwarding Table:\n"
         for dest, port in self.forwarding_table.items():
-            output += f"  {dest} -> Port {port}\n"
+            ports = self.multipath.get(addresses.lookup(dest))
+            output += f"  {dest} -> Ports {ports}\n" if ports else f"  {dest} -> Port {port}\n"
         return output
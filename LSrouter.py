@@ -7,63 +7,312 @@
 import json
 import logging
 import heapq
+from address import AddressTable, addresses
+from lsp_store import lsp_store
+from spf_cache import spf_cache
 from router import Router
 from packet import Packet
 
+# Mức log chung cho mọi router LS. Đặt mức cho từng logger con sẽ xóa cache của mọi logger (O(số router))
+logging.getLogger("LS").setLevel(logging.INFO)
+
 class LSrouter(Router):
-    """Giao thức định tuyến Link-State."""
+    """Giao thức định tuyến Link-State.
+
+    Nếu router được gán một vùng (`area`, từ mục "areas" của kịch bản), LSP chỉ được
+    phát tràn trong vùng và link_state_db chỉ chứa các router cùng vùng. Router có
+    hàng xóm khác vùng là router biên: nó trao đổi trực tiếp bảng "export" (chi phí
+    và danh sách router biên đi qua đến mỗi đích) với hàng xóm khác vùng, rồi phát
+    tràn trong vùng của mình một bản tóm tắt ("summary") chi phí liên vùng. Các tuyến
+    có danh sách chứa chính router bị loại để tránh vòng lặp (kể cả khi một vùng bị
+    chia cắt và chỉ nối với nhau qua vùng khác).
+
+    Khi có liên kết mới, hai router trao đổi bản mô tả cơ sở dữ liệu ("dd": số thứ tự
+    của mọi LSP và bản tóm tắt đang lưu) và chỉ yêu cầu ("request") những bản mà
+    mình thiếu hoặc cũ hơn, nên LSDB đồng bộ sau một vòng khứ hồi thay vì chờ các
+    router khác gửi lại LSP định kỳ.
+
+    Với tùy chọn `ecmp` (qua "router_options"), router giữ mọi bước nhảy kế tiếp trên
+    các đường ngắn nhất cùng chi phí trong vùng và chọn cổng theo băm (nguồn, đích,
+    luồng) của gói tin. Các tùy chọn min_update_interval, heartbeat_jitter và
+    max_heartbeat_backoff điều tiết việc gửi LSP của router (xem lớp Router); LSP
+    của router khác vẫn được phát tràn ngay. Với hello_interval và dead_multiplier,
+    liên kết hỏng âm thầm được phát hiện bằng gói hello và xử lý như liên kết bị gỡ.
+
+    Với tùy chọn `lsp_max_age` (ms), LSP có tuổi thọ: router tự làm mới LSP của mình
+    (tăng số thứ tự) sau mỗi một phần ba `lsp_max_age`, và LSP của router khác không
+    được làm mới trong `lsp_max_age` bị xóa khỏi link_state_db và đồ thị SPF. Router
+    xóa LSP phát tràn một gói "purge" để các router khác xóa theo, và giữ số thứ tự
+    đã xóa thêm `lsp_max_age` để không nhận lại bản cũ còn trên đường truyền. LSP làm
+    mới mà liên kết không đổi không làm tính lại bảng chuyển tiếp.
 
-    def __init__(self, addr, heartbeat_time):
-        super().__init__(addr)
+    Với tùy chọn `shared_spf`, các LSrouter trong cùng tiến trình dùng chung kết quả
+    SPF: khi hai router có cùng phiên bản LSDB (cùng các LSP),
+    đường ngắn nhất từ mọi nguồn được tính một lần cho phiên bản đó (xem spf_cache.py)
+    và mỗi router chỉ đọc kết quả của mình thay vì chạy Dijkstra riêng.
+
+    Các LSP được giải mã một lần và dùng chung giữa mọi LSrouter trong tiến trình
+    (xem lsp_store.py): link_state_db lưu tham chiếu đến các bản ghi chỉ đọc thay
+    vì bản sao riêng của từng router.
+    """
+
+    supports_areas = True  # Network truyền tham số `area` cho lớp này
+
+    def __init__(self, addr, heartbeat_time, area=None, ecmp=False, lsp_max_age=None, shared_spf=False, **pacing):
+        super().__init__(addr, heartbeat_time, **pacing)
         self.heartbeat_time = heartbeat_time  # Thời gian gửi LSP định kỳ (ms)
-        self.last_time = 0  # Thời điểm xử lý cuối
-        self.link_state_db = {addr: (0, {})}  # {router: (số thứ tự, {hàng xóm: chi phí})}
+        self.link_state_db = {addr: (0, {})}  # {router: (số thứ tự, LSPRecord {hàng xóm: chi phí})}
         self.sequence_number = 0  # Số thứ tự LSP
-        self.forwarding_table = {}  # {đích: cổng}
+        self.forwarding_table = AddressTable()  # {đích: cổng}, lưu theo ID địa chỉ
         self.neighbors = {}  # {cổng: (địa chỉ, chi phí)}
+        self.area = area  # Vùng của router (None: không chia vùng)
+        self.neighbor_areas = {}  # {hàng xóm: vùng}, học từ LSP của hàng xóm
+        self.summary_db = {}  # {router biên cùng vùng: (số thứ tự, {đích: [chi phí, danh sách router biên]})}
+        self.summary_sequence = 0  # Số thứ tự bản tóm tắt của router này
+        self.external_routes = {}  # Export nhận từ hàng xóm khác vùng: {hàng xóm: {đích: [chi phí, danh sách router biên]}}
+        self.route_info = {}  # Tuyến tốt nhất: {đích: (chi phí, danh sách router biên)}
+        self.last_export = {}  # Export đã gửi qua từng cổng: {cổng: {đích: [chi phí, danh sách router biên]}}
+        self.ecmp = ecmp
+        self.multipath = {}  # Các cổng cùng chi phí (khi bật ECMP): {ID đích: [cổng]}
+        self.lsp_max_age = lsp_max_age  # Tuổi tối đa của LSP (ms), None: không hết hạn
+        self.lsp_clock = None  # Thời điểm của lần gọi handle_time gần nhất (ms)
+        self.lsp_installed = {}  # {router: thời điểm nhận LSP mới nhất (ms), None: chưa đóng dấu}
+        self.lsp_refreshed = None  # Thời điểm tạo LSP gần nhất của router này (ms)
+        self.next_age_check = 0
+        self.purged = {}  # LSP đã xóa: {router: (số thứ tự, thời điểm xóa)}
+        self.shared_spf = shared_spf  # Dùng chung kết quả SPF của spf_cache
+        if shared_spf:
+            spf_cache.require_numpy()
 
-        # Thiết lập logging
-        self.logger = logging.getLogger(f"LS_{addr}")
-        self.logger.setLevel(logging.INFO)
-        file_handler = logging.FileHandler(f"router_{addr}.log", mode='w')
-        formatter = logging.Formatter('[%(asctime)s] [LS_%(name)s] %(message)s')
-        file_handler.setFormatter(formatter)
-        self.logger.handlers = []
-        self.logger.addHandler(file_handler)
-        self.logger.info(f"Khoi dong router {addr} voi thoi gian phat {heartbeat_time} ms")
+        # Thiết lập logging: logger con của "LS" (mức INFO đặt một lần cho cả lớp), tệp log chỉ được mở khi ghi dòng đầu tiên.
+        # Bỏ qua khi đã được truyền một logger (ví dụ logger im lặng của Network khi tắt log)
+        if self.logger is None:
+            self.logger = logging.getLogger(f"LS.{addr}")
+            file_handler = logging.FileHandler(f"router_{addr}.log", mode='w', delay=True)
+            formatter = logging.Formatter('[%(asctime)s] [%(name)s] %(message)s')
+            file_handler.setFormatter(formatter)
+            self.logger.handlers = []
+            self.logger.addHandler(file_handler)
+
+    def setup(self):
+        """Ghi log khởi động trong luồng của router, ngay trước tick đầu tiên."""
+        self.logger.info(f"Khoi dong router {self.addr} voi thoi gian phat {self.heartbeat_time} ms")
 
     def handle_packet(self, port, packet):
         """Xử lý gói tin đến từ cổng."""
         self.logger.info(f"Nhan goi tu cong {port}, nguon {packet.src_addr}, dich {packet.dst_addr}, traceroute: {packet.is_traceroute}")
-        if packet.is_traceroute:
-            if packet.dst_addr in self.forwarding_table:
-                out_port = self.forwarding_table[packet.dst_addr]
+        if packet.is_traceroute or packet.is_data:
+            out_port = self.forwarding_table.get_id(packet.dst_id)
+            if out_port is not None:
+                if packet.dst_id in self.multipath:
+                    out_port = self.select_port(self.multipath[packet.dst_id], packet)
                 self.logger.info(f"Chuyen goi traceroute den {packet.dst_addr} qua cong {out_port}")
                 self.send(out_port, packet)
             else:
                 self.logger.info(f"Khong co duong den dich {packet.dst_addr}")
             return
 
+        # LSP đã được router khác giải mã: dùng lại bản ghi chung
+        record = lsp_store.get(packet.content)
+        if record is not None:
+            self.handle_lsp(port, packet, record)
+            return
+
         try:
             ls_info = json.loads(packet.content)
-            src_addr = ls_info['src_addr']
-            sequence_number = ls_info['sequence_number']
-            link_state = ls_info['link_state']
-            self.logger.info(f"Nhan LSP tu {src_addr}, so thu tu {sequence_number}, lien ket: {link_state}")
-            is_new_or_updated = False
-            if src_addr not in self.link_state_db or sequence_number > self.link_state_db[src_addr][0]:
-                is_new_or_updated = True
-                self.link_state_db[src_addr] = (sequence_number, link_state)
-                self.logger.info(f"Cap nhat link_state_db cho {src_addr}, so thu tu {sequence_number}")
-                self.update_forwarding_table()
-                for neighbor_port in self.neighbors:
-                    if neighbor_port != port:
-                        self.logger.info(f"Phat LSP tu {src_addr} den hang xom qua cong {neighbor_port}")
-                        self.send(neighbor_port, packet)
-            else:
-                self.logger.info(f"Bo LSP cu tu {src_addr}, so thu tu {sequence_number}")
         except json.JSONDecodeError:
             self.logger.info(f"Goi tu cong {port} khong dung dinh dang")
+            return
+        kind = ls_info.get('type', 'lsp')
+        if kind == 'export':
+            self.handle_export(port, ls_info)
+        elif kind == 'dd':
+            self.handle_database_description(port, ls_info)
+        elif kind == 'request':
+            self.handle_request(port, ls_info)
+        elif kind == 'summary':
+            self.handle_summary(port, packet, ls_info)
+        else:
+            self.handle_lsp(port, packet, lsp_store.add(packet.content, ls_info))
+
+    def handle_lsp(self, port, packet, record):
+        """Xử lý LSP (bản ghi LSPRecord dùng chung): lưu nếu mới hơn và phát tràn tiếp trong vùng."""
+        src_addr = record.src_addr
+        sequence_number = record.sequence_number
+        self.logger.info(f"Nhan LSP tu {src_addr}, so thu tu {sequence_number}, lien ket: {record}")
+        if self.area is not None:
+            self.learn_neighbor_area(port, src_addr, record.area)
+            if record.area != self.area:
+                self.logger.info(f"Bo LSP tu {src_addr} vi thuoc vung {record.area}")
+                return
+        if record.purge:
+            self.handle_purge(port, packet, record)
+            return
+        if sequence_number <= self.purged.get(src_addr, (-1, None))[0]:
+            self.logger.info(f"Bo LSP da xoa tu {src_addr}, so thu tu {sequence_number}")
+            return
+        if src_addr not in self.link_state_db or sequence_number > self.link_state_db[src_addr][0]:
+            old = self.link_state_db.get(src_addr)
+            self.link_state_db[src_addr] = (sequence_number, record)
+            self.lsp_installed[src_addr] = self.lsp_clock
+            self.purged.pop(src_addr, None)
+            self.logger.info(f"Cap nhat link_state_db cho {src_addr}, so thu tu {sequence_number}")
+            # LSP làm mới (cùng liên kết) chỉ cập nhật tuổi, không cần tính lại đường đi
+            if old is None or old[1] != record:
+                self.update_forwarding_table()
+            self.flood(packet, port)
+        else:
+            self.logger.info(f"Bo LSP cu tu {src_addr}, so thu tu {sequence_number}")
+
+    def handle_purge(self, port, packet, record):
+        """Xử lý gói purge: xóa LSP của router nguồn (nếu không mới hơn) và phát tràn tiếp."""
+        src_addr = record.src_addr
+        sequence_number = record.sequence_number
+        if src_addr == self.addr:
+            # Router khác cho rằng LSP của mình đã hết hạn: phát lại với số thứ tự lớn hơn
+            if sequence_number >= self.sequence_number:
+                self.sequence_number = sequence_number
+                self.update_own_link_state()
+                self.broadcast_link_state()
+            return
+        if sequence_number <= self.purged.get(src_addr, (-1, None))[0]:
+            return
+        if sequence_number < self.link_state_db.get(src_addr, (-1, None))[0]:
+            self.logger.info(f"Bo purge cu cua {src_addr}, so thu tu {sequence_number}")
+            return
+        self.logger.info(f"Nhan purge LSP cua {src_addr}, so thu tu {sequence_number}")
+        self.remove_lsp(src_addr, sequence_number)
+        self.flood(packet, port)
+
+    def remove_lsp(self, router, sequence_number):
+        """Xóa LSP của `router` khỏi link_state_db và ghi nhớ số thứ tự đã xóa."""
+        self.purged[router] = (sequence_number, self.lsp_clock)
+        self.lsp_installed.pop(router, None)
+        if self.link_state_db.pop(router, None) is not None:
+            self.update_forwarding_table()
+
+    def age_link_state_db(self, time_ms):
+        """Làm mới LSP của router này, xóa và phát tràn purge cho các LSP hết hạn."""
+        if self.lsp_refreshed is None:
+            self.lsp_refreshed = time_ms  # LSP tạo trước handle_time đầu tiên
+        if time_ms - self.lsp_refreshed >= self.lsp_max_age / 3:
+            self.logger.info(f"Lam moi LSP tai {time_ms} ms")
+            self.update_own_link_state()
+            self.broadcast_link_state()
+        if time_ms < self.next_age_check:
+            return
+        self.next_age_check = time_ms + self.lsp_max_age / 10
+        for router in list(self.link_state_db):
+            if router == self.addr:
+                continue
+            installed = self.lsp_installed.get(router)
+            if installed is None:
+                self.lsp_installed[router] = time_ms  # Nhận trước handle_time đầu tiên hoặc từ checkpoint
+            elif time_ms - installed > self.lsp_max_age:
+                sequence_number = self.link_state_db[router][0]
+                self.logger.info(f"LSP cua {router} het han, so thu tu {sequence_number}")
+                self.remove_lsp(router, sequence_number)
+                purge = self.make_lsp(router, sequence_number, {}, purge=True)
+                self.flood(Packet(Packet.ROUTING, router, None, purge.content), None)
+        for router, (sequence_number, purged_ms) in list(self.purged.items()):
+            if purged_ms is None:
+                self.purged[router] = (sequence_number, time_ms)
+            elif time_ms - purged_ms > self.lsp_max_age:
+                del self.purged[router]
+
+    def handle_summary(self, port, packet, ls_info):
+        """Xử lý bản tóm tắt liên vùng của một router biên cùng vùng."""
+        src_addr = ls_info['src_addr']
+        sequence_number = ls_info['sequence_number']
+        if ls_info.get('area') != self.area or src_addr == self.addr:
+            return
+        if src_addr not in self.summary_db or sequence_number > self.summary_db[src_addr][0]:
+            self.summary_db[src_addr] = (sequence_number, ls_info['routes'])
+            self.logger.info(f"Cap nhat tom tat lien vung cua {src_addr}, so thu tu {sequence_number}")
+            self.update_forwarding_table()
+            self.flood(packet, port)
+
+    def handle_export(self, port, ls_info):
+        """Xử lý bảng export nhận trực tiếp từ hàng xóm khác vùng."""
+        src_addr = ls_info['src_addr']
+        if port not in self.neighbors or self.neighbors[port][0] != src_addr:
+            return
+        self.learn_neighbor_area(port, src_addr, ls_info.get('area'))
+        if self.external_routes.get(src_addr) != ls_info['routes']:
+            self.external_routes[src_addr] = ls_info['routes']
+            self.logger.info(f"Nhan export tu {src_addr} (vung {ls_info.get('area')})")
+            self.update_forwarding_table()
+
+    def send_database_description(self, port):
+        """Gửi bản mô tả LSDB (số thứ tự của mọi LSP và bản tóm tắt) cho hàng xóm qua cổng `port`."""
+        content = {
+            'type': 'dd',
+            'src_addr': self.addr,
+            'area': self.area,
+            'lsps': {router: seq for router, (seq, _) in self.link_state_db.items()},
+            'summaries': {border: seq for border, (seq, _) in self.summary_db.items()}
+        }
+        self.logger.info(f"Gui mo ta LSDB qua cong {port}, {len(content['lsps'])} LSP")
+        self.send(port, Packet(Packet.ROUTING, self.addr, None, json.dumps(content)))
+
+    def handle_database_description(self, port, ls_info):
+        """So sánh bản mô tả LSDB của hàng xóm với LSDB của mình và yêu cầu các bản thiếu hoặc cũ hơn."""
+        src_addr = ls_info['src_addr']
+        if port not in self.neighbors or self.neighbors[port][0] != src_addr:
+            return
+        if self.area is not None:
+            self.learn_neighbor_area(port, src_addr, ls_info.get('area'))
+            if ls_info.get('area') != self.area:
+                return
+        lsps = [router for router, seq in ls_info['lsps'].items()
+                if router != self.addr and seq > self.link_state_db.get(router, (-1, None))[0]
+                and seq > self.purged.get(router, (-1, None))[0]]
+        summaries = [border for border, seq in ls_info['summaries'].items()
+                     if border != self.addr and seq > self.summary_db.get(border, (-1, None))[0]]
+        if not lsps and not summaries:
+            self.logger.info(f"LSDB da dong bo voi {src_addr}")
+            return
+        content = {'type': 'request', 'src_addr': self.addr, 'area': self.area, 'lsps': lsps, 'summaries': summaries}
+        self.logger.info(f"Yeu cau {len(lsps)} LSP va {len(summaries)} tom tat tu {src_addr}")
+        self.send(port, Packet(Packet.ROUTING, self.addr, None, json.dumps(content)))
+
+    def handle_request(self, port, ls_info):
+        """Gửi cho hàng xóm các LSP và bản tóm tắt mà nó yêu cầu."""
+        if port not in self.neighbors or ls_info.get('area') != self.area:
+            return
+        for router in ls_info['lsps']:
+            if router in self.link_state_db:
+                self.send(port, self.link_state_packet(router))
+        for border in ls_info['summaries']:
+            if border in self.summary_db:
+                self.send(port, self.summary_packet(border))
+        self.logger.info(f"Gui {len(ls_info['lsps'])} LSP va {len(ls_info['summaries'])} tom tat theo yeu cau qua cong {port}")
+
+    def learn_neighbor_area(self, port, src_addr, area):
+        """Ghi nhận vùng của hàng xóm trực tiếp; cập nhật LSP nếu phát hiện hàng xóm khác vùng."""
+        if port not in self.neighbors or self.neighbors[port][0] != src_addr:
+            return
+        if self.neighbor_areas.get(src_addr) == area:
+            return
+        self.neighbor_areas[src_addr] = area
+        self.logger.info(f"Hang xom {src_addr} thuoc vung {area}")
+        if area != self.area:
+            self.update_own_link_state()
+            self.update_forwarding_table()
+            self.request_update()
+
+    def flood_ports(self):
+        """Các cổng dùng để phát tràn LSP: mọi hàng xóm, hoặc chỉ hàng xóm cùng vùng."""
+        if self.area is None:
+            return list(self.neighbors)
+        return [port for port, (neighbor, _) in self.neighbors.items() if self.neighbor_areas.get(neighbor) == self.area]
+
+    def flood(self, packet, in_port):
+        """Phát tràn gói định tuyến đến các hàng xóm (trừ cổng nhận)."""
+        for neighbor_port in self.flood_ports():
+            if neighbor_port != in_port:
+                self.logger.info(f"Phat goi dinh tuyen tu {packet.src_addr} den hang xom qua cong {neighbor_port}")
+                self.send(neighbor_port, packet)
 
     def handle_new_link(self, port, endpoint, cost):
         """Thêm liên kết mới đến hàng xóm."""
@@ -71,7 +320,8 @@ class LSrouter(Router):
         self.logger.info(f"Them lien ket den {endpoint} qua cong {port}, chi phi {cost}")
         self.update_own_link_state()
         self.update_forwarding_table()
-        self.broadcast_link_state()
+        self.request_update()
+        self.send_database_description(port)
 
     def handle_remove_link(self, port):
         """Xóa liên kết với hàng xóm."""
@@ -81,26 +331,37 @@ class LSrouter(Router):
         neighbor, _ = self.neighbors[port]
         self.logger.info(f"Xoa lien ket den {neighbor} tai cong {port}")
         del self.neighbors[port]
+        self.external_routes.pop(neighbor, None)
+        self.neighbor_areas.pop(neighbor, None)
+        self.last_export.pop(port, None)
         self.update_own_link_state()
         self.update_forwarding_table()
-        self.broadcast_link_state()
+        self.request_update()
 
     def handle_time(self, time_ms):
-        """Xử lý thời gian để gửi LSP định kỳ."""
-        if time_ms - self.last_time >= self.heartbeat_time:
-            self.last_time = time_ms
+        """Xử lý thời gian để gửi LSP định kỳ (và làm mới, xóa LSP hết hạn nếu có `lsp_max_age`)."""
+        self.lsp_clock = time_ms
+        if self.lsp_max_age:
+            self.age_link_state_db(time_ms)
+        if self.heartbeat_due(time_ms):
             self.logger.info(f"Phat LSP dinh ky tai {time_ms} ms")
             self.broadcast_link_state()
+            if self.area is not None:
+                if self.summary_db.get(self.addr, (0, {}))[1]:
+                    self.broadcast_summary()
+                self.send_exports(force=True)
 
     def update_own_link_state(self):
         """Cập nhật trạng thái liên kết của router."""
-        new_link_state = {neighbor: cost for _, (neighbor, cost) in self.neighbors.items()}
+        new_link_state = {neighbor: cost for _, (neighbor, cost) in self.neighbors.items()
+                          if self.neighbor_areas.get(neighbor, self.area) == self.area}
         self.sequence_number += 1
-        self.link_state_db[self.addr] = (self.sequence_number, new_link_state)
+        self.link_state_db[self.addr] = (self.sequence_number, self.make_lsp(self.addr, self.sequence_number, new_link_state))
+        self.lsp_refreshed = self.lsp_clock
         self.logger.info(f"Cap nhat link_state_db cua {self.addr}, so thu tu {self.sequence_number}")
 
     def update_forwarding_table(self):
-        """Tính bảng chuyển tiếp bằng Dijkstra."""
+        """Tính bảng chuyển tiếp bằng Dijkstra (cộng thêm các tuyến liên vùng nếu chia vùng)."""
         self.logger.info(f"Tinh bang chuyen tiep voi link_state_db: {self.link_state_db}")
         graph = {}
         for router, (_, link_state) in self.link_state_db.items():
@@ -108,21 +369,136 @@ class LSrouter(Router):
             for neighbor in link_state:
                 if neighbor not in graph:
                     graph[neighbor] = {}
-        distances, predecessors = self.dijkstra(graph, self.addr)
-        new_forwarding_table = {}
+        distances, predecessors = self.shortest_paths(graph)
+        # Tuyến tốt nhất: {đích: (chi phí, danh sách router biên, bước nhảy kế tiếp)}
+        best = {}
         for dest in distances:
             if dest == self.addr or distances[dest] == float('inf'):
                 continue
-            next_hop = dest
-            while predecessors.get(next_hop) and predecessors[next_hop] != self.addr:
-                next_hop = predecessors[next_hop]
-            for port, (neighbor, _) in self.neighbors.items():
-                if neighbor == next_hop:
-                    new_forwarding_table[dest] = port
-                    self.logger.info(f"Them duong den {dest} qua cong {port}, buoc nhay {next_hop}, chi phi {distances[dest]}")
-                    break
+            best[dest] = (distances[dest], [], self.first_hop(dest, predecessors))
+        if self.area is not None:
+            self.add_inter_area_routes(best, distances, predecessors)
+        port_of = {neighbor: port for port, (neighbor, _) in self.neighbors.items()}
+        new_forwarding_table = AddressTable()
+        for dest, (cost, _, next_hop) in best.items():
+            if next_hop in port_of:
+                new_forwarding_table[dest] = port_of[next_hop]
+                self.logger.info(f"Them duong den {dest} qua cong {port_of[next_hop]}, buoc nhay {next_hop}, chi phi {cost}")
         self.forwarding_table = new_forwarding_table
+        self.multipath = self.equal_cost_ports(graph, distances, best, port_of) if self.ecmp else {}
+        self.route_info = {dest: (cost, path) for dest, (cost, path, _) in best.items()}
         self.logger.info(f"Bang chuyen tiep moi: {self.forwarding_table}")
+        if self.area is not None:
+            self.originate_summary()
+            self.send_exports()
+
+    def equal_cost_ports(self, graph, distances, best, port_of):
+        """Các cổng của mọi đường ngắn nhất cùng chi phí đến các đích trong vùng: {ID đích: [cổng]}."""
+        first_hops = {}  # {nút: tập bước nhảy đầu tiên trên các đường ngắn nhất}
+        reachable = [node for node, dist in distances.items() if dist < float('inf')]
+        for node in sorted(reachable, key=distances.get):
+            for neighbor, weight in graph.get(node, {}).items():
+                if distances[node] + weight == distances.get(neighbor):
+                    hops = {neighbor} if node == self.addr else first_hops.get(node, set())
+                    first_hops.setdefault(neighbor, set()).update(hops)
+        multipath = {}
+        for dest, (cost, path, _) in best.items():
+            if path or cost != distances.get(dest):
+                continue  # Tuyến liên vùng giữ một bước nhảy
+            ports = sorted({port_of[hop] for hop in first_hops.get(dest, ()) if hop in port_of})
+            if len(ports) > 1:
+                multipath[addresses.intern(dest)] = ports
+        return multipath
+
+    def first_hop(self, dest, predecessors):
+        """Bước nhảy đầu tiên trên đường ngắn nhất đến `dest`."""
+        next_hop = dest
+        while predecessors.get(next_hop) and predecessors[next_hop] != self.addr:
+            next_hop = predecessors[next_hop]
+        return next_hop
+
+    def add_inter_area_routes(self, best, distances, predecessors):
+        """Thêm các tuyến liên vùng: qua router biên cùng vùng hoặc qua hàng xóm khác vùng."""
+        for border, (_, routes) in self.summary_db.items():
+            if border == self.addr or distances.get(border, float('inf')) == float('inf'):
+                continue
+            next_hop = self.first_hop(border, predecessors)
+            for dest, (cost, path) in routes.items():
+                total = distances[border] + cost
+                if dest != self.addr and self.addr not in path and (dest not in best or total < best[dest][0]):
+                    best[dest] = (total, path, next_hop)
+        for dest, (total, path, next_hop) in self.external_candidates().items():
+            if dest != self.addr and (dest not in best or total < best[dest][0]):
+                best[dest] = (total, path, next_hop)
+
+    def external_candidates(self):
+        """Tuyến tốt nhất qua các hàng xóm khác vùng: {đích: (chi phí, danh sách router biên, hàng xóm)}."""
+        candidates = {}
+        for _, (neighbor, cost) in self.neighbors.items():
+            for dest, (ext_cost, path) in self.external_routes.get(neighbor, {}).items():
+                if self.addr in path:
+                    continue
+                total = cost + ext_cost
+                if dest not in candidates or total < candidates[dest][0]:
+                    candidates[dest] = (total, path, neighbor)
+        return candidates
+
+    def originate_summary(self):
+        """Tạo bản tóm tắt liên vùng mới (nếu là router biên và nội dung thay đổi) và phát tràn trong vùng."""
+        routes = {dest: [total, path] for dest, (total, path, _) in self.external_candidates().items()
+                  if dest != self.addr}
+        if routes == self.summary_db.get(self.addr, (0, {}))[1]:
+            return
+        self.summary_sequence += 1
+        self.summary_db[self.addr] = (self.summary_sequence, routes)
+        self.logger.info(f"Tao tom tat lien vung, so thu tu {self.summary_sequence}, {len(routes)} dich")
+        self.broadcast_summary()
+
+    def summary_packet(self, border):
+        """Gói tin chứa bản tóm tắt liên vùng đang lưu của router biên `border`."""
+        sequence_number, routes = self.summary_db[border]
+        content = {
+            'type': 'summary',
+            'src_addr': border,
+            'area': self.area,
+            'sequence_number': sequence_number,
+            'routes': routes
+        }
+        return Packet(Packet.ROUTING, border, None, json.dumps(content))
+
+    def broadcast_summary(self):
+        """Gửi bản tóm tắt liên vùng của router này đến các hàng xóm cùng vùng."""
+        packet = self.summary_packet(self.addr)
+        for port in self.flood_ports():
+            self.send(port, packet)
+
+    def send_exports(self, force=False):
+        """Gửi bảng export (các đích tới được, kèm danh sách router biên) đến hàng xóm khác vùng."""
+        for port, (neighbor, _) in self.neighbors.items():
+            neighbor_area = self.neighbor_areas.get(neighbor)
+            if neighbor_area is None or neighbor_area == self.area:
+                continue
+            routes = {self.addr: [0, [self.addr]]}
+            for dest, (cost, path) in self.route_info.items():
+                if neighbor not in path and dest != neighbor:
+                    routes[dest] = [cost, [self.addr] + list(path)]
+            if not force and self.last_export.get(port) == routes:
+                continue
+            content = {'type': 'export', 'src_addr': self.addr, 'area': self.area, 'routes': routes}
+            self.send(port, Packet(Packet.ROUTING, self.addr, None, json.dumps(content)))
+            self.last_export[port] = routes
+
+    def shortest_paths(self, graph):
+        """Đường ngắn nhất từ router này: lấy từ spf_cache nếu bật shared_spf, nếu không thì chạy Dijkstra."""
+        if self.shared_spf:
+            # Nội dung LSP đã mã hóa (không chỉ số thứ tự) để hai mạng khác nhau trong cùng tiến trình không trùng phiên bản
+            version = tuple(sorted((router, getattr(record, 'content', None) or repr(sorted(record.items())))
+                                   for router, (_, record) in self.link_state_db.items()))
+            paths = spf_cache.shortest_paths(version, graph, self.addr)
+            if paths is not None:
+                self.logger.info(f"Dung chung SPF cho phien ban LSDB co {len(version)} LSP")
+                return paths
+        return self.dijkstra(graph, self.addr)
 
     def dijkstra(self, graph, source):
         """Tìm đường ngắn nhất bằng thuật toán Dijkstra."""
@@ -145,28 +521,65 @@ class LSrouter(Router):
                     self.logger.info(f"Cap nhat chi phi den {neighbor}: {distance} qua {current_node}")
         return distances, predecessors
 
-    def broadcast_link_state(self):
-        """Gửi LSP đến tất cả hàng xóm."""
-        _, link_state = self.link_state_db[self.addr]
+    def make_lsp(self, router, sequence_number, link_state, purge=False):
+        """Tạo (hoặc lấy từ kho chung) bản ghi LSP (hoặc purge) của `router` trong vùng của router này."""
         ls_content = {
-            'src_addr': self.addr,
-            'sequence_number': self.sequence_number,
-            'link_state': link_state
+            'src_addr': router,
+            'sequence_number': sequence_number,
+            'link_state': link_state,
+            'area': self.area
         }
-        content_str = json.dumps(ls_content)
-        packet = Packet(Packet.ROUTING, self.addr, None, content_str)
+        if purge:
+            ls_content['purge'] = True
+        return lsp_store.encode(ls_content)
+
+    def link_state_packet(self, router):
+        """Gói tin LSP chứa trạng thái liên kết đang lưu của `router`."""
+        sequence_number, record = self.link_state_db[router]
+        if not hasattr(record, 'content'):
+            record = self.make_lsp(router, sequence_number, record)
+        return Packet(Packet.ROUTING, router, None, record.content)
+
+    def send_update(self):
+        """Gửi LSP mới của router (được Router điều tiết và gộp)."""
+        self.broadcast_link_state()
+
+    def broadcast_link_state(self):
+        """Gửi LSP đến tất cả hàng xóm."""
+        packet = self.link_state_packet(self.addr)
         for port, (neighbor, _) in self.neighbors.items():
             self.logger.info(f"Gui LSP den {neighbor} qua cong {port}, so thu tu {self.sequence_number}")
             self.send(port, packet)
 
+    def get_state(self):
+        """Trạng thái định tuyến để lưu checkpoint."""
+        return {
+            'link_state_db': {router: (seq, dict(link_state)) for router, (seq, link_state) in self.link_state_db.items()},
+            'sequence_number': self.sequence_number,
+            'forwarding_table': dict(self.forwarding_table),
+            'summary_db': dict(self.summary_db),
+            'summary_sequence': self.summary_sequence,
+        }
+
+    def set_state(self, state):
+        """Khôi phục trạng thái định tuyến từ checkpoint (hàng xóm được thêm lại qua liên kết)."""
+        self.link_state_db = {router: (seq, self.make_lsp(router, seq, link_state))
+                              for router, (seq, link_state) in state['link_state_db'].items()}
+        self.sequence_number = state['sequence_number']
+        self.forwarding_table = AddressTable(state['forwarding_table'])
+        self.summary_db = dict(state['summary_db'])
+        self.summary_sequence = state['summary_sequence']
+        self.logger.info(f"Khoi phuc trang thai tu checkpoint, so thu tu {self.sequence_number}")
+
     def __repr__(self):
         """Trạng thái router."""
-        output = f"LSrouter(addr={self.addr}, seq={self.sequence_number})\n"
+        output = f"LSrouter(addr={self.addr}, seq={self.sequence_number}, area={self.area})\n"
         output += "Link State:\n"
         _, link_state = self.link_state_db.get(self.addr, (0, {}))
         for neighbor, cost in link_state.items():
             output += f"  {neighbor}: {cost}\n"
         output += "Forwarding Table:\n"
         for dest, port in self.forwarding_table.items():
-            output += f"  {dest} -> Port {port}\n"
+            ports = self.multipath.get(addresses.lookup(dest))
+            output += f"  {dest} -> Ports {ports}\n" if ports else f"  {dest} -> Port {port}\n"
         return output
@@ -0,0 +1,231 @@
+####################################################
+# PVrouter.py
+# Name:
+# HUID:
+#####################################################
+
+import json
+import logging
+from address import AddressTable
+from router import Router
+from packet import Packet
+
+# Mức log chung cho mọi router PV. Đặt mức cho từng logger con sẽ xóa cache của mọi logger (O(số router))
+logging.getLogger("PV").setLevel(logging.INFO)
+
+class PVrouter(Router):
+    """Giao thức định tuyến Path Vector (kiểu BGP, mỗi router là một AS).
+
+    Mỗi tuyến quảng bá gồm chi phí và đường đi đầy đủ (danh sách router từ router
+    quảng bá đến đích). Router bỏ các tuyến có đường đi chứa chính nó, nên không có
+    vòng lặp và không có count-to-infinity: khi mất tuyến, router rút tuyến
+    (withdrawal) thay vì tăng dần khoảng cách. Tuyến tốt nhất đến một đích là tuyến
+    có chi phí nhỏ nhất, rồi ít bước nhảy nhất.
+
+    Cập nhật là gia tăng: router chỉ gửi các tuyến đã thay đổi so với lần quảng bá
+    trước qua từng cổng (adj_rib_out), kèm danh sách đích bị rút, và chỉ tính lại các
+    đích bị ảnh hưởng. Tuyến học từ một hàng xóm (hoặc đi qua hàng xóm đó) không được
+    quảng bá lại cho nó. Hàng xóm mới nhận toàn bộ bảng. Mỗi heartbeat_time, router
+    gửi lại toàn bộ bảng qua mọi cổng (đánh dấu 'full'): hàng xóm bỏ các tuyến của
+    router này không có trong bảng, nên cập nhật hay withdrawal bị mất trên đường
+    truyền được sửa ở lần làm mới sau. Các tùy chọn
+    min_update_interval, heartbeat_jitter, max_heartbeat_backoff, hello_interval và
+    dead_multiplier được xử lý bởi lớp Router.
+    """
+
+    def __init__(self, addr, heartbeat_time, **pacing):
+        super().__init__(addr, heartbeat_time, **pacing)
+        self.heartbeat_time = heartbeat_time  # Thời gian kiểm tra quảng bá định kỳ (ms)
+        self.neighbors = {}  # Hàng xóm: {cổng: (địa chỉ, chi phí)}
+        self.adj_rib_in = {}  # Tuyến nhận từ hàng xóm: {hàng xóm: {đích: (chi phí, đường đi)}}
+        self.loc_rib = {addr: (0, (addr,), None)}  # Tuyến tốt nhất: {đích: (chi phí, đường đi, cổng)}
+        self.adj_rib_out = {}  # Tuyến đã quảng bá qua từng cổng: {cổng: {đích: (chi phí, đường đi)}}
+        self.forwarding_table = AddressTable()  # Bảng chuyển tiếp: {đích: cổng}, lưu theo ID địa chỉ
+        self.pending = set()  # Các đích thay đổi từ lần gửi cập nhật trước
+
+        # Thiết lập logging: logger con của "PV" (mức INFO đặt một lần cho cả lớp), tệp log chỉ được mở khi ghi dòng đầu tiên.
+        # Bỏ qua khi đã được truyền một logger (ví dụ logger im lặng của Network khi tắt log)
+        if self.logger is None:
+            self.logger = logging.getLogger(f"PV.{addr}")
+            file_handler = logging.FileHandler(f"router_{addr}.log", mode='w', delay=True)
+            formatter = logging.Formatter('[%(asctime)s] [%(name)s] %(message)s')
+            file_handler.setFormatter(formatter)
+            self.logger.handlers = []
+            self.logger.addHandler(file_handler)
+
+    def setup(self):
+        """Ghi log khởi động trong luồng của router, ngay trước tick đầu tiên."""
+        self.logger.info(f"Khoi dong router {self.addr} voi thoi gian phat {self.heartbeat_time} ms")
+
+    def handle_packet(self, port, packet):
+        """Xử lý gói tin đến từ cổng."""
+        self.logger.info(f"Nhan goi tu cong {port}, nguon {packet.src_addr}, dich {packet.dst_addr}")
+        if packet.is_traceroute or packet.is_data:
+            out_port = self.forwarding_table.get_id(packet.dst_id)
+            if out_port is not None:
+                self.logger.info(f"Chuyen goi traceroute den {packet.dst_addr} qua cong {out_port}")
+                self.send(out_port, packet)
+            else:
+                self.logger.info(f"Khong co duong den dich {packet.dst_addr}")
+            return
+
+        neighbor = self.neighbors.get(port, (None, None))[0]
+        if packet.src_addr != neighbor:
+            self.logger.info(f"Bo cap nhat tu {packet.src_addr} vi khong phai hang xom qua cong {port}")
+            return
+        try:
+            update = json.loads(packet.content)
+        except json.JSONDecodeError:
+            self.logger.info(f"Goi tu cong {port} khong dung dinh dang")
+            return
+        rib = self.adj_rib_in.setdefault(neighbor, {})
+        changed = set(update.get('withdrawn', []))
+        if update.get('full'):
+            # Làm mới toàn bộ: các tuyến không còn trong bảng coi như bị rút
+            changed.update(dest for dest in rib if dest not in update.get('routes', {}))
+        for dest in changed:
+            rib.pop(dest, None)
+        for dest, (cost, path) in update.get('routes', {}).items():
+            if self.addr in path:
+                # Đường đi chứa router này: bỏ để tránh vòng lặp (coi như rút tuyến)
+                rib.pop(dest, None)
+            else:
+                rib[dest] = (cost, tuple(path))
+            changed.add(dest)
+        self.logger.info(f"Nhan cap nhat tu {neighbor}: {len(update.get('routes', {}))} tuyen, rut {len(update.get('withdrawn', []))} tuyen")
+        self.update_routes(changed)
+
+    def handle_new_link(self, port, endpoint, cost):
+        """Thêm liên kết mới đến hàng xóm và gửi toàn bộ bảng cho hàng xóm đó."""
+        self.neighbors[port] = (endpoint, cost)
+        self.adj_rib_out[port] = {}
+        self.logger.info(f"Them lien ket den {endpoint} qua cong {port}, chi phi {cost}")
+        self.update_routes({endpoint})
+        self.send_routes(port, list(self.loc_rib))
+
+    def handle_remove_link(self, port):
+        """Xóa liên kết với hàng xóm và rút các tuyến học từ hàng xóm đó."""
+        if port not in self.neighbors:
+            self.logger.info(f"Cong {port} khong co lien ket")
+            return
+        neighbor, _ = self.neighbors.pop(port)
+        self.logger.info(f"Xoa lien ket den {neighbor} tai cong {port}")
+        self.adj_rib_out.pop(port, None)
+        changed = set(self.adj_rib_in.pop(neighbor, {}))
+        changed.add(neighbor)
+        changed.update(dest for dest, (_, _, out_port) in self.loc_rib.items() if out_port == port)
+        self.update_routes(changed)
+
+    def handle_time(self, time_ms):
+        """Gửi định kỳ toàn bộ bảng qua mọi cổng để sửa các cập nhật bị mất."""
+        if self.heartbeat_due(time_ms):
+            for port in self.neighbors:
+                self.send_routes(port, list(self.loc_rib), full=True)
+
+    def best_route(self, dest):
+        """Tuyến tốt nhất đến `dest`: (chi phí, đường đi, cổng), hoặc None nếu không có."""
+        if dest == self.addr:
+            return (0, (self.addr,), None)
+        best = None
+        for port, (neighbor, cost) in self.neighbors.items():
+            if neighbor == dest:
+                candidate = (cost, (self.addr, dest), port)
+            else:
+                route = self.adj_rib_in.get(neighbor, {}).get(dest)
+                if route is None:
+                    continue
+                candidate = (cost + route[0], (self.addr,) + route[1], port)
+            if best is None or (candidate[0], len(candidate[1]), candidate[1]) < (best[0], len(best[1]), best[1]):
+                best = candidate
+        return best
+
+    def update_routes(self, dests):
+        """Tính lại tuyến tốt nhất của các đích `dests` và yêu cầu gửi cập nhật nếu có thay đổi."""
+        changed = []
+        for dest in dests:
+            route = self.best_route(dest)
+            if route == self.loc_rib.get(dest):
+                continue
+            changed.append(dest)
+            if route is None:
+                del self.loc_rib[dest]
+                self.forwarding_table.pop(dest, None)
+                self.logger.info(f"Mat tuyen den {dest}")
+            else:
+                self.loc_rib[dest] = route
+                self.forwarding_table[dest] = route[2]
+                self.logger.info(f"Tuyen den {dest}: chi phi {route[0]}, duong di {list(route[1])}, cong {route[2]}")
+        if changed:
+            self.pending.update(changed)
+            self.request_update()
+
+    def send_update(self):
+        """Gửi các tuyến thay đổi đến mọi hàng xóm (được Router điều tiết và gộp)."""
+        dests, self.pending = list(self.pending), set()
+        for port in self.neighbors:
+            self.send_routes(port, dests)
+
+    def advertisement_for(self, port, dest):
+        """Tuyến quảng bá cho `dest` qua cổng `port`: (chi phí, đường đi), hoặc None."""
+        route = self.loc_rib.get(dest)
+        if route is None:
+            return None
+        neighbor, _ = self.neighbors[port]
+        cost, path, out_port = route
+        if out_port == port or neighbor in path:
+            return None  # Hàng xóm sẽ bỏ tuyến đi qua chính nó
+        return (cost, path)
+
+    def send_routes(self, port, dests, full=False):
+        """Gửi qua cổng `port` các tuyến của `dests` khác với lần quảng bá trước, và các tuyến bị rút.
+
+        Với `full`, adj_rib_out của cổng được xóa trước và gói được gửi kể cả khi rỗng:
+        `dests` phải là toàn bộ loc_rib, vì hàng xóm bỏ các tuyến không có trong gói.
+        """
+        if full:
+            self.adj_rib_out[port] = {}
+        sent = self.adj_rib_out.setdefault(port, {})
+        routes = {}
+        withdrawn = []
+        for dest in set(dests):
+            advertisement = self.advertisement_for(port, dest)
+            if advertisement == sent.get(dest):
+                continue
+            if advertisement is None:
+                del sent[dest]
+                withdrawn.append(dest)
+            else:
+                sent[dest] = advertisement
+                routes[dest] = [advertisement[0], list(advertisement[1])]
+        if not routes and not withdrawn and not full:
+            return
+        update = {'routes': routes, 'withdrawn': withdrawn}
+        if full:
+            update['full'] = True
+        content = json.dumps(update)
+        self.send(port, Packet(Packet.ROUTING, self.addr, None, content))
+        self.logger.info(f"Gui cap nhat qua cong {port}: {len(routes)} tuyen, rut {len(withdrawn)} tuyen")
+
+    def get_state(self):
+        """Trạng thái định tuyến để lưu checkpoint."""
+        return {
+            'loc_rib': {dest: (cost, list(path), port) for dest, (cost, path, port) in self.loc_rib.items()},
+            'adj_rib_in': {neighbor: {dest: (cost, list(path)) for dest, (cost, path) in rib.items()}
+                           for neighbor, rib in self.adj_rib_in.items()},
+        }
+
+    def set_state(self, state):
+        """Khôi phục trạng thái định tuyến từ checkpoint (hàng xóm được thêm lại qua liên kết)."""
+        self.loc_rib = {dest: (cost, tuple(path), port) for dest, (cost, path, port) in state['loc_rib'].items()}
+        self.adj_rib_in = {neighbor: {dest: (cost, tuple(path)) for dest, (cost, path) in rib.items()}
+                           for neighbor, rib in state['adj_rib_in'].items()}
+        self.forwarding_table = AddressTable({dest: port for dest, (_, _, port) in self.loc_rib.items() if port is not None})
+        self.logger.info(f"Khoi phuc trang thai tu checkpoint: {len(self.loc_rib)} tuyen")
+
+    def __repr__(self):
+        """Trạng thái router."""
+        output = f"PVrouter(addr={self.addr})\n"
+        output += "Routes:\n"
+        for dest, (cost, path, port) in sorted(self.loc_rib.items()):
+            output += f"  {dest}: cost {cost}, path {'-'.join(path)}, port {port}\n"
+        return output
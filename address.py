@@ -0,0 +1,184 @@
+import array
+import functools
+import itertools
+import operator
+import threading
+from collections.abc import ItemsView, MutableMapping
+
+
+class AddressRegistry:
+    """
+    The AddressRegistry class assigns dense integer IDs to router and client
+    addresses, in the order in which they are first seen.
+
+    The process-wide registry `addresses` is filled by Network when it parses the
+    routers and clients of a scenario, and on demand for any other address. IDs are
+    never reused, so tables indexed by ID stay valid for the whole process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {}  # {address: ID}
+        self.names = []  # Addresses indexed by ID
+
+    def intern(self, addr):
+        """Return the ID of `addr`, assigning the next free ID if it has none."""
+        try:
+            return self.ids[addr]
+        except KeyError:
+            with self.lock:
+                if addr not in self.ids:
+                    self.ids[addr] = len(self.names)
+                    self.names.append(addr)
+                return self.ids[addr]
+
+    def lookup(self, addr):
+        """Return the ID of `addr`, or None if it has not been interned."""
+        return self.ids.get(addr)
+
+    def name(self, addr_id):
+        """Return the address with ID `addr_id`."""
+        return self.names[addr_id]
+
+    def __contains__(self, addr):
+        return addr in self.ids
+
+    def __len__(self):
+        return len(self.names)
+
+
+addresses = AddressRegistry()
+
+
+class _ItemsView(ItemsView):
+    """Items view of an AddressTable that reads the array once per entry."""
+
+    def __iter__(self):
+        return self._mapping.iter_items()
+
+
+class AddressTable(MutableMapping):
+    """
+    The AddressTable class is a mapping from addresses to integers (ports, costs)
+    stored in an array indexed by address ID.
+
+    It behaves like a dict keyed by address strings, so it can replace the string
+    keyed forwarding and routing tables of the routers. Each entry takes the size of
+    one C integer instead of a dict slot, and `get_id` looks entries up directly by
+    ID, e.g. with the `dst_id` of a packet, without hashing the address.
+
+    Parameters
+    ----------
+    data
+        Optional mapping or iterable of (address, value) pairs to fill the table with.
+    registry
+        The AddressRegistry that assigns the IDs. Defaults to `addresses`.
+    typecode
+        The array typecode of the values. Defaults to "i" (C int).
+    """
+
+    MISSING = -(2**31)  # Value of the array slots without an entry
+
+    def __init__(self, data=(), registry=None, typecode="i"):
+        self.registry = registry if registry is not None else addresses
+        self.values_array = array.array(typecode)
+        self.count = 0
+        if data:
+            self.update(data)
+
+    @classmethod
+    def from_values(cls, values, registry=None, typecode="i"):
+        """
+        Create a table from a sequence of values indexed by address ID, with
+        `AddressTable.MISSING` for the addresses without an entry.
+        """
+        table = cls(registry=registry, typecode=typecode)
+        table.values_array = array.array(typecode, values)
+        table.count = len(table.values_array) - table.values_array.count(cls.MISSING)
+        return table
+
+    def get_id(self, addr_id, default=None):
+        """Return the value for the address with ID `addr_id`, or `default`."""
+        if addr_id is None or addr_id >= len(self.values_array):
+            return default
+        value = self.values_array[addr_id]
+        return default if value == AddressTable.MISSING else value
+
+    def set_id(self, addr_id, value):
+        """Set the value for the address with ID `addr_id`."""
+        values = self.values_array
+        if addr_id >= len(values):
+            missing = array.array(values.typecode, [AddressTable.MISSING])
+            values.extend(missing * (addr_id + 1 - len(values)))
+        if values[addr_id] == AddressTable.MISSING:
+            self.count += 1
+        values[addr_id] = value
+
+    def _present(self):
+        """Iterate over booleans telling which array slots hold an entry."""
+        is_present = functools.partial(operator.ne, AddressTable.MISSING)
+        return map(is_present, self.values_array)
+
+    def id_items(self):
+        """Iterate over the (address ID, value) pairs in ID order."""
+        return itertools.compress(enumerate(self.values_array), self._present())
+
+    def iter_items(self):
+        """Iterate over the (address, value) pairs in ID order."""
+        return itertools.compress(
+            zip(self.registry.names, self.values_array), self._present()
+        )
+
+    def __getitem__(self, addr):
+        value = self.get_id(self.registry.lookup(addr))
+        if value is None:
+            raise KeyError(addr)
+        return value
+
+    def __setitem__(self, addr, value):
+        self.set_id(self.registry.intern(addr), value)
+
+    def __delitem__(self, addr):
+        addr_id = self.registry.lookup(addr)
+        if self.get_id(addr_id) is None:
+            raise KeyError(addr)
+        self.values_array[addr_id] = AddressTable.MISSING
+        self.count -= 1
+
+    def __contains__(self, addr):
+        return self.get_id(self.registry.lookup(addr)) is not None
+
+    def __iter__(self):
+        return (addr for addr, _ in self.iter_items())
+
+    def __len__(self):
+        return self.count
+
+    def items(self):
+        return _ItemsView(self)
+
+    def __eq__(self, other):
+        if isinstance(other, AddressTable) and other.registry is self.registry:
+            if self.count != other.count:
+                return False
+            a, b = self.values_array, other.values_array
+            n = min(len(a), len(b))
+            missing = AddressTable.MISSING
+            return (
+                a[:n] == b[:n]
+                and all(v == missing for v in a[n:])
+                and all(v == missing for v in b[n:])
+            )
+        return super().__eq__(other)
+
+    def copy(self):
+        """Return a shallow copy of the table."""
+        return AddressTable.from_values(
+            self.values_array, self.registry, self.values_array.typecode
+        )
+
+    def __reduce__(self):
+        return (AddressTable, (dict(self.iter_items()),))
+
+    def __repr__(self):
+        return f"{dict(self.iter_items())}"
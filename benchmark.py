@@ -0,0 +1,337 @@
+import argparse
+import heapq
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import timeit
+from address import AddressTable
+from link import Link
+from packet import Packet
+from router import Router
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json"
+)
+
+
+def generate_topology(size, degree=4, seed=0):
+    """
+    Generate a connected random topology with `size` routers named r0, r1, ...
+
+    Routers form a ring with random chords added until the average degree is about
+    `degree`. Return a dict {router: {neighbor: cost}} with symmetric costs.
+    """
+    rng = random.Random(seed)
+    names = [f"r{i}" for i in range(size)]
+    graph = {name: {} for name in names}
+
+    def connect(a, b):
+        if a != b and b not in graph[a]:
+            cost = rng.randint(1, 10)
+            graph[a][b] = cost
+            graph[b][a] = cost
+
+    for i in range(size):
+        connect(names[i], names[(i + 1) % size])
+    for _ in range(max(size * (degree - 2) // 2, 0)):
+        connect(rng.choice(names), rng.choice(names))
+    return graph
+
+
+def setup_lsrouter(size):
+    """Create an LSrouter "r0" whose link_state_db holds a `size`-node topology."""
+    from LSrouter import LSrouter
+
+    graph = generate_topology(size)
+    router = LSrouter("r0", heartbeat_time=1000)
+    for port, (neighbor, cost) in enumerate(graph["r0"].items(), start=1):
+        router.neighbors[port] = (neighbor, cost)
+    router.link_state_db = {addr: (1, links) for addr, links in graph.items()}
+    return router, graph
+
+
+def setup_dvrouter(size, neighbors=4, seed=0):
+    """Create a DVrouter "r0" with `neighbors` neighbors advertising `size` routes."""
+    from DVrouter import DVrouter
+
+    rng = random.Random(seed)
+    router = DVrouter("r0", heartbeat_time=1000)
+    dests = [f"r{i}" for i in range(neighbors + 1, size)]
+    for port in range(1, neighbors + 1):
+        neighbor = f"r{port}"
+        router.neighbors[port] = (neighbor, rng.randint(1, 5))
+        routes = {dst: rng.randint(1, 10) for dst in dests}
+        routes[neighbor] = 0
+        router.neighbor_dv[neighbor] = AddressTable(routes)
+    return router
+
+
+def write_scenario(size, path):
+    """Write a scenario with `size` routers and `size` clients for Network."""
+    graph = generate_topology(size)
+    links = []
+    port = {name: 1 for name in graph}
+    for a in graph:
+        for b, cost in graph[a].items():
+            if a < b:
+                links.append([a, b, port[a], port[b], cost, cost])
+                port[a] += 1
+                port[b] += 1
+    clients = [f"c{i}" for i in range(size)]
+    for i, client in enumerate(clients):
+        links.append([client, f"r{i}", 1, port[f"r{i}"], 1, 1])
+        port[f"r{i}"] += 1
+    correct_routes = [
+        [clients[i], f"r{i}", f"r{(i + 1) % size}", clients[(i + 1) % size]]
+        for i in range(size)
+    ]
+    scenario = {
+        "routers": list(graph),
+        "clients": clients,
+        "client_send_rate": 10,
+        "end_time": 100,
+        "links": links,
+        "correct_routes": correct_routes,
+    }
+    with open(path, "w") as f:
+        json.dump(scenario, f)
+
+
+def bench_dijkstra(size):
+    router, graph = setup_lsrouter(size)
+    return lambda: router.dijkstra(graph, "r0")
+
+
+def bench_update_forwarding_table(size):
+    router, _ = setup_lsrouter(size)
+    return router.update_forwarding_table
+
+
+def bench_update_distance_vector(size):
+    router = setup_dvrouter(size)
+
+    def run():
+        router.distance_vector = AddressTable({router.addr: 0})
+        router.update_distance_vector()
+
+    return run
+
+
+def bench_packet_copy(size):
+    vector = {f"r{i}": i % 16 for i in range(size)}
+    packet = Packet(Packet.ROUTING, "r0", None, json.dumps(vector))
+    packet.route = [f"r{i}" for i in range(10)]
+    return packet.copy
+
+
+def bench_link_send_recv(size):
+    link = Link("a", "b", 0, 0, 0)
+    packet = Packet(Packet.TRACEROUTE, "a", "b")
+
+    def run():
+        for _ in range(size):
+            link.send(packet, "a")
+        received = 0
+        while received < size:
+            if link.recv("b"):
+                received += 1
+            else:
+                time.sleep(0)
+
+    return run
+
+
+def bench_update_route(size):
+    from network import Network
+
+    path = os.path.join(tempfile.mkdtemp(), "scenario.json")
+    write_scenario(size, path)
+    net = Network(path, Router)
+    pairs = [
+        (route[0], route[-1], route)
+        for routes in net.correct_routes.values()
+        for route in routes
+    ]
+
+    def run():
+        for src, dst, route in pairs:
+            net.update_route(src, dst, route)
+
+    return run
+
+
+def reference():
+    """
+    Pure-Python Dijkstra over a fixed 2000-node topology, using none of the
+    simulator's code. Every benchmark is reported relative to this workload run in
+    the same process, which cancels out most of the machine and load differences.
+    """
+    graph = generate_topology(2000, seed=1)
+
+    def run():
+        distances = {"r0": 0}
+        heap = [(0, "r0")]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > distances[node]:
+                continue
+            for neighbor, cost in graph[node].items():
+                candidate = distance + cost
+                if candidate < distances.get(neighbor, float("inf")):
+                    distances[neighbor] = candidate
+                    heapq.heappush(heap, (candidate, neighbor))
+
+    return run
+
+
+BENCHMARKS = {
+    "LSrouter.dijkstra": bench_dijkstra,
+    "LSrouter.update_forwarding_table": bench_update_forwarding_table,
+    "DVrouter.update_distance_vector": bench_update_distance_vector,
+    "Packet.copy": bench_packet_copy,
+    "Link.send/recv": bench_link_send_recv,
+    "Network.update_route": bench_update_route,
+}
+
+
+def measure(fn, reference_fn, repeat=7, min_time=0.02):
+    """
+    Return the best time (in seconds) of one call to `fn` over `repeat` runs, and
+    that time relative to the best time of `reference_fn`. The runs of both
+    alternate, so that a slow period of the machine affects both alike. Each run
+    makes enough calls to take at least `min_time` seconds.
+    """
+    timers = [timeit.Timer(fn), timeit.Timer(reference_fn)]
+    numbers = []
+    for timer in timers:
+        number = 1
+        while timer.timeit(number) < min_time:
+            number *= 2
+        numbers.append(number)
+    best = [float("inf"), float("inf")]
+    for _ in range(repeat):
+        for i, timer in enumerate(timers):
+            best[i] = min(best[i], timer.timeit(numbers[i]) / numbers[i])
+    return best[0], best[0] / best[1]
+
+
+def run_benchmarks(names, sizes):
+    """
+    Run the benchmarks `names` for every size with logging disabled. Return
+    {"name[size]": time relative to `reference`}.
+    """
+    relative = {}
+    reference_fn = reference()
+    logging.disable(logging.CRITICAL)
+    try:
+        for name in names:
+            for size in sizes:
+                key = f"{name}[{size}]"
+                seconds, relative[key] = measure(BENCHMARKS[name](size), reference_fn)
+                sys.stdout.write(
+                    f"{key}: {seconds * 1e6:.1f} us, {relative[key]:.4f}x reference\n"
+                )
+                sys.stdout.flush()
+    finally:
+        logging.disable(logging.NOTSET)
+    return relative
+
+
+def compare(relative, baseline, threshold):
+    """
+    Compare the `relative` times against `baseline`. Return the keys that are
+    slower than the baseline by more than `threshold` (a fraction, e.g. 0.5 for
+    50%).
+    """
+    regressions = []
+    for key, value in relative.items():
+        if key not in baseline:
+            continue
+        ratio = value / baseline[key]
+        status = "SLOWER" if ratio > 1 + threshold else "ok"
+        sys.stdout.write(f"{key}: {ratio:.2f}x baseline {status}\n")
+        if ratio > 1 + threshold:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark hot routing functions against stored baselines."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 10000],
+        help="Numbers of nodes to benchmark with.",
+    )
+    parser.add_argument(
+        "--only",
+        type=str,
+        nargs="+",
+        choices=list(BENCHMARKS),
+        default=list(BENCHMARKS),
+        help="Benchmarks to run (default: all).",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.5,
+        help="Flag benchmarks slower than the baseline by more than this fraction.",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=BASELINE_PATH,
+        help="Path to the baseline results (JSON).",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store the results as the new baseline instead of comparing.",
+    )
+    args = parser.parse_args()
+
+    # Routers write their logs to the current directory
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    try:
+        relative = run_benchmarks(args.only, args.sizes)
+    finally:
+        os.chdir(cwd)
+
+    if args.update_baseline:
+        baseline = {"relative": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+        baseline.pop("results", None)  # Absolute times of the old format
+        baseline.setdefault("relative", {}).update(relative)
+        baseline["python"] = platform.python_version()
+        baseline["machine"] = platform.machine()
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        sys.stdout.write(f"Baseline written to {args.baseline}\n")
+        return
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    if "relative" not in baseline:
+        sys.stdout.write("Baseline has no relative times, run --update-baseline\n")
+        sys.exit(1)
+    regressions = compare(relative, baseline["relative"], args.threshold)
+    if regressions:
+        sys.stdout.write(f"\nFAILURE: {len(regressions)} benchmark(s) regressed\n")
+        sys.exit(1)
+    sys.stdout.write("\nSUCCESS: No benchmark regressed\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+import json
+import math
+import random
+import threading
 import time
 import queue
 from packet import Packet
@@ -6,10 +10,49 @@ from packet import Packet
 class Client:
     """
     The Client class sends periodic "traceroute" packets and returns routes that
-    these packets take back to the network object.
+    these packets take back to the network object. It can additionally send the data
+    packets of traffic flows (see traffic.py) and report their arrival through
+    `traffic_fn`.
+
+    Which clients are probed every `send_rate` ms depends on the probe strategy:
+
+    - "full" (default): every client, including itself.
+    - "random": `probe_count` clients sampled at random every period.
+    - "round_robin": the next `probe_count` clients of `all_clients`, in turn.
+    - "affected": the clients marked with `mark_affected`, e.g. by the network after
+      a link change, for `probe_periods` periods. All clients are marked at start.
+
+    The final batch sent by `last_send` always probes every client.
+
+    Parameters
+    ----------
+    probe
+        The probe strategy, one of `Client.PROBE_STRATEGIES`.
+    probe_count
+        Number of clients probed per period by "random" and "round_robin". Defaults
+        to the square root of the number of clients, rounded up.
+    probe_periods
+        Number of periods for which "affected" probes the clients marked at start.
+    seed
+        Seed of the "random" sampling, combined with the client address.
     """
 
-    def __init__(self, addr, all_clients, send_rate, update_fn):
+    PROBE_STRATEGIES = ("full", "random", "round_robin", "affected")
+
+    def __init__(
+        self,
+        addr,
+        all_clients,
+        send_rate,
+        update_fn,
+        traffic_fn=None,
+        probe="full",
+        probe_count=None,
+        probe_periods=5,
+        seed=None,
+    ):
+        if probe not in Client.PROBE_STRATEGIES:
+            raise ValueError(f"Unknown probe strategy {probe!r}")
         self.addr = addr
         self.all_clients = all_clients
         self.send_rate = send_rate
@@ -18,7 +61,23 @@ class Client:
         self.update_fn = update_fn
         self.sending = True
         self.link_changes = queue.Queue()
-        self.keep_running = True
+        self.clock = time.time  # Current time in seconds, replaced by the Network's
+        self.shutdown = threading.Event()  # Set to stop `run`, shared by the Network
+        self.flows = []
+        self.traffic_fn = traffic_fn
+        self.probe = probe
+        self.probe_count = probe_count or math.ceil(math.sqrt(len(all_clients)))
+        self.probe_rng = random.Random(f"{seed}|{addr}")
+        # Stagger the rotations of the clients so they do not probe the same client
+        self.probe_offset = all_clients.index(addr) if addr in all_clients else 0
+        self.affected_lock = threading.Lock()
+        self.affected = {}  # {client: periods left to probe it}
+        if probe == "affected":
+            self.mark_affected(all_clients, probe_periods)
+
+    def add_flow(self, flow):
+        """Add a traffic flow originating at this client."""
+        self.flows.append(flow)
 
     def change_link(self, change):
         """Add a link to the client.
@@ -31,41 +90,91 @@ class Client:
         """Handle receiving a packet.
 
         If it is a routing packet, ignore. If it is a "traceroute" packet, update the
-        network object with its route.
+        network object with its route. If it is a data packet, report its arrival
+        time to the network object.
         """
         if packet.kind == Packet.TRACEROUTE:
             self.update_fn(packet.src_addr, packet.dst_addr, packet.route)
+        elif packet.kind == Packet.DATA and self.traffic_fn:
+            info = json.loads(packet.content)
+            recv_ms = self.clock() * 1000
+            self.traffic_fn(info["flow"], info["seq"], info["sent"], recv_ms)
 
-    def send_traceroutes(self):
-        """Send "traceroute" packets to every other client in the network."""
-        for dst_client in self.all_clients:
+    def mark_affected(self, dst_clients, periods):
+        """Probe `dst_clients` for the next `periods` periods (strategy "affected")."""
+        with self.affected_lock:
+            for dst_client in dst_clients:
+                left = self.affected.get(dst_client, 0)
+                self.affected[dst_client] = max(left, periods)
+
+    def probe_targets(self):
+        """Return the clients to probe this period, according to the strategy."""
+        if self.probe == "random":
+            count = min(self.probe_count, len(self.all_clients))
+            return self.probe_rng.sample(self.all_clients, count)
+        if self.probe == "round_robin":
+            n = len(self.all_clients)
+            targets = [
+                self.all_clients[(self.probe_offset + i) % n]
+                for i in range(min(self.probe_count, n))
+            ]
+            self.probe_offset = (self.probe_offset + len(targets)) % max(n, 1)
+            return targets
+        if self.probe == "affected":
+            with self.affected_lock:
+                targets = list(self.affected)
+                self.affected = {
+                    dst: left - 1 for dst, left in self.affected.items() if left > 1
+                }
+            return targets
+        return self.all_clients
+
+    def send_traceroutes(self, dst_clients=None):
+        """Send "traceroute" packets to `dst_clients`, by default every client."""
+        if dst_clients is None:
+            dst_clients = self.all_clients
+        for dst_client in dst_clients:
             packet = Packet(Packet.TRACEROUTE, self.addr, dst_client)
             if self.link:
                 self.link.send(packet, self.addr)
             self.update_fn(packet.src_addr, packet.dst_addr, [])
 
+    def send_flows(self):
+        """Send the data packets of every flow that are due by now."""
+        for flow in self.flows:
+            count = flow.due(self.clock() * 1000)
+            for _ in range(count):
+                packet = flow.make_packet(self.clock() * 1000)
+                if self.link:
+                    self.link.send(packet, self.addr)
+
     def handle_time(self, time_ms):
         """Send traceroute packets regularly."""
         if self.sending and (time_ms - self.last_time > self.send_rate):
-            self.send_traceroutes()
+            self.send_traceroutes(self.probe_targets())
             self.last_time = time_ms
+        if self.sending and self.flows:
+            self.send_flows()
 
     def run(self):
         """Main loop of client."""
-        while self.keep_running:
-            time.sleep(0.1)
-            time_ms = int(round(time.time() * 1000))
-            try:
-                change = self.link_changes.get_nowait()
-                if change[0] == "add":
-                    self.link = change[1]
-            except queue.Empty:
-                pass
-            if self.link:
+        while not self.shutdown.wait(0.1):
+            self.tick(int(round(self.clock() * 1000)))
+
+    def tick(self, time_ms):
+        """Apply a link change, handle received packets and send packets due."""
+        try:
+            change = self.link_changes.get_nowait()
+            if change[0] == "add":
+                self.link = change[1]
+        except queue.Empty:
+            pass
+        if self.link:
+            packet = self.link.recv(self.addr)
+            while packet:
+                self.handle_packet(packet)
                 packet = self.link.recv(self.addr)
-                if packet:
-                    self.handle_packet(packet)
-            self.handle_time(time_ms)
+        self.handle_time(time_ms)
 
     def last_send(self):
         """Send one final batch of "traceroute" packets."""
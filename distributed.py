@@ -0,0 +1,883 @@
+import argparse
+import heapq
+import itertools
+import json
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Client as ControlClient
+from multiprocessing.connection import Listener
+from address import addresses
+from client import Client
+from network import ClientThread, Network, RouterThread, router_class
+from packet import Packet
+
+DEFAULT_AUTHKEY = "routing-sim"
+MAX_DATAGRAM = 65507  # Largest UDP payload over IPv4
+
+
+def encode_packet(key, packet):
+    """Encode `packet` and the link end `key` it is sent to as one datagram."""
+    return json.dumps(
+        [
+            key,
+            packet.kind,
+            packet.src_addr,
+            packet.dst_addr,
+            packet.content,
+            packet.route,
+            packet.flow_id,
+        ],
+        separators=(",", ":"),
+    ).encode()
+
+
+def decode_packet(data):
+    """Decode a datagram written by `encode_packet`. Return (key, packet)."""
+    key, kind, src_addr, dst_addr, content, route, flow_id = json.loads(data)
+    packet = Packet(kind, src_addr, dst_addr, content, flow_id)
+    packet.route = route
+    return key, packet
+
+
+def parse_address(value):
+    """Parse a "host:port" string into a (host, port) tuple."""
+    host, _, port = value.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class UDPTransport:
+    """
+    The UDPTransport class is the UDP socket of one worker process, shared by the
+    ends of all the links of the routers and clients that the worker runs.
+
+    Each datagram carries one packet and the key of the link end it is sent to. A
+    receiving thread decodes datagrams and hands them to the registered link end.
+    Datagrams for an end that is not registered yet are kept until it is, since the
+    two ends of a link are set up by different processes.
+
+    Parameters
+    ----------
+    host
+        The address to bind the socket to. Other workers send to it, so it must be
+        reachable from their hosts.
+    port
+        The port to bind the socket to, 0 (default) for any free port.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((host, port))
+        self.socket.settimeout(0.2)
+        self.address = self.socket.getsockname()
+        self.lock = threading.Lock()
+        self.ends = {}  # {key: UDPLink}
+        self.early = {}  # {key: [(packet, arrival_ms)]} for unknown keys
+        self.closed = set()  # Keys of removed link ends
+        self.keep_running = True
+        self.datagrams_sent = 0
+        self.bytes_sent = 0
+        self.datagrams_received = 0
+        self.bytes_received = 0
+        self.oversized = 0
+        self.encode_seconds = 0.0
+        self.decode_seconds = 0.0
+        self.thread = threading.Thread(target=self.receive, name="udp-receive")
+        self.thread.start()
+
+    def register(self, end):
+        """Start delivering the datagrams for the link end `end`."""
+        with self.lock:
+            self.ends[end.key] = end
+            early = self.early.pop(end.key, [])
+        for packet, arrival_ms in early:
+            end.deliver(packet, arrival_ms)
+
+    def unregister(self, key):
+        """Stop delivering the datagrams for the link end `key` and drop them."""
+        with self.lock:
+            self.ends.pop(key, None)
+            self.early.pop(key, None)
+            self.closed.add(key)
+
+    def send(self, key, packet, address):
+        """Encode `packet` for the link end `key` and send it to `address`."""
+        start = time.perf_counter()
+        data = encode_packet(key, packet)
+        self.encode_seconds += time.perf_counter() - start
+        if len(data) > MAX_DATAGRAM:
+            self.oversized += 1
+            return
+        self.socket.sendto(data, address)
+        self.datagrams_sent += 1
+        self.bytes_sent += len(data)
+
+    def receive(self):
+        """Receive datagrams until `close` is called. Runs in its own thread."""
+        while self.keep_running:
+            try:
+                data, _ = self.socket.recvfrom(MAX_DATAGRAM)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            arrival_ms = time.time() * 1000
+            start = time.perf_counter()
+            key, packet = decode_packet(data)
+            self.decode_seconds += time.perf_counter() - start
+            self.datagrams_received += 1
+            self.bytes_received += len(data)
+            with self.lock:
+                end = self.ends.get(key)
+                if end is None and key not in self.closed:
+                    self.early.setdefault(key, []).append((packet, arrival_ms))
+            if end is not None:
+                end.deliver(packet, arrival_ms)
+
+    def close(self):
+        """Stop the receiving thread and close the socket."""
+        self.keep_running = False
+        self.thread.join()
+        self.socket.close()
+
+    def get_stats(self):
+        """Return the datagram, byte and encoding time counters."""
+        return {
+            "datagrams_sent": self.datagrams_sent,
+            "bytes_sent": self.bytes_sent,
+            "datagrams_received": self.datagrams_received,
+            "bytes_received": self.bytes_received,
+            "oversized": self.oversized,
+            "encode_seconds": self.encode_seconds,
+            "decode_seconds": self.decode_seconds,
+        }
+
+
+class UDPLink:
+    """
+    The UDPLink class is the local end of a link whose far end may run in another
+    process. It has the `send` and `recv` methods of Link for the local endpoint.
+
+    Packets are sent at once as UDP datagrams. The latency of the far end to local
+    end direction is emulated here, at the receiver: a received packet is held
+    until `latency` ms after its arrival. Between hosts, the real network delay
+    adds to it. Link options of the scenario (bandwidth, buffer and impairments)
+    are not modeled, and Coordinator rejects them. A `silent` end drops the
+    packets it sends, so a "silent" change sets both ends.
+
+    Parameters
+    ----------
+    transport
+        The UDPTransport of the local process.
+    link_id
+        Identifier of the link, shared by its two ends and unique per "up" event.
+    local, remote
+        The addresses of the local and far endpoints.
+    remote_address
+        The (host, port) of the UDPTransport of the far endpoint.
+    latency
+        The latency (in ms) of packets sent by the far endpoint to the local one.
+    """
+
+    def __init__(self, transport, link_id, local, remote, remote_address, latency):
+        self.transport = transport
+        self.local = local
+        self.remote = remote
+        self.key = f"{link_id}/{local}"
+        self.remote_key = f"{link_id}/{remote}"
+        self.remote_address = tuple(remote_address)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.pending = []  # Heap of (delivery_ms, sequence, packet)
+        self.sequence = itertools.count()
+        self.silent = False  # Whether the link silently drops every packet
+        self.silent_dropped = 0
+
+    def send(self, packet, src):
+        """Send packet from the local endpoint `src` to the far endpoint."""
+        if packet.content:
+            assert isinstance(packet.content, str), "Packet content must be a string"
+        if self.silent:
+            self.silent_dropped += 1
+            return
+        p = packet.copy()
+        p.add_to_route(self.remote)
+        self.transport.send(self.remote_key, p, self.remote_address)
+
+    def deliver(self, packet, arrival_ms):
+        """Queue a packet received at `arrival_ms` for delivery after the latency."""
+        with self.lock:
+            heapq.heappush(
+                self.pending,
+                (arrival_ms + self.latency, next(self.sequence), packet),
+            )
+
+    def recv(self, dst, timeout=None):
+        """Return the next packet whose latency has elapsed, or None."""
+        with self.lock:
+            if self.pending and self.pending[0][0] <= time.time() * 1000:
+                return heapq.heappop(self.pending)[2]
+            return None
+
+
+class Worker:
+    """
+    The Worker class runs a group of routers and clients in one process, linked to
+    the rest of the network over UDP.
+
+    It connects to the coordinator, announces the address of its UDPTransport and
+    then follows the coordinator's messages: create its routers and clients, start
+    them, bring link ends up and down, silence and restore them, and have the
+    clients send their final
+    traceroutes. Routes found by the clients are sent back to the coordinator.
+
+    Parameters
+    ----------
+    coordinator_address
+        The (host, port) the coordinator listens on.
+    authkey
+        The shared key that authenticates the control connection.
+    host
+        The address to bind the UDP socket to, reachable from the other workers.
+    """
+
+    def __init__(self, coordinator_address, authkey=DEFAULT_AUTHKEY, host="127.0.0.1"):
+        self.coordinator_address = coordinator_address
+        self.authkey = authkey
+        self.host = host
+        self.routers = {}
+        self.clients = {}
+        self.links = {}  # {key: UDPLink}
+        self.threads = []
+        self.shutdown = threading.Event()  # Stops the routers and clients when set
+        self.send_lock = threading.Lock()
+
+    def report(self, message):
+        """Send `message` to the coordinator."""
+        with self.send_lock:
+            self.connection.send(message)
+
+    def update_route(self, src, dst, route):
+        """Callback function used by clients to report a traceroute."""
+        self.report(("route", src, dst, route))
+
+    def setup(self, config):
+        """Create the routers and clients of this worker from its configuration."""
+        for addr in config["addresses"]:
+            addresses.intern(addr)
+        RouterClass = router_class(config["router"])
+        areas = config["areas"]
+        for addr in config["routers"]:
+            options = dict(config["router_options"])
+            if getattr(RouterClass, "supports_areas", False) and addr in areas:
+                options["area"] = areas[addr]
+            router = self.routers[addr] = RouterClass(
+                addr, heartbeat_time=config["heartbeat_time"], **options
+            )
+            router.shutdown = self.shutdown
+        probing = config["probing"]
+        for addr in config["clients"]:
+            client = self.clients[addr] = Client(
+                addr,
+                config["all_clients"],
+                config["client_send_rate"],
+                self.update_route,
+                probe=probing.get("strategy", "full"),
+                probe_count=probing.get("count"),
+                probe_periods=probing.get("periods", 5),
+                seed=probing.get("seed"),
+            )
+            client.shutdown = self.shutdown
+
+    def start(self):
+        """Start a thread for each router and client."""
+        for router in self.routers.values():
+            thread = RouterThread(router)
+            thread.start()
+            self.threads.append(thread)
+        for client in self.clients.values():
+            thread = ClientThread(client)
+            thread.start()
+            self.threads.append(thread)
+
+    def add_link(self, end):
+        """Bring up a link end described by the coordinator."""
+        link = UDPLink(
+            self.transport,
+            end["link_id"],
+            end["local"],
+            end["remote"],
+            end["remote_address"],
+            end["latency"],
+        )
+        self.links[link.key] = link
+        self.transport.register(link)
+        if end["local"] in self.routers:
+            self.routers[end["local"]].change_link(
+                ("add", end["port"], end["remote"], link, end["cost"])
+            )
+        else:
+            self.clients[end["local"]].change_link(("add", link))
+
+    def remove_link(self, end):
+        """Take down a link end described by the coordinator."""
+        key = f"{end['link_id']}/{end['local']}"
+        self.links.pop(key, None)
+        self.transport.unregister(key)
+        if end["local"] in self.routers:
+            self.routers[end["local"]].change_link(("remove", end["port"]))
+
+    def silence_link(self, end, silent):
+        """Make a link end described by the coordinator drop its packets or not."""
+        link = self.links.get(f"{end['link_id']}/{end['local']}")
+        if link is not None:
+            link.silent = silent
+
+    def get_stats(self):
+        """
+        Return the transport counters, the routing messages of the routers and the
+        dead links they detected.
+        """
+        stats = self.transport.get_stats()
+        stats["routers"] = {
+            addr: (router.routing_messages_sent, router.routing_bytes_sent)
+            for addr, router in self.routers.items()
+        }
+        stats["detections"] = {
+            addr: router.detections for addr, router in self.routers.items()
+        }
+        return stats
+
+    def run(self):
+        """Serve the coordinator until it stops the worker."""
+        self.transport = UDPTransport(self.host)
+        self.connection = ControlClient(
+            self.coordinator_address, authkey=self.authkey.encode()
+        )
+        self.report(("hello", self.transport.address))
+        try:
+            while True:
+                message = self.connection.recv()
+                if message[0] == "setup":
+                    self.setup(message[1])
+                elif message[0] == "start":
+                    self.start()
+                elif message[0] == "up":
+                    self.add_link(message[1])
+                elif message[0] == "down":
+                    self.remove_link(message[1])
+                elif message[0] in ("silent", "restore"):
+                    self.silence_link(message[1], message[0] == "silent")
+                elif message[0] == "affected":
+                    self.clients[message[1]].mark_affected(*message[2:])
+                elif message[0] == "final":
+                    for client in self.clients.values():
+                        client.last_send()
+                elif message[0] == "stop":
+                    self.shutdown.set()
+                    for thread in self.threads:
+                        thread.join()
+                    self.report(("stats", self.get_stats()))
+                    break
+        finally:
+            self.transport.close()
+            self.connection.close()
+
+
+class Coordinator(Network):
+    """
+    The Coordinator class takes the role of Network for a simulation whose routers
+    and clients run in Worker processes, possibly on several hosts.
+
+    It assigns the routers to the workers in scenario order, in blocks of
+    consecutive routers, and each client to the worker of the router it is linked
+    to. It then tells the workers which link ends to bring up and down, and to
+    silence and restore, following the scenario changes, and collects the routes
+    found by the clients. Route checking and reporting, and the probing options of
+    the clients, are those of Network.
+    Traffic flows and link options (bandwidth, buffer and impairments) are not
+    supported: a scenario that has any is rejected with a ValueError.
+
+    Parameters
+    ----------
+    net_json_path
+        The path to the JSON file that contains the network configurations.
+    router
+        "DV", "LS", "PV" or None, as on the network.py command line.
+    workers
+        Number of worker processes, or None for one per router.
+    listen
+        The (host, port) to accept worker connections on. Port 0 picks a free port.
+    authkey
+        The shared key that workers must present.
+    router_options
+        Optional dict of keyword arguments for the router constructor, merged over
+        the "router_options" entry of the configuration file.
+    probing
+        Optional dict of traceroute probing options, merged over the "probing" entry
+        of the configuration file, as for Network.
+    accept_timeout
+        Time (in s) to wait for each worker to connect before raising a
+        TimeoutError, or None to wait forever.
+    """
+
+    def __init__(
+        self,
+        net_json_path,
+        router=None,
+        workers=None,
+        listen=("127.0.0.1", 0),
+        authkey=DEFAULT_AUTHKEY,
+        router_options=None,
+        probing=None,
+        accept_timeout=60,
+    ):
+        with open(net_json_path, "r") as f:
+            net_json = json.load(f)
+        self.check_supported(net_json)
+        self.configure(
+            net_json,
+            router_class(router).__name__,
+            router_options=router_options,
+            probing=probing,
+        )
+        strategy = self.probing.get("strategy", "full")
+        if strategy not in Client.PROBE_STRATEGIES:
+            raise ValueError(f"Unknown probe strategy {strategy!r}")
+        self.router = router
+        self.routers = list(net_json["routers"])
+        self.clients = list(net_json["clients"])
+        self.link_params = net_json["links"]
+        self.link_ids = itertools.count()
+        self.links = {}  # {(addr1, addr2): (p1, p2, c12, c21, link_id)}
+
+        self.num_workers = min(workers or len(self.routers), len(self.routers))
+        self.placement = self.place_nodes()
+        # All the workers may connect at once: queue them all until they are accepted
+        self.listener = Listener(
+            listen, backlog=self.num_workers, authkey=authkey.encode()
+        )
+        self.accept_timeout = accept_timeout
+        self.authkey = authkey
+        self.connections = []
+        self.send_locks = []
+        self.udp_addresses = []
+        self.readers = []
+        self.stats = queue.Queue()
+
+    @staticmethod
+    def check_supported(net_json):
+        """
+        Raise a ValueError if the scenario `net_json` has traffic flows or link
+        options, which UDPLink does not model, or link costs that are not integers.
+        """
+        if net_json.get("flows"):
+            raise ValueError("Traffic flows are not supported in distributed mode")
+        changes = net_json.get("changes", [])
+        up = [target for _, target, change in changes if change == "up"]
+        for params in net_json["links"] + up:
+            Network.check_link_costs(params)
+            if len(params) > 6 and params[6]:
+                raise ValueError(
+                    f"Link {params[0]}-{params[1]}: options not supported in "
+                    f"distributed mode: {', '.join(sorted(params[6]))}"
+                )
+
+    @property
+    def address(self):
+        """The (host, port) that workers connect to."""
+        return self.listener.address
+
+    def place_nodes(self):
+        """Return {address: worker index} for every router and client."""
+        placement = {}
+        block = -(-len(self.routers) // self.num_workers)
+        for i, addr in enumerate(self.routers):
+            placement[addr] = i // block
+        for params in self.link_params:
+            addr1, addr2 = params[:2]
+            if addr1 in self.clients and addr2 in placement:
+                placement.setdefault(addr1, placement[addr2])
+            elif addr2 in self.clients and addr1 in placement:
+                placement.setdefault(addr2, placement[addr1])
+        for addr in self.clients:
+            placement.setdefault(addr, 0)
+        return placement
+
+    def worker_command(self):
+        """Return the command line that starts a worker for this coordinator."""
+        host, port = self.address
+        if host == "0.0.0.0":
+            host = "127.0.0.1"
+        return [
+            sys.executable,
+            __file__,
+            "worker",
+            "--coordinator",
+            f"{host}:{port}",
+            "--authkey",
+            self.authkey,
+        ]
+
+    def accept_workers(self):
+        """
+        Wait for every worker to connect and send it its configuration.
+
+        Raise a TimeoutError if a worker does not connect within `accept_timeout`.
+        """
+        # Listener.accept has no timeout of its own, set one on the listening socket
+        self.listener._listener._socket.settimeout(self.accept_timeout)
+        for index in range(self.num_workers):
+            try:
+                connection = self.listener.accept()
+            except socket.timeout:
+                raise TimeoutError(
+                    f"Only {index} of {self.num_workers} workers connected within "
+                    f"{self.accept_timeout} s"
+                ) from None
+            _, udp_address = connection.recv()
+            self.connections.append(connection)
+            self.send_locks.append(threading.Lock())
+            self.udp_addresses.append(tuple(udp_address))
+            nodes = [a for a, i in self.placement.items() if i == index]
+            connection.send(("setup", self.worker_config(nodes)))
+
+    def worker_config(self, nodes):
+        """Return the configuration of a worker running the routers/clients `nodes`."""
+        routers = [addr for addr in nodes if addr not in self.clients]
+        return {
+            "router": self.router,
+            "router_options": self.router_options,
+            "areas": {addr: self.areas[addr] for addr in routers if addr in self.areas},
+            "heartbeat_time": self.latency_multiplier * 10,
+            "routers": routers,
+            "clients": [addr for addr in nodes if addr in self.clients],
+            "all_clients": self.clients,
+            "client_send_rate": self.client_send_rate,
+            "probing": self.probing,
+            "addresses": self.routers + self.clients,
+        }
+
+    def send_to(self, index, message):
+        """Send `message` to the worker `index`."""
+        with self.send_locks[index]:
+            self.connections[index].send(message)
+
+    def broadcast(self, message):
+        """Send `message` to every worker."""
+        for index in range(len(self.connections)):
+            self.send_to(index, message)
+
+    def read_worker(self, index):
+        """Handle the messages of the worker `index`. Runs in its own thread."""
+        connection = self.connections[index]
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == "route":
+                self.update_route(*message[1:])
+            elif message[0] == "stats":
+                self.stats.put(message[1])
+                break
+
+    def link_ends(self, params, link_id):
+        """Return the two link end descriptions of a scenario link entry."""
+        addr1, addr2, p1, p2, c12, c21 = params[:6]
+        return [
+            {
+                "link_id": link_id,
+                "local": local,
+                "remote": remote,
+                "port": port,
+                "cost": cost,
+                "latency": latency * self.latency_multiplier,
+                "remote_address": self.udp_addresses[self.placement[remote]],
+            }
+            for local, remote, port, cost, latency in (
+                (addr1, addr2, p1, c12, c21),
+                (addr2, addr1, p2, c21, c12),
+            )
+        ]
+
+    def link_up(self, params):
+        """Bring up the link of a scenario link entry on both workers."""
+        addr1, addr2, p1, p2, c12, c21 = params[:6]
+        link_id = next(self.link_ids)
+        self.links[(addr1, addr2)] = (p1, p2, c12, c21, link_id)
+        self.down_links.discard((addr1, addr2))
+        for end in self.link_ends(params, link_id):
+            self.send_to(self.placement[end["local"]], ("up", end))
+
+    def link_down(self, addr1, addr2):
+        """Take down the link between `addr1` and `addr2` on both workers."""
+        p1, p2, c12, c21, link_id = self.links[(addr1, addr2)]
+        self.down_links.add((addr1, addr2))
+        for local, port in ((addr1, p1), (addr2, p2)):
+            end = {"link_id": link_id, "local": local, "port": port}
+            self.send_to(self.placement[local], ("down", end))
+
+    def link_silent(self, addr1, addr2, silent):
+        """Make the link between `addr1` and `addr2` drop every packet or not."""
+        p1, p2, c12, c21, link_id = self.links[(addr1, addr2)]
+        if silent:
+            self.down_links.add((addr1, addr2))
+            self.silent_events.append((time.time() * 1000, addr1, addr2))
+        else:
+            self.down_links.discard((addr1, addr2))
+        change = "silent" if silent else "restore"
+        for local in (addr1, addr2):
+            end = {"link_id": link_id, "local": local}
+            self.send_to(self.placement[local], (change, end))
+
+    def add_links(self):
+        """Bring up all the links of the scenario."""
+        for params in self.link_params:
+            self.link_up(params)
+
+    def handle_changes(self):
+        """Handle changes to links. Runs in a separate thread."""
+        start_time = time.time() * 1000
+        while not self.changes.empty():
+            change_time, target, change = self.changes.get()
+            wait_time = (
+                change_time * self.latency_multiplier + start_time
+            ) - time.time() * 1000
+            if wait_time > 0:
+                time.sleep(wait_time / 1000)
+            if change == "up":
+                self.link_up(target)
+            elif change == "down":
+                self.link_down(*target)
+            elif change in ("silent", "restore"):
+                self.link_silent(*target, change == "silent")
+            if self.probing.get("strategy") == "affected":
+                self.mark_affected(target[0], target[1])
+
+    def mark_affected(self, addr1, addr2):
+        """Have the workers' clients probe again the pairs a link change may affect."""
+        periods = self.probing.get("periods", 5)
+        for src, dsts in self.affected_pairs(addr1, addr2).items():
+            self.send_to(self.placement[src], ("affected", src, dsts, periods))
+
+    def final_routes(self):
+        """Have the clients send one final batch of traceroute packets."""
+        self.reset_routes()
+        self.broadcast(("final",))
+        time.sleep(4 * self.client_send_rate / 1000)
+
+    def run(self):
+        """Run the simulation with the connected workers until the end time.
+
+        Return the stats of every worker.
+        """
+        self.accept_workers()
+        for index in range(len(self.connections)):
+            thread = threading.Thread(
+                target=self.read_worker, args=(index,), name=f"worker-{index}"
+            )
+            thread.start()
+            self.readers.append(thread)
+        self.add_links()
+        self.broadcast(("start",))
+        if self.changes:
+            changes_thread = threading.Thread(
+                target=self.handle_changes, name="handle-changes"
+            )
+            changes_thread.start()
+        time.sleep(self.end_time / 1000)
+        self.final_routes()
+        if self.changes:
+            changes_thread.join()
+        self.broadcast(("stop",))
+        for thread in self.readers:
+            thread.join()
+        for connection in self.connections:
+            connection.close()
+        self.listener.close()
+        return [self.stats.get_nowait() for _ in range(self.stats.qsize())]
+
+    def get_transport_string(self, worker_stats):
+        """
+        Create a string with the routing messages and the UDP traffic of the
+        workers, and the time spent encoding and decoding datagrams.
+        """
+        messages = sum(m for s in worker_stats for m, _ in s["routers"].values())
+        content = sum(b for s in worker_stats for _, b in s["routers"].values())
+        sent = sum(s["datagrams_sent"] for s in worker_stats)
+        sent_bytes = sum(s["bytes_sent"] for s in worker_stats)
+        encode = sum(s["encode_seconds"] for s in worker_stats)
+        decode = sum(s["decode_seconds"] for s in worker_stats)
+        oversized = sum(s["oversized"] for s in worker_stats)
+        return "\n".join(
+            [
+                f"Routing messages: {messages} messages, {content} bytes",
+                f"UDP: {sent} datagrams, {sent_bytes} bytes sent, "
+                f"{sum(s['datagrams_received'] for s in worker_stats)} received, "
+                f"{oversized} oversized",
+                f"Encoding: {encode * 1000:.1f} ms "
+                f"({encode * 1e6 / max(sent, 1):.1f} us/datagram), "
+                f"decoding: {decode * 1000:.1f} ms",
+            ]
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a network simulation with routers in separate processes "
+        "linked over UDP."
+    )
+    subparsers = parser.add_subparsers(dest="role", required=True)
+    run_parser = subparsers.add_parser(
+        "run", help="Coordinate a simulation, starting local workers by default."
+    )
+    run_parser.add_argument(
+        "net_json_path",
+        type=str,
+        help="Path to the network simulation configuration file (JSON).",
+    )
+    run_parser.add_argument(
+        "router",
+        type=str,
+        choices=["DV", "LS", "PV"],
+        nargs="?",
+        default=None,
+        help="DV for DVrouter, LS for LSrouter and PV for PVrouter. If not provided, "
+        "Router is used.",
+    )
+    run_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: one per router).",
+    )
+    run_parser.add_argument(
+        "--listen",
+        type=str,
+        default="127.0.0.1:0",
+        metavar="HOST:PORT",
+        help="Address to accept worker connections on (default: 127.0.0.1, any "
+        "free port).",
+    )
+    run_parser.add_argument(
+        "--no-spawn",
+        action="store_true",
+        help="Do not start local workers, wait for workers started by hand.",
+    )
+    run_parser.add_argument(
+        "--probe",
+        type=str,
+        choices=list(Client.PROBE_STRATEGIES),
+        default=None,
+        help="Traceroute probing strategy of the clients (default: full mesh).",
+    )
+    run_parser.add_argument(
+        "--probe-count",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Clients probed per period by the random and round_robin strategies.",
+    )
+    run_parser.add_argument(
+        "--accept-timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Time to wait for each worker to connect (default: 60 s, or no limit "
+        "with --no-spawn).",
+    )
+    run_parser.add_argument(
+        "-o",
+        "--router-option",
+        type=str,
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Keyword argument for the router constructor, VALUE parsed as JSON if "
+        "possible. Can be repeated.",
+    )
+    run_parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print the routing messages, UDP traffic and encoding time.",
+    )
+    worker_parser = subparsers.add_parser("worker", help="Run a worker process.")
+    worker_parser.add_argument(
+        "--coordinator",
+        type=str,
+        required=True,
+        metavar="HOST:PORT",
+        help="Address of the coordinator.",
+    )
+    worker_parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Address to bind the UDP socket to, reachable from the other workers.",
+    )
+    for subparser in (run_parser, worker_parser):
+        subparser.add_argument(
+            "--authkey",
+            type=str,
+            default=DEFAULT_AUTHKEY,
+            help="Shared key authenticating the workers.",
+        )
+    args = parser.parse_args()
+
+    if args.role == "worker":
+        Worker(parse_address(args.coordinator), args.authkey, args.host).run()
+        return
+
+    router_options = {}
+    for option in args.router_option:
+        key, _, value = option.partition("=")
+        try:
+            router_options[key] = json.loads(value)
+        except json.JSONDecodeError:
+            router_options[key] = value
+
+    probing = {}
+    if args.probe:
+        probing["strategy"] = args.probe
+    if args.probe_count:
+        probing["count"] = args.probe_count
+
+    coordinator = Coordinator(
+        args.net_json_path,
+        args.router,
+        workers=args.workers,
+        listen=parse_address(args.listen),
+        authkey=args.authkey,
+        router_options=router_options,
+        probing=probing,
+        accept_timeout=args.accept_timeout or (None if args.no_spawn else 60),
+    )
+    processes = []
+    if args.no_spawn:
+        host, port = coordinator.address
+        sys.stdout.write(
+            f"Waiting for {coordinator.num_workers} workers on {host}:{port}\n"
+        )
+        sys.stdout.flush()
+    else:
+        for _ in range(coordinator.num_workers):
+            processes.append(subprocess.Popen(coordinator.worker_command()))
+    worker_stats = coordinator.run()
+    for process in processes:
+        process.wait()
+    sys.stdout.write("\n" + coordinator.get_route_string() + "\n")
+    if coordinator.silent_events:
+        detections = {}
+        for stats in worker_stats:
+            detections.update(stats["detections"])
+        sys.stdout.write("\n" + coordinator.get_detection_string(detections) + "\n")
+    if args.stats:
+        sys.stdout.write("\n" + coordinator.get_transport_string(worker_stats) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+import argparse
+import json
+import sys
+import time
+from DVrouter import DVrouter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Distance cap of --random topologies: their distances reach about 55 with 5000
+# routers, far above DVrouter.INFINITY, and 127 still fits uint8 matrices
+RANDOM_INFINITY = 127
+
+
+class DVAnalysis:
+    """
+    The DVAnalysis class runs the distance vector computation of DVrouter for all
+    routers at once, in synchronous rounds.
+
+    In every round, each router recomputes its distance vector from the vectors its
+    neighbors had at the end of the previous round, with the same rule as
+    `DVrouter.update_distance_vector`: direct links first, then the cheapest
+    neighbor cost plus advertised distance, capped at `INFINITY`. A round is one
+    vectorized min-plus product over the links, so networks with thousands of
+    routers converge in seconds, without threads or timers.
+
+    Distances are kept in a (routers x nodes) matrix of the smallest unsigned type
+    that holds twice `infinity` (uint8 up to 127) and next hops in a matrix of node
+    indices. Clients are destinations but do not advertise. Only routers with a
+    neighbor whose vector changed are recomputed in a round.
+
+    Parameters
+    ----------
+    routers, clients
+        The addresses of the routers and the clients.
+    links
+        Scenario link entries [addr1, addr2, p1, p2, c12, c21, ...].
+    split_horizon, poison_reverse
+        Whether a router advertises the routes it learned from a neighbor back to
+        that neighbor. With either option it does not, and the neighbor sees no
+        usable route. `poison_reverse` only changes the number of advertised
+        entries.
+    infinity
+        The distance cap, `DVrouter.INFINITY` by default. Pairs farther apart than
+        the cap are unreachable, as they are for DVrouter.
+    max_rounds
+        Maximum number of rounds to run for one convergence.
+    episode_rounds
+        A destination counts as a count-to-infinity episode when its distance
+        increases at some router in at least this many rounds of one convergence.
+    """
+
+    def __init__(
+        self,
+        routers,
+        clients,
+        links,
+        split_horizon=True,
+        poison_reverse=True,
+        infinity=DVrouter.INFINITY,
+        max_rounds=1000,
+        episode_rounds=3,
+    ):
+        if np is None:
+            raise ImportError("dv_analysis requires NumPy (pip install numpy)")
+        self.routers = list(routers)
+        self.nodes = self.routers + list(clients)
+        self.index = {addr: i for i, addr in enumerate(self.nodes)}
+        self.split_horizon = split_horizon or poison_reverse
+        self.poison_reverse = poison_reverse
+        self.infinity = infinity
+        self.max_rounds = max_rounds
+        self.episode_rounds = episode_rounds
+        num_routers, num_nodes = len(self.routers), len(self.nodes)
+        hop_type = np.int16 if num_nodes < 2**15 else np.int32
+        # A cost plus a distance, both capped at `infinity`, must not overflow
+        if infinity <= 127:
+            self.dtype = np.uint8
+        elif infinity <= 2**15 - 1:
+            self.dtype = np.uint16
+        else:
+            self.dtype = np.uint32
+        self.distances = np.full((num_routers, num_nodes), infinity, dtype=self.dtype)
+        self.distances[np.arange(num_routers), np.arange(num_routers)] = 0
+        self.next_hops = np.full((num_routers, num_nodes), -1, dtype=hop_type)
+        self.active = np.ones(num_routers, dtype=bool)
+        self.adjacency = [{} for _ in self.nodes]  # {neighbor index: cost}
+        for params in links:
+            self.add_link(params)
+
+    @classmethod
+    def from_scenario(cls, net_json, **kwargs):
+        """Create the analysis of a parsed scenario and return it with its changes."""
+        analysis = cls(
+            net_json["routers"], net_json["clients"], net_json["links"], **kwargs
+        )
+        changes = sorted(net_json.get("changes", []), key=lambda c: c[0])
+        return analysis, changes
+
+    def add_link(self, params):
+        """Bring up the link of a scenario link entry."""
+        i, j = self.index[params[0]], self.index[params[1]]
+        self.adjacency[i][j] = params[4]
+        self.adjacency[j][i] = params[5]
+        self._touch(i, j)
+
+    def remove_link(self, addr1, addr2):
+        """Take down the link between `addr1` and `addr2`."""
+        i, j = self.index[addr1], self.index[addr2]
+        self.adjacency[i].pop(j, None)
+        self.adjacency[j].pop(i, None)
+        self._touch(i, j)
+
+    def _touch(self, *nodes):
+        """Mark routers among `nodes` for recomputation in the next round."""
+        for node in nodes:
+            if node < len(self.routers):
+                self.active[node] = True
+
+    def _slots(self, rows):
+        """
+        Order routers `rows` by decreasing number of router neighbors and return
+        them with their neighbor and cost arrays, one column per neighbor slot.
+        Router neighbors come first, in link order, so the routers that have a
+        router neighbor in slot k are a prefix of the returned rows.
+        """
+        num_routers = len(self.routers)
+        router_degree = np.array(
+            [sum(n < num_routers for n in self.adjacency[r]) for r in rows], dtype=int
+        )
+        order = np.argsort(-router_degree, kind="stable")
+        rows, router_degree = rows[order], router_degree[order]
+        degree = max((len(self.adjacency[r]) for r in rows), default=0)
+        neighbors = np.full((len(rows), degree), -1, dtype=np.int64)
+        costs = np.zeros((len(rows), degree), dtype=self.dtype)
+        for k, r in enumerate(rows):
+            links = sorted(self.adjacency[r].items(), key=lambda l: l[0] >= num_routers)
+            for slot, (n, cost) in enumerate(links):
+                neighbors[k, slot] = n
+                costs[k, slot] = min(cost, self.infinity)
+        prefixes = [int(np.count_nonzero(router_degree > k)) for k in range(degree)]
+        return rows, neighbors, costs, prefixes
+
+    def step(self):
+        """
+        Run one synchronous round. Return the indices of the routers whose vector
+        changed and the matrix of entries that increased.
+        """
+        num_routers, num_nodes = self.distances.shape
+        infinity = self.infinity
+        rows = np.nonzero(self.active)[0]
+        if len(rows) == 0:
+            return rows, np.zeros((0, num_nodes), dtype=bool)
+        rows, neighbors, costs, prefixes = self._slots(rows)
+        new = np.full((len(rows), num_nodes), infinity, dtype=self.dtype)
+        new_hops = np.full((len(rows), num_nodes), -1, dtype=self.next_hops.dtype)
+        local = np.arange(len(rows))
+        new[local, rows] = 0
+
+        # Direct neighbors
+        for slot in range(neighbors.shape[1]):
+            valid = neighbors[:, slot] >= 0
+            k, n = local[valid], neighbors[valid, slot]
+            new[k, n] = costs[valid, slot]
+            new_hops[k, n] = n
+
+        # Routes through neighbor routers, in neighbor order (first minimum wins).
+        # Costs and distances are at most `infinity`, so sums fit in the dtype.
+        for slot, m in enumerate(prefixes):
+            if m == 0:
+                break
+            n = neighbors[:m, slot]
+            candidate = self.distances[n]
+            if self.split_horizon:
+                candidate[self.next_hops[n] == rows[:m, None]] = infinity
+            candidate += costs[:m, slot, None]
+            np.minimum(candidate, infinity, out=candidate)
+            better = candidate < new[:m]
+            np.copyto(new[:m], candidate, where=better)
+            better &= candidate < infinity
+            np.copyto(new_hops[:m], n[:, None].astype(new_hops.dtype), where=better)
+
+        old = self.distances[rows]
+        changed_rows = np.any(new != old, axis=1) | np.any(
+            new_hops != self.next_hops[rows], axis=1
+        )
+        increased = (new > old)[changed_rows]
+        self.distances[rows] = new
+        self.next_hops[rows] = new_hops
+        changed = rows[changed_rows]
+
+        # Routers next to a changed router recompute in the next round
+        self.active[:] = False
+        for r in changed:
+            for n in self.adjacency[r]:
+                if n < num_routers:
+                    self.active[n] = True
+        return changed, increased
+
+    def converge(self):
+        """
+        Run rounds until no vector changes. Return the number of rounds, the
+        messages and advertised entries sent per round, and the count-to-infinity
+        episodes: destinations whose distance increased at some router in at least
+        `episode_rounds` rounds.
+        """
+        rounds = 0
+        messages, entries = [], []
+        increase_rounds = np.zeros(len(self.nodes), dtype=np.int64)
+        while rounds < self.max_rounds:
+            changed, increased = self.step()
+            if len(changed) == 0:
+                break
+            rounds += 1
+            # With triggered updates, each changed router sends its vector on
+            # every link (clients included, as DVrouter does)
+            degree = np.array([len(self.adjacency[r]) for r in changed])
+            finite = np.count_nonzero(self.distances[changed] < self.infinity, axis=1)
+            messages.append(int(degree.sum()))
+            entries.append(int((degree * finite).sum()))
+            increase_rounds += np.any(increased, axis=0)
+        counted = np.nonzero(increase_rounds >= self.episode_rounds)[0]
+        episodes = [self.nodes[d] for d in counted]
+        return {
+            "rounds": rounds,
+            "converged": rounds < self.max_rounds,
+            "messages": messages,
+            "entries": entries,
+            "count_to_infinity": episodes,
+            "max_increase_rounds": int(increase_rounds.max(initial=0)),
+        }
+
+    def apply_change(self, change):
+        """Apply one scenario change [time, target, "up" or "down"]."""
+        _, target, kind = change
+        if kind == "up":
+            self.add_link(target)
+        elif kind == "down":
+            self.remove_link(target[0], target[1])
+
+    def replay(self, changes):
+        """
+        Converge from a cold start, then after each change. Return one result dict
+        (see `converge`) per phase, with the change and the run time added.
+        """
+        results = []
+        for change in [None] + list(changes):
+            start = time.time()
+            if change is not None:
+                self.apply_change(change)
+            result = self.converge()
+            result["change"] = change
+            result["seconds"] = time.time() - start
+            results.append(result)
+        return results
+
+    def unreachable(self):
+        """Return the number of (router, destination) pairs without a route."""
+        return int(np.count_nonzero(self.distances >= self.infinity))
+
+
+def random_scenario(size, degree=4, seed=0):
+    """Return a scenario with `size` routers, one client each, and no changes."""
+    from benchmark import generate_topology
+
+    graph = generate_topology(size, degree, seed)
+    links = [
+        [a, b, 0, 0, cost, cost] for a in graph for b, cost in graph[a].items() if a < b
+    ]
+    clients = [f"c{i}" for i in range(size)]
+    links += [[client, f"r{i}", 0, 0, 1, 1] for i, client in enumerate(clients)]
+    return {"routers": list(graph), "clients": clients, "links": links}
+
+
+def format_results(results):
+    """Create a string with one line per convergence phase."""
+    lines = []
+    for result in results:
+        change = result["change"]
+        if change is None:
+            label = "start"
+        else:
+            label = f"t={change[0]} {change[2]} {change[1][0]}-{change[1][1]}"
+        episodes = result["count_to_infinity"]
+        lines.append(
+            f"{label}: {result['rounds']} rounds"
+            f"{'' if result['converged'] else ' (not converged)'}, "
+            f"{sum(result['messages'])} messages, {sum(result['entries'])} entries, "
+            f"{len(episodes)} count-to-infinity episodes"
+            f"{' ' + str(episodes[:10]) if episodes else ''}, "
+            f"{result['seconds']:.2f} s"
+        )
+        lines.append(f"  messages per round: {result['messages']}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Analyze DVrouter convergence with synchronous vectorized rounds."
+    )
+    parser.add_argument(
+        "net_json_path",
+        type=str,
+        nargs="?",
+        help="Path to the network simulation configuration file (JSON).",
+    )
+    parser.add_argument(
+        "--random",
+        type=int,
+        default=None,
+        metavar="SIZE",
+        help="Analyze a random topology with SIZE routers instead of a scenario.",
+    )
+    parser.add_argument(
+        "--no-split-horizon",
+        action="store_true",
+        help="Disable split horizon and poison reverse.",
+    )
+    parser.add_argument(
+        "--infinity",
+        type=int,
+        default=None,
+        metavar="N",
+        help=f"Distance cap (default: {DVrouter.INFINITY} as in DVrouter, "
+        f"{RANDOM_INFINITY} with --random).",
+    )
+    parser.add_argument(
+        "--max-rounds",
+        type=int,
+        default=1000,
+        help="Maximum number of rounds per convergence.",
+    )
+    parser.add_argument(
+        "--json",
+        type=str,
+        default=None,
+        help="Also write the results to this file (JSON).",
+    )
+    args = parser.parse_args()
+    infinity = args.infinity or DVrouter.INFINITY
+    if args.random is not None:
+        net_json = random_scenario(args.random)
+        infinity = args.infinity or RANDOM_INFINITY
+    elif args.net_json_path:
+        with open(args.net_json_path, "r") as f:
+            net_json = json.load(f)
+    else:
+        parser.error("a scenario path or --random SIZE is required")
+
+    analysis, changes = DVAnalysis.from_scenario(
+        net_json,
+        split_horizon=not args.no_split_horizon,
+        poison_reverse=not args.no_split_horizon,
+        infinity=infinity,
+        max_rounds=args.max_rounds,
+    )
+    results = analysis.replay(changes)
+    sys.stdout.write(format_results(results) + "\n")
+    unreachable = analysis.unreachable()
+    pairs = analysis.distances.size
+    sys.stdout.write(
+        f"Unreachable (router, destination) pairs: {unreachable} of {pairs} "
+        f"({100 * (pairs - unreachable) / pairs:.1f}% reachable with infinity "
+        f"{infinity})\n"
+    )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import argparse
+import array
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from address import AddressTable, addresses
+
+MAGIC = b"FIB2"
+# Magic, number of slots, destinations, ports per destination, names size
+HEADER = struct.Struct("<4sIIII")
+SLOT_HEADER = struct.Struct("<QdI4x")  # sequence, update time (ms), entries
+SEQUENCE = struct.Struct("<Q")
+SLOT_INFO = struct.Struct("<dI")  # The rest of the slot header
+
+
+def _align(size, alignment=8):
+    return -(-size // alignment) * alignment
+
+
+class FibExport:
+    """
+    The FibExport class publishes the forwarding tables of the routers of a
+    simulation into a memory-mapped file, one fixed-size slot per router.
+
+    A slot holds `width` ports for every destination, in the order of
+    `destinations`, as C ints: the primary port of the forwarding table, then the
+    other equal-cost ports of ECMP routers, padded with `AddressTable.MISSING`. Each
+    router thread writes only
+    its own slot, so writers take no lock. Readers in other processes use the
+    sequence number of the slot as a seqlock: it is odd while the slot is being
+    written and increases by 2 per update, so a reader retries whenever it changed
+    during its copy. Neither side ever waits for the other.
+
+    The file starts with a header and the JSON lists of the router and destination
+    addresses, so FibReader needs nothing else to decode it.
+
+    Parameters
+    ----------
+    path
+        The file to create, e.g. under /dev/shm to keep it in memory.
+    routers
+        The addresses of the routers, one slot each, in slot order.
+    destinations
+        The addresses of the network whose routes are exported, e.g. its routers
+        and clients. Other addresses of the registry are not exported.
+    width
+        The number of ports exported per destination, at least the largest number
+        of equal-cost ports of a router. 1 exports the primary port only.
+    registry
+        The AddressRegistry that assigns the IDs of the forwarding tables. Defaults
+        to `addresses`.
+    """
+
+    def __init__(self, path, routers, destinations, width=1, registry=None):
+        self.path = path
+        self.routers = list(routers)
+        self.destinations = list(destinations)
+        self.width = width
+        registry = registry if registry is not None else addresses
+        self.ids = [registry.intern(addr) for addr in self.destinations]
+        # Networks intern their addresses together, so the IDs are usually a range
+        first = self.ids[0] if self.ids else 0
+        self.id_range = self.ids == list(range(first, first + len(self.ids)))
+        self.slots = {addr: i for i, addr in enumerate(self.routers)}
+        names = json.dumps(
+            {"routers": self.routers, "destinations": self.destinations}
+        ).encode()
+        self.slots_offset = _align(HEADER.size + len(names))
+        self.entries_size = 4 * len(self.destinations) * width
+        self.slot_size = _align(SLOT_HEADER.size + self.entries_size)
+        size = self.slots_offset + self.slot_size * len(self.routers)
+        with open(path, "wb") as f:
+            f.truncate(max(size, 1))
+        self.file = open(path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), max(size, 1))
+        self.map[: HEADER.size] = HEADER.pack(
+            MAGIC, len(self.routers), len(self.destinations), width, len(names)
+        )
+        self.map[HEADER.size : HEADER.size + len(names)] = names
+        self.empty = array.array("i", [AddressTable.MISSING]).tobytes() * (
+            len(self.destinations) * width
+        )
+        padding = bytes(self.slot_size - SLOT_HEADER.size - self.entries_size)
+        for slot in range(len(self.routers)):
+            offset = self.slot_offset(slot)
+            self.map[offset : offset + self.slot_size] = (
+                bytes(SLOT_HEADER.size) + self.empty + padding
+            )
+
+    def slot_offset(self, slot):
+        """Return the offset of slot `slot` in the file."""
+        return self.slots_offset + slot * self.slot_size
+
+    def encode(self, table, multipath=None):
+        """
+        Return the slot entries of `table`, an AddressTable or a dict, with the
+        equal-cost ports of `multipath` {address ID: [ports]} after the primary port
+        of each destination.
+        """
+        if not isinstance(table, AddressTable):
+            table = AddressTable(table)
+        missing = AddressTable.MISSING
+        if self.id_range:
+            first = self.ids[0] if self.ids else 0
+            primary = table.values_array[first : first + len(self.ids)]
+            primary = array.array("i", primary)  # A copy, whatever the typecode
+            primary.extend([missing] * (len(self.ids) - len(primary)))
+        else:
+            primary = array.array("i", [table.get_id(i, missing) for i in self.ids])
+        if self.width == 1:
+            return primary.tobytes()
+        entries = array.array("i", self.empty)
+        entries[:: self.width] = primary
+        for column, addr_id in enumerate(self.ids):
+            ports = (multipath or {}).get(addr_id)
+            if not ports:
+                continue
+            others = [port for port in ports if port != primary[column]]
+            others = others[: self.width - 1]
+            start = column * self.width + 1
+            entries[start : start + len(others)] = array.array("i", others)
+        return entries.tobytes()
+
+    def publish(self, router, entries, count, update_ms):
+        """
+        Write the encoded `entries` (see `encode`) of `router` with its `count` of
+        routes and the time `update_ms` of the update, read from the clock of the
+        router. Only the thread of `router` may call this for its slot.
+        """
+        offset = self.slot_offset(self.slots[router])
+        (sequence,) = SEQUENCE.unpack_from(self.map, offset)
+        SEQUENCE.pack_into(self.map, offset, sequence + 1)
+        start = offset + SLOT_HEADER.size
+        self.map[start : start + self.entries_size] = entries
+        SLOT_INFO.pack_into(self.map, offset + SEQUENCE.size, update_ms, count)
+        SEQUENCE.pack_into(self.map, offset, sequence + 2)
+
+    def close(self):
+        """Unmap and close the file, which stays on disk for readers."""
+        self.map.close()
+        self.file.close()
+
+
+class FibReader:
+    """
+    The FibReader class reads the forwarding tables published by a FibExport,
+    possibly while the simulation is running, without taking any lock.
+
+    Parameters
+    ----------
+    path
+        The file written by FibExport.
+    max_retries
+        Number of times a read is retried while the slot keeps changing before
+        RuntimeError is raised.
+    """
+
+    def __init__(self, path, max_retries=1000):
+        self.max_retries = max_retries
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, num_routers, num_destinations, width, names_size = HEADER.unpack_from(
+            self.map
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a forwarding table export")
+        self.width = width
+        names = json.loads(self.map[HEADER.size : HEADER.size + names_size])
+        self.routers = names["routers"]
+        self.destinations = names["destinations"]
+        self.slots = {addr: i for i, addr in enumerate(self.routers)}
+        self.slots_offset = _align(HEADER.size + names_size)
+        self.entries_size = 4 * num_destinations * width
+        self.slot_size = _align(SLOT_HEADER.size + self.entries_size)
+
+    def read_ids(self, router):
+        """
+        Return a consistent snapshot of the slot of `router`: its sequence number,
+        update time (ms, from the clock of the simulation, 0 if never published) and
+        an array of `width` ports per destination, in the order of `destinations`.
+        """
+        offset = self.slots_offset + self.slots[router] * self.slot_size
+        start = offset + SLOT_HEADER.size
+        for _ in range(self.max_retries):
+            (sequence,) = SEQUENCE.unpack_from(self.map, offset)
+            if sequence % 2:
+                time.sleep(0)
+                continue
+            data = self.map[start : start + self.entries_size]
+            _, update_ms, _ = SLOT_HEADER.unpack_from(self.map, offset)
+            (after,) = SEQUENCE.unpack_from(self.map, offset)
+            if after == sequence:
+                return sequence, update_ms, array.array("i", data)
+        raise RuntimeError(f"Could not read a consistent table for {router}")
+
+    def read(self, router):
+        """Return the sequence number, update time and routes {destination: port}."""
+        sequence, update_ms, ports = self.read_ids(router)
+        table = {
+            self.destinations[i]: port
+            for i, port in enumerate(ports[:: self.width])
+            if port != AddressTable.MISSING
+        }
+        return sequence, update_ms, table
+
+    def read_ports(self, router):
+        """
+        Return the sequence number, update time and routes {destination: [ports]},
+        the primary port first, followed by the other equal-cost ports.
+        """
+        sequence, update_ms, ports = self.read_ids(router)
+        table = {}
+        for i, destination in enumerate(self.destinations):
+            entry = ports[i * self.width : (i + 1) * self.width]
+            if entry[0] != AddressTable.MISSING:
+                table[destination] = [p for p in entry if p != AddressTable.MISSING]
+        return sequence, update_ms, table
+
+    def read_all(self):
+        """Return {router: {destination: port}} for every router."""
+        return {router: self.read(router)[2] for router in self.routers}
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Print the forwarding tables exported by a running simulation."
+    )
+    parser.add_argument("path", type=str, help="Path to the export file.")
+    parser.add_argument(
+        "--router",
+        type=str,
+        action="append",
+        default=None,
+        help="Only print this router's table. Can be repeated.",
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Print the tables again every SECONDS, until interrupted.",
+    )
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path} does not exist")
+
+    with FibReader(args.path) as reader:
+        routers = args.router or reader.routers
+        unknown = [router for router in routers if router not in reader.slots]
+        if unknown:
+            parser.error(f"unknown routers {unknown}, exported: {reader.routers}")
+        while True:
+            for router in routers:
+                sequence, update_ms, table = reader.read_ports(router)
+                # Multipath destinations show all their ports
+                table = {
+                    dest: ports if len(ports) > 1 else ports[0]
+                    for dest, ports in table.items()
+                }
+                sys.stdout.write(f"{router} (version {sequence // 2}): {table}\n")
+            sys.stdout.flush()
+            if args.watch is None:
+                break
+            time.sleep(args.watch)
+            sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,215 @@
 import _thread
+import collections
+import random
 import sys
-import queue
+import threading
 import time
 
 
+class TxQueue:
+    """
+    The TxQueue class models the transmit side of one direction of a link: a buffer
+    of packets waiting to be serialized onto the wire at `bandwidth` bytes/s.
+
+    Without a bandwidth, packets leave immediately and the buffer never fills, which
+    is the behavior of the original fixed-latency link.
+
+    Parameters
+    ----------
+    bandwidth
+        Serialization rate in bytes per second, or None for infinite bandwidth.
+    buffer_size
+        Maximum number of packets queued or being serialized, or None for unbounded.
+    policy
+        "droptail" drops arrivals when the buffer is full. "red" additionally drops
+        arrivals early with a probability that grows with the average queue length.
+    red
+        Optional dict of RED parameters "min_th", "max_th" (packets), "max_p" and
+        "weight" (EWMA weight of the average queue length).
+    clock
+        Function returning the current time in seconds.
+    """
+
+    POLICIES = ("droptail", "red")
+
+    def __init__(
+        self,
+        bandwidth=None,
+        buffer_size=None,
+        policy="droptail",
+        red=None,
+        clock=time.time,
+    ):
+        if policy not in TxQueue.POLICIES:
+            raise ValueError(f"Unknown queue policy {policy!r}")
+        self.bandwidth = bandwidth
+        self.buffer_size = buffer_size
+        self.policy = policy
+        red = red or {}
+        limit = buffer_size if buffer_size else 64
+        self.red_min_th = red.get("min_th", limit / 4)
+        self.red_max_th = red.get("max_th", 3 * limit / 4)
+        self.red_max_p = red.get("max_p", 0.1)
+        self.red_weight = red.get("weight", 0.02)
+        # Only RED draws random numbers, and seeding a generator is not free
+        self.rng = random.Random(red.get("seed")) if policy == "red" else None
+        self.lock = threading.Lock()
+        self.departures = collections.deque()
+        self.busy_until = 0.0
+        self.busy_ms = 0.0
+        self.avg_queue = 0.0
+        self.clock = clock
+        self.created_ms = clock() * 1000
+        self.sent = 0
+        self.delivered = 0
+        self.dropped_tail = 0
+        self.dropped_red = 0
+        self.bytes_sent = 0
+        self.max_occupancy = 0
+
+    def _occupancy(self, now_ms):
+        """Number of packets queued or being serialized at `now_ms`."""
+        while self.departures and self.departures[0] <= now_ms:
+            self.departures.popleft()
+        return len(self.departures)
+
+    def occupancy(self):
+        """Current number of packets queued or being serialized."""
+        with self.lock:
+            return self._occupancy(self.clock() * 1000)
+
+    def _red_drop(self, occupancy):
+        """Decide whether RED drops an arriving packet."""
+        self.avg_queue += self.red_weight * (occupancy - self.avg_queue)
+        if self.avg_queue < self.red_min_th:
+            return False
+        if self.avg_queue >= self.red_max_th:
+            return True
+        p = (
+            self.red_max_p
+            * (self.avg_queue - self.red_min_th)
+            / (self.red_max_th - self.red_min_th)
+        )
+        return self.rng.random() < p
+
+    def enqueue(self, size, now_ms):
+        """
+        Queue a packet of `size` bytes arriving at `now_ms`. Return the time (in ms)
+        at which it has been fully serialized, or None if it was dropped.
+        """
+        with self.lock:
+            occupancy = self._occupancy(now_ms)
+            if self.policy == "red" and self._red_drop(occupancy):
+                self.dropped_red += 1
+                return None
+            if self.buffer_size is not None and occupancy >= self.buffer_size:
+                self.dropped_tail += 1
+                return None
+            self.sent += 1
+            self.bytes_sent += size
+            if not self.bandwidth:
+                return now_ms
+            tx_ms = size * 1000 / self.bandwidth
+            departure = max(now_ms, self.busy_until) + tx_ms
+            self.busy_until = departure
+            self.busy_ms += tx_ms
+            self.departures.append(departure)
+            self.max_occupancy = max(self.max_occupancy, occupancy + 1)
+            return departure
+
+    def record_delivery(self):
+        """Count one packet delivered to the far end of the link."""
+        with self.lock:
+            self.delivered += 1
+
+    def stats(self):
+        """Return a dict with counters, utilization and queue occupancy."""
+        with self.lock:
+            now_ms = self.clock() * 1000
+            elapsed = max(now_ms - self.created_ms, 1e-9)
+            busy = self.busy_ms - max(self.busy_until - now_ms, 0)
+            return {
+                "sent": self.sent,
+                "delivered": self.delivered,
+                "dropped_tail": self.dropped_tail,
+                "dropped_red": self.dropped_red,
+                "bytes_sent": self.bytes_sent,
+                "utilization": busy / elapsed if self.bandwidth else 0.0,
+                "queue_occupancy": self._occupancy(now_ms),
+                "max_queue_occupancy": self.max_occupancy,
+            }
+
+
+class Impairment:
+    """
+    The Impairment class models random loss, jitter and duplication on one direction
+    of a link, as seen on a WAN path.
+
+    Each packet is lost with probability `loss`. Otherwise it is delivered twice with
+    probability `duplicate`, and each copy is delayed by an extra time drawn
+    uniformly between 0 and `jitter`, so packets sent close together may arrive out
+    of order. The draws come from a generator seeded with `seed`, so a run makes the
+    same draws for the same sequence of packets.
+
+    Parameters
+    ----------
+    loss
+        Probability that a packet is lost.
+    jitter
+        Maximum extra delay of a packet, in ms.
+    duplicate
+        Probability that a packet that is not lost is delivered twice.
+    seed
+        Seed of the random generator (any value accepted by `random.Random`).
+    """
+
+    def __init__(self, loss=0, jitter=0, duplicate=0, seed=None):
+        self.loss = loss
+        self.jitter = jitter
+        self.duplicate = duplicate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.packets = 0
+        self.lost = 0
+        self.duplicated = 0
+        self.jitter_ms = 0.0
+
+    def delays(self):
+        """
+        Draw the fate of one packet. Return the extra delays (in ms) of the copies to
+        deliver: none if the packet is lost, two if it is duplicated.
+        """
+        with self.lock:
+            self.packets += 1
+            if self.loss and self.rng.random() < self.loss:
+                self.lost += 1
+                return []
+            copies = 1
+            if self.duplicate and self.rng.random() < self.duplicate:
+                self.duplicated += 1
+                copies = 2
+            if not self.jitter:
+                return [0.0] * copies
+            delays = [self.rng.uniform(0, self.jitter) for _ in range(copies)]
+            self.jitter_ms += sum(delays)
+            return delays
+
+    def stats(self):
+        """Return a dict with the packet, loss, duplication and jitter counters."""
+        with self.lock:
+            delivered = self.packets - self.lost + self.duplicated
+            return {
+                "packets": self.packets,
+                "lost": self.lost,
+                "duplicated": self.duplicated,
+                "mean_jitter_ms": self.jitter_ms / delivered if delivered else 0.0,
+            }
+
+
 class Link:
     """
     The Link class represents link between two routers/clients handles sending and
-    receiving packets using threadsafe queues.
+    receiving packets using threadsafe deques.
 
     Parameters
     ----------
@@ -15,43 +217,143 @@ class Link:
         The addresses of the two endpoints of the link.
     l12, l21
         The latencies (in ms) in the e1->e2 and e2->e1 directions, respectively.
+    bandwidth
+        Optional bandwidth in bytes per second, either one value for both directions
+        or a pair [e1->e2, e2->e1]. Packets are serialized one at a time before the
+        propagation latency starts.
+    buffer_size
+        Optional maximum number of packets waiting to be serialized, either one value
+        or a pair. Packets arriving at a full buffer are dropped.
+    queue_policy
+        "droptail" (default) or "red". See TxQueue.
+    red
+        Optional RED parameters. See TxQueue.
+    loss, jitter, duplicate
+        Optional loss probability, maximum jitter (in latency units, like `l12`) and
+        duplication probability, each either one value or a pair. See Impairment.
+    seed
+        Seed of the impairment generators. Each direction derives its own seed from
+        it and the endpoint addresses.
+    clock
+        Function returning the current time in seconds, e.g. the Network's clock.
+    animate
+        Optional function called as `animate(packet, src, dst, latency)` when a
+        packet starts crossing the link, e.g. by the visualization.
+    profiler
+        Optional Profiler that the packet delivery threads run under.
     """
 
-    def __init__(self, e1, e2, l12, l21, latency):
-        self.q12 = queue.Queue()
-        self.q21 = queue.Queue()
+    def __init__(
+        self,
+        e1,
+        e2,
+        l12,
+        l21,
+        latency,
+        bandwidth=None,
+        buffer_size=None,
+        queue_policy="droptail",
+        red=None,
+        loss=None,
+        jitter=None,
+        duplicate=None,
+        seed=None,
+        clock=time.time,
+        animate=None,
+        profiler=None,
+    ):
+        # Deque appends and pops are atomic, which is all a single reader needs
+        self.q12 = collections.deque()
+        self.q21 = collections.deque()
         self.l12 = l12 * latency
         self.l21 = l21 * latency
         self.latency_multiplier = latency
         self.e1 = e1
         self.e2 = e2
+        b12, b21 = Link._per_direction(bandwidth)
+        s12, s21 = Link._per_direction(buffer_size)
+        self.tx12 = TxQueue(b12, s12, queue_policy, red, clock)
+        self.tx21 = TxQueue(b21, s21, queue_policy, red, clock)
+        self.has_queue_model = bandwidth is not None or buffer_size is not None
+        self.has_impairments = any(
+            value is not None for value in (loss, jitter, duplicate)
+        )
+        self.impair12 = self.impair21 = None
+        if self.has_impairments:
+            loss12, loss21 = Link._per_direction(loss or 0)
+            jitter12, jitter21 = Link._per_direction(jitter or 0)
+            dup12, dup21 = Link._per_direction(duplicate or 0)
+            self.impair12 = Impairment(
+                loss12, jitter12 * latency, dup12, f"{seed}/{e1}>{e2}"
+            )
+            self.impair21 = Impairment(
+                loss21, jitter21 * latency, dup21, f"{seed}/{e2}>{e1}"
+            )
+        self.silent = False  # Whether the link silently drops every packet
+        self.silent_dropped = 0
+        self.in_flight = set()  # Packets sleeping in _send_helper threads
+        self.clock = clock
+        self.animate = animate
+        self.profiler = profiler
 
-    def _send_helper(self, packet, src):
+    @staticmethod
+    def _per_direction(value):
+        """Split an optional scalar-or-pair option into its two directions."""
+        if isinstance(value, (list, tuple)):
+            return value[0], value[1]
+        return value, value
+
+    def _send_helper(self, packet, src, departure):
         """
-        Run in a separate thread and send packet on link from `src` after waiting for
-        the appropriate latency.
+        Run in a separate thread and send packet on link from `src` once it has been
+        serialized at `departure` (ms) and the propagation latency has elapsed.
         """
+        self.in_flight.add(packet)
         if src == self.e1:
             packet.add_to_route(self.e2)
-            packet.animate_send(self.e1, self.e2, self.l12)
-            time.sleep(self.l12 / 1000)
-            self.q12.put(packet)
+            if self.animate:
+                self.animate(packet, self.e1, self.e2, self.l12)
+            time.sleep(max(departure + self.l12 - self.clock() * 1000, 0) / 1000)
+            self.q12.append(packet)
+            self.tx12.record_delivery()
         elif src == self.e2:
             packet.add_to_route(self.e1)
-            packet.animate_send(self.e2, self.e1, self.l21)
-            time.sleep(self.l21 / 1000)
-            self.q21.put(packet)
+            if self.animate:
+                self.animate(packet, self.e2, self.e1, self.l21)
+            time.sleep(max(departure + self.l21 - self.clock() * 1000, 0) / 1000)
+            self.q21.append(packet)
+            self.tx21.record_delivery()
+        self.in_flight.discard(packet)
         sys.stdout.flush()
 
     def send(self, packet, src):
         """
         Send packet on link from `src`. Checks that packet content is a string and
         starts a new thread to send it. `src` must be equal to `self.e1` or `self.e2`.
+        The packet is silently dropped if the transmit buffer rejects it, if the
+        link is `silent`, or if the impairment model loses it.
         """
         if packet.content:
             assert isinstance(packet.content, str), "Packet content must be a string"
-        p = packet.copy()
-        _thread.start_new_thread(self._send_helper, (p, src))
+        if self.silent:
+            self.silent_dropped += 1
+            return
+        tx = self.tx12 if src == self.e1 else self.tx21
+        departure = tx.enqueue(packet.size, self.clock() * 1000)
+        if departure is None:
+            return
+        delays = (0,)
+        impairment = self.impair12 if src == self.e1 else self.impair21
+        if impairment:
+            delays = impairment.delays()
+        for delay in delays:
+            args = (packet.copy(), src, departure + delay)
+            if self.profiler:
+                _thread.start_new_thread(
+                    self.profiler.runcall, (self._send_helper,) + args
+                )
+            else:
+                _thread.start_new_thread(self._send_helper, args)
 
     def recv(self, dst, timeout=None):
         """
@@ -61,15 +363,13 @@ class Link:
         """
         if dst == self.e1:
             try:
-                packet = self.q21.get_nowait()
-                return packet
-            except queue.Empty:
+                return self.q21.popleft()
+            except IndexError:
                 return None
         elif dst == self.e2:
             try:
-                packet = self.q12.get_nowait()
-                return packet
-            except queue.Empty:
+                return self.q12.popleft()
+            except IndexError:
                 return None
 
     def change_latency(self, src, c):
@@ -80,3 +380,17 @@ class Link:
             self.l12 = c * self.latency_multiplier
         elif src == self.e2:
             self.l21 = c * self.latency_multiplier
+
+    def get_stats(self):
+        """
+        Return the per-direction counters, utilization and queue occupancy, with the
+        impairment counters (see Impairment.stats) if the link has impairments.
+        """
+        stats = {
+            (self.e1, self.e2): self.tx12.stats(),
+            (self.e2, self.e1): self.tx21.stats(),
+        }
+        if self.has_impairments:
+            stats[(self.e1, self.e2)].update(self.impair12.stats())
+            stats[(self.e2, self.e1)].update(self.impair21.stats())
+        return stats
@@ -0,0 +1,85 @@
+import json
+import threading
+import weakref
+
+
+class LSPRecord(dict):
+    """
+    The LSPRecord class is the decoded, read-only form of one link state packet.
+
+    It is the link state itself, a mapping {neighbor: cost}, so it can be stored and
+    used wherever a router keeps a link state dict. The other fields of the packet
+    are attributes. Records are shared between routers, so every method that would
+    modify the mapping raises TypeError.
+
+    Parameters
+    ----------
+    content
+        The encoded packet content (JSON string) the record was decoded from.
+    message
+        The decoded content, a dict with "src_addr", "sequence_number", "link_state"
+        and optionally "area" and "purge" (true for a purge of the LSP of
+        "src_addr" up to "sequence_number").
+    """
+
+    def __init__(self, content, message):
+        super().__init__(message["link_state"])
+        self.content = content
+        self.src_addr = message["src_addr"]
+        self.sequence_number = message["sequence_number"]
+        self.area = message.get("area")
+        self.purge = message.get("purge", False)
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("LSPRecord is read-only, copy it with dict() to modify it")
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+    __ior__ = _read_only
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+class LSPStore:
+    """
+    The LSPStore class interns the link state packets of all the LSrouters of a
+    process, so that each distinct packet is decoded once and stored once.
+
+    Records are keyed by their encoded content and held weakly: a record is dropped
+    from the store as soon as no router keeps it in its link state database, e.g.
+    once every router has replaced it with a newer sequence number.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = weakref.WeakValueDictionary()  # {content: LSPRecord}
+        self.decoded = 0  # Number of records created
+
+    def get(self, content):
+        """Return the record of the packet content `content`, or None if unknown."""
+        return self.records.get(content)
+
+    def add(self, content, message):
+        """Return the record of `content`, creating it from the decoded `message`."""
+        record = self.records.get(content)
+        if record is not None:
+            return record
+        record = LSPRecord(content, message)
+        with self.lock:
+            existing = self.records.get(content)
+            if existing is not None:
+                return existing
+            self.records[content] = record
+            self.decoded += 1
+        return record
+
+    def encode(self, message):
+        """Encode `message` as packet content and return its record."""
+        return self.add(json.dumps(message), message)
+
+    def __len__(self):
+        return len(self.records)
+
+
+lsp_store = LSPStore()
@@ -0,0 +1,286 @@
+import collections
+import logging
+import queue
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from address import addresses
+from client import Client
+from link import Link
+from router import Router
+
+# Objects that belong to another subsystem, or are not simulation state
+SKIPPED_TYPES = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+    logging.Logger,
+    logging.Handler,
+    threading.Thread,
+    Link,
+    Router,
+    Client,
+)
+
+# Attributes of routers and clients that are accounted elsewhere or are not tables:
+# links and loggers, and the runtime machinery (random generators, shutdown event,
+# clock, pending link changes, locks and callbacks) that every node carries
+SKIPPED_ATTRIBUTES = {
+    "links",
+    "dead_links",
+    "link",
+    "logger",
+    "fib_export",
+    "pacing_rng",
+    "probe_rng",
+    "shutdown",
+    "clock",
+    "link_changes",
+    "affected_lock",
+    "update_fn",
+    "traffic_fn",
+}
+
+
+def deep_sizeof(obj, seen):
+    """
+    Return the size in bytes of `obj` and of all the objects it references, except
+    those already in `seen` and instances of `SKIPPED_TYPES`. The objects counted are
+    added to `seen`, a dict keyed by id that keeps them alive so that their ids are
+    not reused, and objects shared between several calls are counted once, by the
+    first call that reaches them.
+    """
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, SKIPPED_TYPES):
+            continue
+        seen[id(o)] = o
+        size += sys.getsizeof(o)
+        if isinstance(o, (str, bytes, int, float, bool)) or o is None:
+            continue
+        try:
+            if isinstance(o, dict):
+                for key, value in list(o.items()):
+                    stack.append(key)
+                    stack.append(value)
+            elif isinstance(o, (list, tuple, set, frozenset, collections.deque)):
+                stack.extend(list(o))
+            elif isinstance(o, queue.Queue):
+                stack.extend(list(o.queue))
+            attributes = getattr(o, "__dict__", None)
+            if attributes is not None:
+                stack.append(attributes)
+        except RuntimeError:
+            pass  # Changed by another thread while being copied, count what we have
+    return size
+
+
+class MemoryReport:
+    """
+    The MemoryReport class attributes the memory of a running simulation to its
+    subsystems, periodically and at the end of the run.
+
+    Each sample measures, with `deep_sizeof`:
+
+    - "lsp_store": the link state packets shared by all LSrouters.
+    - "addresses": the address registry.
+    - "routers": every table (instance attribute) of every router, e.g.
+      `link_state_db` or `neighbor_dv`, reported per table across routers.
+    - "links": the packets in flight (sleeping in `Link._send_helper` threads) and
+      the packets waiting in the receive queues.
+    - "clients": the state of every client.
+    - "routes": `Network.routes`, the routes found by traceroutes.
+
+    Shared objects are counted once, in the first subsystem above that reaches them.
+    tracemalloc runs during the whole simulation, and each sample also records the
+    traced and peak memory, which include the samples themselves. The end report
+    adds the top allocation sites outside this module.
+
+    Parameters
+    ----------
+    interval
+        Interval (in ms) between two periodic samples.
+    top
+        Number of tables, links and allocation sites listed in the end report.
+    """
+
+    def __init__(self, interval=1000, top=10):
+        self.interval = interval
+        self.top = top
+        self.samples = []  # (time (ms), subsystem, name, bytes)
+        self.network = None
+        self.sampling = False
+        self.sampler = None
+        self.start_ms = None
+        self.final = None
+        self.snapshot = None
+
+    def start(self, network):
+        """Start tracemalloc and the periodic sampling of `network`."""
+        self.network = network
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.start_ms = time.time() * 1000
+        self.sampling = True
+        self.sampler = threading.Thread(target=self._sample, name="memory-report")
+        self.sampler.daemon = True
+        self.sampler.start()
+
+    def stop(self):
+        """Stop sampling, take the final sample and snapshot, and stop tracemalloc."""
+        self.sampling = False
+        if self.sampler:
+            self.sampler.join()
+        self.final = self.measure()
+        self._record(self.final)
+        self.snapshot = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            ]
+        )
+        tracemalloc.stop()
+
+    def _sample(self):
+        """Body of the sampling thread."""
+        while self.sampling:
+            self._record(self.measure())
+            deadline = time.time() + self.interval / 1000
+            while self.sampling and time.time() < deadline:
+                time.sleep(0.05)
+
+    def _record(self, measurement):
+        """Append the subsystem totals of `measurement` to the samples."""
+        t_ms = time.time() * 1000 - self.start_ms
+        for subsystem, total in measurement["totals"].items():
+            self.samples.append((t_ms, subsystem, "", total))
+        for table, size in measurement["tables"].items():
+            self.samples.append((t_ms, "routers", table, size))
+        current, peak = tracemalloc.get_traced_memory()
+        self.samples.append((t_ms, "tracemalloc", "current", current))
+        self.samples.append((t_ms, "tracemalloc", "peak", peak))
+
+    def measure(self):
+        """
+        Measure the network now. Return a dict with the "totals" per subsystem, the
+        router "tables" summed across routers, the size of each router
+        ("per_router"), and the "per_link" sizes and packet counts of in-flight and
+        queued packets.
+        """
+        from lsp_store import lsp_store
+
+        network = self.network
+        seen = {}
+        totals = {}
+        records = list(lsp_store.records.values())
+        totals["lsp_store"] = sum(deep_sizeof(record, seen) for record in records)
+        totals["addresses"] = deep_sizeof(vars(addresses), seen)
+        tables = collections.Counter()
+        per_router = {}
+        for addr, router in list(network.routers.items()):
+            router_size = 0
+            for name, value in list(vars(router).items()):
+                if name in SKIPPED_ATTRIBUTES:
+                    continue
+                size = deep_sizeof(value, seen)
+                tables[name] += size
+                router_size += size
+            per_router[addr] = router_size
+        totals["routers"] = sum(per_router.values())
+        per_link = {}
+        for (addr1, addr2), (*_, link) in list(network.links.items()):
+            in_flight = list(getattr(link, "in_flight", ()))
+            queued = list(getattr(link, "q12", ())) + list(getattr(link, "q21", ()))
+            per_link[f"{addr1}-{addr2}"] = (
+                sum(deep_sizeof(packet, seen) for packet in in_flight),
+                len(in_flight),
+                sum(deep_sizeof(packet, seen) for packet in queued),
+                len(queued),
+            )
+        totals["links"] = sum(s[0] + s[2] for s in per_link.values())
+        totals["clients"] = 0
+        for client in list(network.clients.values()):
+            for name, value in list(vars(client).items()):
+                if name not in SKIPPED_ATTRIBUTES:
+                    totals["clients"] += deep_sizeof(value, seen)
+        with network.routes_lock:
+            routes = dict(network.routes)
+        totals["routes"] = deep_sizeof(routes, seen)
+        return {
+            "totals": totals,
+            "tables": dict(tables),
+            "per_router": per_router,
+            "per_link": per_link,
+        }
+
+    def get_report(self):
+        """Return the end-of-run breakdown and top allocation sites as a string."""
+        if self.final is None:
+            return "No memory report collected"
+        totals = self.final["totals"]
+        lines = ["Memory by subsystem (deep size at the end of the run):"]
+        for subsystem, size in sorted(totals.items(), key=lambda t: -t[1]):
+            lines.append(f"  {subsystem}: {_format_bytes(size)}")
+        peaks = collections.defaultdict(int)
+        for _, subsystem, name, size in self.samples:
+            key = f"{subsystem}.{name}" if name else subsystem
+            peaks[key] = max(peaks[key], size)
+        lines.append("Peak per subsystem over the samples:")
+        for subsystem in totals:
+            lines.append(f"  {subsystem}: {_format_bytes(peaks[subsystem])}")
+
+        lines.append("Router tables (all routers):")
+        tables = sorted(self.final["tables"].items(), key=lambda t: -t[1])
+        for table, size in tables[: self.top]:
+            lines.append(f"  {table}: {_format_bytes(size)}")
+        per_router = sorted(self.final["per_router"].items(), key=lambda t: -t[1])
+        lines.append("Largest routers:")
+        for addr, size in per_router[: self.top]:
+            lines.append(f"  {addr}: {_format_bytes(size)}")
+        per_link = sorted(
+            self.final["per_link"].items(), key=lambda t: -(t[1][0] + t[1][2])
+        )
+        lines.append("Largest links (in flight / queued):")
+        for link, (flight_size, flights, queue_size, queued) in per_link[: self.top]:
+            if flights or queued:
+                lines.append(
+                    f"  {link}: {flights} packets, {_format_bytes(flight_size)} / "
+                    f"{queued} packets, {_format_bytes(queue_size)}"
+                )
+
+        current, peak = peaks["tracemalloc.current"], peaks["tracemalloc.peak"]
+        lines.append(
+            f"tracemalloc: {_format_bytes(current)} traced at most, "
+            f"{_format_bytes(peak)} peak"
+        )
+        if self.snapshot is not None:
+            lines.append("Top allocation sites:")
+            for stat in self.snapshot.statistics("lineno")[: self.top]:
+                frame = stat.traceback[0]
+                lines.append(
+                    f"  {frame.filename}:{frame.lineno}: {_format_bytes(stat.size)} "
+                    f"in {stat.count} blocks"
+                )
+        return "\n".join(lines)
+
+    def write(self, path):
+        """Write the periodic samples to `path` as CSV."""
+        with open(path, "w") as f:
+            f.write("time_ms,subsystem,name,bytes\n")
+            for t_ms, subsystem, name, size in self.samples:
+                f.write(f"{t_ms:.0f},{subsystem},{name},{size}\n")
+
+
+def _format_bytes(size):
+    """Format a size in bytes with a binary unit."""
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
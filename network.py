@@ -1,4 +1,5 @@
 import argparse
+import logging
 import sys
 import threading
 import json
@@ -7,31 +8,16 @@ import signal
 import time
 import queue
 from collections import defaultdict
+from address import addresses
 from client import Client
 from link import Link
 from router import Router
+from traffic import Flow
 
-
-def json_load_byteified(file_handle):
-    return _byteify(json.load(file_handle, object_hook=_byteify), ignore_dicts=True)
-
-
-def _byteify(data, ignore_dicts=False):
-    # If this is a unicode string, return its string representation
-    if isinstance(data, str):
-        return data.encode("utf-8")
-    # If this is a list of values, return list of byteified values
-    if isinstance(data, list):
-        return [_byteify(item, ignore_dicts=True) for item in data]
-    # If this is a dictionary, return dictionary of byteified keys and values
-    # but only if we haven't already byteified it
-    if isinstance(data, dict) and not ignore_dicts:
-        return {
-            _byteify(key, ignore_dicts=True): _byteify(value, ignore_dicts=True)
-            for key, value in data.items()
-        }
-    # If this is anything else, return it in its original form
-    return data
+# Logger given to the routers of networks created with log=False
+QUIET_LOGGER = logging.getLogger("network.quiet")
+QUIET_LOGGER.setLevel(logging.CRITICAL + 1)
+QUIET_LOGGER.propagate = False
 
 
 class Network:
@@ -42,15 +28,144 @@ class Network:
     net_json_path
         The path to the JSON file that contains the network configurations.
     RouterClass
-        Whether to use DVrouter, LSrouter, or the default router.
+        Whether to use DVrouter, LSrouter, PVrouter, or the default router.
     visualize
         Whether to visualize the network.
+    flows
+        Optional list of traffic flow specifications. Overrides the "flows" entry of
+        the configuration file.
+    profiler
+        Optional Profiler that every router, client, change-handler and link
+        delivery thread runs under.
+    warm_start
+        Optional path to a checkpoint written by `save_checkpoint` to restore the
+        routing state of the routers and the current routes from.
+    router_options
+        Optional dict of keyword arguments for the RouterClass constructor. They are
+        merged over the "router_options" entry of the configuration file for the
+        class, e.g. {"DVrouter": {"poison_reverse": false}}.
+    fib_export
+        Optional path of a file to publish the live forwarding tables of the routers
+        to, readable by other processes with `fib_export.FibReader`.
+    probing
+        Optional dict of traceroute probing options, merged over the "probing" entry
+        of the configuration file: "strategy" ("full", "random", "round_robin" or
+        "affected"), "count", "periods" and "seed". See Client.
+    route_history
+        Optional path of a JSON-lines file to stream route changes to, for
+        `route_history.RouteHistory` queries after the run.
+    thread_batch
+        Number of routers (and, separately, clients) run by each thread. With the
+        default 1, each has its own thread. Larger batches start thousands of nodes
+        with far fewer threads, at the cost of running their ticks one after the
+        other.
+    seed
+        Seed of the link impairment generators. Overrides the "seed" entry of the
+        configuration file, which defaults to 0.
+    clock
+        Function returning the current time in seconds, used by the routers,
+        clients, links and change handler of this network. Sleeps are in real time,
+        so it must advance like `time.time` (default), e.g. `time.monotonic`.
+    log
+        Whether the routers write their router_<addr>.log files. Router loggers are
+        named after the address, so networks that run at the same time in one
+        process with the same addresses should not log. Routers of a network that
+        does not log are given a quiet logger and leave the named loggers alone.
+
+    Everything a run depends on belongs to the instance, so several networks can
+    run at the same time in one process (see `run_simulation`):
+
+    - `shutdown`: the event that stops every thread of the network when set.
+    - `visualize_changes_callback`: optional function called as
+      `callback(change, target)` after each link change.
+    - `animate_packet_callback`: optional function called as
+      `callback(packet, src, dst, latency)` when a packet starts crossing a link.
+      Only networks created with `visualize` call it.
     """
 
-    def __init__(self, net_json_path, RouterClass, visualize=False):
+    def __init__(
+        self,
+        net_json_path,
+        RouterClass,
+        visualize=False,
+        flows=None,
+        profiler=None,
+        warm_start=None,
+        router_options=None,
+        fib_export=None,
+        thread_batch=1,
+        probing=None,
+        route_history=None,
+        seed=None,
+        clock=None,
+        log=True,
+    ):
         # Parse configuration details
         with open(net_json_path, "r") as f:
             net_json = json.load(f)
+        self.configure(
+            net_json,
+            RouterClass.__name__,
+            visualize=visualize,
+            router_options=router_options,
+            probing=probing,
+            seed=seed,
+            clock=clock,
+            log=log,
+        )
+        self.profiler = profiler
+        self.thread_batch = thread_batch
+
+        # Assign dense address IDs to routers, then clients
+        for addr in net_json["routers"] + net_json["clients"]:
+            addresses.intern(addr)
+
+        # Parse and create routers, clients, and links
+        self.routers = self.parse_routers(net_json["routers"], RouterClass)
+        self.clients = self.parse_clients(net_json["clients"], self.client_send_rate)
+        self.links = self.parse_links(net_json["links"])
+        if fib_export:
+            from fib_export import FibExport
+
+            self.fib_export = FibExport(
+                fib_export,
+                self.routers,
+                net_json["routers"] + net_json["clients"],
+                width=self.max_ports(net_json) if self.accept_equal_cost else 1,
+            )
+            for router in self.routers.values():
+                router.fib_export = self.fib_export
+        if flows is None:
+            flows = net_json.get("flows", [])
+        self.flows = self.parse_flows(flows)
+        if route_history:
+            from route_history import RouteHistoryWriter
+
+            self.route_history = RouteHistoryWriter(
+                route_history, net_json_path, clock=self.clock
+            )
+        if warm_start:
+            self.load_checkpoint(warm_start)
+
+    def configure(
+        self,
+        net_json,
+        class_name,
+        visualize=False,
+        router_options=None,
+        probing=None,
+        seed=None,
+        clock=None,
+        log=True,
+    ):
+        """Set up the configuration and the run state from the parsed `net_json`.
+
+        Everything but the routers, clients, links and flows is set here, so that
+        subclasses that create those differently, such as distributed.Coordinator,
+        call this method and get every attribute that the other methods use.
+        `class_name` is the router class name the "router_options" entry is read
+        for. The other arguments are those of Network.
+        """
         self.latency_multiplier = 100
         self.end_time = net_json["end_time"] * self.latency_multiplier
         self.visualize = visualize
@@ -58,10 +173,25 @@ class Network:
             self.latency_multiplier *= net_json["visualize"]["time_multiplier"]
         self.client_send_rate = net_json["client_send_rate"] * self.latency_multiplier
 
-        # Parse and create routers, clients, and links
-        self.routers = self.parse_routers(net_json["routers"], RouterClass)
-        self.clients = self.parse_clients(net_json["clients"], self.client_send_rate)
-        self.links = self.parse_links(net_json["links"])
+        self.router_options = dict(
+            net_json.get("router_options", {}).get(class_name, {})
+        )
+        self.router_options.update(router_options or {})
+        self.areas = net_json.get("areas", {})
+        # With equal-cost multipath, any route as cheap as a correct one is correct
+        self.accept_equal_cost = bool(self.router_options.get("ecmp"))
+        self.down_links = set()
+        self.silent_events = []  # (time (ms), addr1, addr2) of "silent" changes
+        self.probing = dict(net_json.get("probing", {}))
+        self.probing.update(probing or {})
+        self.seed = net_json.get("seed", 0) if seed is None else seed
+        self.clock = clock or time.time
+        self.log = log
+        self.shutdown = threading.Event()
+        self.visualize_changes_callback = None
+        self.animate_packet_callback = None
+        self.fib_export = None
+        self.flows = {}
 
         # Parse link changes
         if "changes" in net_json:
@@ -72,39 +202,175 @@ class Network:
         # Parse correct routes and create some tracking fields
         self.correct_routes = self.parse_correct_routes(net_json["correct_routes"])
         self.threads = []
+        self.handle_changes_thread = None
         self.routes = {}
         self.routes_lock = threading.Lock()
+        self.route_history = None
 
     def parse_routers(self, router_params, RouterClass):
-        """Parse routes from the `router_params` dict."""
+        """Parse routes from the `router_params` dict.
+
+        If the configuration has an "areas" dict {router: area} and RouterClass
+        supports areas, each router gets its area as the `area` keyword argument.
+        """
         routers = {}
         for addr in router_params:
-            routers[addr] = RouterClass(
-                addr, heartbeat_time=self.latency_multiplier * 10
+            options = dict(self.router_options)
+            if getattr(RouterClass, "supports_areas", False) and addr in self.areas:
+                options["area"] = self.areas[addr]
+            if not self.log:
+                # Routers given a logger do not set up their own log file
+                options["logger"] = QUIET_LOGGER
+            router = RouterClass(
+                addr, heartbeat_time=self.latency_multiplier * 10, **options
             )
+            router.clock = self.clock
+            router.shutdown = self.shutdown
+            if not self.log:
+                router.logger = QUIET_LOGGER
+            routers[addr] = router
         return routers
 
     def parse_clients(self, client_params, client_send_rate):
         """Parse clients from `client_params` dict."""
         clients = {}
         for addr in client_params:
-            clients[addr] = Client(
-                addr, client_params, client_send_rate, self.update_route
+            client = clients[addr] = Client(
+                addr,
+                client_params,
+                client_send_rate,
+                self.update_route,
+                traffic_fn=self.update_flow,
+                probe=self.probing.get("strategy", "full"),
+                probe_count=self.probing.get("count"),
+                probe_periods=self.probing.get("periods", 5),
+                seed=self.probing.get("seed"),
             )
+            client.clock = self.clock
+            client.shutdown = self.shutdown
         return clients
 
     def parse_links(self, link_params):
         """Parse links from the `link_params` dict."""
         links = {}
-        for addr1, addr2, p1, p2, c12, c21 in link_params:
-            link = Link(addr1, addr2, c12, c21, self.latency_multiplier)
+        for params in link_params:
+            addr1, addr2, p1, p2, c12, c21 = params[:6]
+            self.check_link_costs(params)
+            link = self.create_link(params)
             links[(addr1, addr2)] = (p1, p2, c12, c21, link)
         return links
 
+    @staticmethod
+    def check_link_costs(params):
+        """
+        Raise a ValueError unless both costs of the scenario link entry `params` are
+        integers, as the routers keep costs in integer tables (AddressTable).
+        """
+        addr1, addr2, _, _, c12, c21 = params[:6]
+        if not all(isinstance(cost, int) for cost in (c12, c21)):
+            raise ValueError(
+                f"Link {addr1}-{addr2}: costs must be integers, not {c12!r} and "
+                f"{c21!r}"
+            )
+
+    def create_link(self, params):
+        """Create a Link from a scenario link entry.
+
+        The entry is `[addr1, addr2, p1, p2, c12, c21]`, optionally followed by a dict
+        with the queue model options "bandwidth" (bytes/s), "buffer_size" (packets),
+        "queue_policy" ("droptail" or "red") and "red" (RED parameters), and the
+        impairment options "loss" (probability), "jitter" (simulation time units) and
+        "duplicate" (probability). All but "queue_policy" and "red" take either one
+        value or an [addr1->addr2, addr2->addr1] pair. Impairments draw from
+        generators seeded with `seed`.
+
+        Packets only wait in a buffer while the ones before them are serialized, so
+        "buffer_size" and the "red" policy need a bandwidth in the same direction.
+        """
+        addr1, addr2, _, _, c12, c21 = params[:6]
+        options = params[6] if len(params) > 6 else {}
+        bandwidths = Link._per_direction(options.get("bandwidth"))
+        buffer_sizes = Link._per_direction(options.get("buffer_size"))
+        red = options.get("queue_policy") == "red"
+        for bandwidth, buffer_size in zip(bandwidths, buffer_sizes):
+            if not bandwidth and (buffer_size is not None or red):
+                raise ValueError(
+                    f"Link {addr1}-{addr2}: buffer_size and queue_policy red need "
+                    "a bandwidth"
+                )
+        return Link(
+            addr1,
+            addr2,
+            c12,
+            c21,
+            self.latency_multiplier,
+            bandwidth=options.get("bandwidth"),
+            buffer_size=options.get("buffer_size"),
+            queue_policy=options.get("queue_policy", "droptail"),
+            red=options.get("red"),
+            loss=options.get("loss"),
+            jitter=options.get("jitter"),
+            duplicate=options.get("duplicate"),
+            seed=self.seed,
+            clock=self.clock,
+            animate=self.animate_packet if self.visualize else None,
+            profiler=self.profiler,
+        )
+
+    @staticmethod
+    def max_ports(net_json):
+        """
+        Return the largest number of ports of a router of `net_json`, counting the
+        links of the scenario and those brought up by its changes.
+        """
+        ports = defaultdict(set)
+        changes = net_json.get("changes", [])
+        up = [target for _, target, change in changes if change == "up"]
+        for addr1, addr2, p1, p2, *_ in net_json["links"] + up:
+            ports[addr1].add(p1)
+            ports[addr2].add(p2)
+        return max((len(ports[addr]) for addr in net_json["routers"]), default=1)
+
+    def parse_flows(self, flow_params):
+        """Parse traffic flows from the `flow_params` list and attach them to clients.
+
+        Each entry is a dict with keys "src", "dst" and optionally "id", "pattern",
+        "rate" (packets/s), "start", "duration", "on_time", "off_time" (all times in
+        simulation time units) and "seed". Both ends must be clients of the network.
+        """
+        flows = {}
+        for i, params in enumerate(flow_params):
+            flow_id = params.get("id", i)
+            for end in ("src", "dst"):
+                if params.get(end) not in self.clients:
+                    raise ValueError(
+                        f"Flow {flow_id!r}: {end} {params.get(end)!r} is not a client"
+                    )
+            duration = params.get("duration")
+            flow = Flow(
+                flow_id,
+                params["src"],
+                params["dst"],
+                pattern=params.get("pattern", "cbr"),
+                rate=params.get("rate", 100),
+                start=params.get("start", 0) * self.latency_multiplier,
+                duration=(
+                    None if duration is None else duration * self.latency_multiplier
+                ),
+                on_time=params.get("on_time", 0) * self.latency_multiplier,
+                off_time=params.get("off_time", 0) * self.latency_multiplier,
+                seed=params.get("seed"),
+            )
+            flows[flow_id] = flow
+            self.clients[flow.src].add_flow(flow)
+        return flows
+
     def parse_changes(self, changes_params):
         """Parse link changes from the `changes_params` dict."""
         changes = queue.PriorityQueue()
         for change in changes_params:
+            if change[2] == "up":
+                self.check_link_costs(change[1])
             changes.put(change)
         return changes
 
@@ -116,32 +382,64 @@ class Network:
             correct_routes[(src, dst)].append(route)
         return correct_routes
 
-    def run(self):
+    def run(self, quiet=False):
         """Run the network.
 
         Start threads for each client and router. Start thread to track link changes.
-        If not visualizing, wait until end time and print the final routes.
+        If not visualizing, wait until end time, print the final routes unless `quiet`
+        and stop the threads. The run ends early if `shutdown` is set.
         """
-        for router in self.routers.values():
-            thread = RouterThread(router)
-            thread.start()
-            self.threads.append(thread)
-        for client in self.clients.values():
-            thread = ClientThread(client)
-            thread.start()
-            self.threads.append(thread)
+        self.start_threads(list(self.routers.values()), RouterThread)
+        start_time = self.clock() * 1000
+        for flow in self.flows.values():
+            flow.activate(start_time)
+        self.start_threads(list(self.clients.values()), ClientThread)
         self.add_links()
         if self.changes:
-            self.handle_changes_thread = HandleChangesThread(self)
+            self.handle_changes_thread = HandleChangesThread(
+                self, profiler=self.profiler
+            )
             self.handle_changes_thread.start()
 
         if not self.visualize:
-            signal.signal(signal.SIGINT, self.handle_interrupt)
-            time.sleep(self.end_time / 1000)
+            self.shutdown.wait(self.end_time / 1000)
             self.final_routes()
-            sys.stdout.write("\n" + self.get_route_string() + "\n")
+            if not quiet:
+                self.write_summary()
             self.join_all()
 
+    def write_summary(self):
+        """Print the final routes and the traffic, link and detection reports."""
+        sys.stdout.write("\n" + self.get_route_string() + "\n")
+        if self.flows:
+            sys.stdout.write("\n" + self.get_traffic_string() + "\n")
+        if any(link.has_queue_model for *_, link in self.links.values()):
+            sys.stdout.write("\n" + self.get_link_string() + "\n")
+        if any(link.has_impairments for *_, link in self.links.values()):
+            sys.stdout.write("\n" + self.get_impairment_string() + "\n")
+        if self.silent_events:
+            sys.stdout.write("\n" + self.get_detection_string() + "\n")
+
+    def start_threads(self, nodes, ThreadClass):
+        """Start threads for the routers or clients `nodes`.
+
+        With a `thread_batch` larger than 1, each thread runs the ticks of a batch of
+        consecutive nodes instead of a single node.
+        """
+        if self.thread_batch > 1:
+            for i in range(0, len(nodes), self.thread_batch):
+                batch = nodes[i : i + self.thread_batch]
+                thread = BatchThread(
+                    batch, self.shutdown, self.clock, profiler=self.profiler
+                )
+                thread.start()
+                self.threads.append(thread)
+            return
+        for node in nodes:
+            thread = ThreadClass(node, profiler=self.profiler)
+            thread.start()
+            self.threads.append(thread)
+
     def add_links(self):
         """Add links to clients and routers."""
         for addr1, addr2 in self.links:
@@ -159,34 +457,76 @@ class Network:
         """Handle changes to links.
 
         Run this method in a separate thread. Use a priority queue to track the time of
-        next change.
+        next change. Return early when `shutdown` is set.
         """
-        start_time = time.time() * 1000
+        start_time = self.clock() * 1000
         while not self.changes.empty():
             change_time, target, change = self.changes.get()
-            current_time = time.time() * 1000
+            current_time = self.clock() * 1000
             wait_time = (
                 change_time * self.latency_multiplier + start_time
             ) - current_time
-            if wait_time > 0:
-                time.sleep(wait_time / 1000)
+            if wait_time > 0 and self.shutdown.wait(wait_time / 1000):
+                return
 
             # Link changes
             if change == "up":
-                addr1, addr2, p1, p2, c12, c21 = target
-                link = Link(addr1, addr2, c12, c21, self.latency_multiplier)
+                addr1, addr2, p1, p2, c12, c21 = target[:6]
+                link = self.create_link(target)
                 self.links[(addr1, addr2)] = (p1, p2, c12, c21, link)
+                self.down_links.discard((addr1, addr2))
                 self.routers[addr1].change_link(("add", p1, addr2, link, c12))
                 self.routers[addr2].change_link(("add", p2, addr1, link, c21))
             elif change == "down":
                 addr1, addr2 = target
                 p1, p2, _, _, link = self.links[(addr1, addr2)]
+                self.down_links.add((addr1, addr2))
                 self.routers[addr1].change_link(("remove", p1))
                 self.routers[addr2].change_link(("remove", p2))
+            # Links that stop delivering without the routers being told
+            elif change == "silent":
+                addr1, addr2 = target
+                self.links[(addr1, addr2)][4].silent = True
+                self.down_links.add((addr1, addr2))
+                self.silent_events.append((self.clock() * 1000, addr1, addr2))
+            elif change == "restore":
+                addr1, addr2 = target
+                self.links[(addr1, addr2)][4].silent = False
+                self.down_links.discard((addr1, addr2))
+            if self.probing.get("strategy") == "affected":
+                self.mark_affected(target[0], target[1])
 
             # Update visualization
-            if hasattr(Network, "visualize_changes_callback"):
-                Network.visualize_changes_callback(change, target)
+            if self.visualize_changes_callback:
+                self.visualize_changes_callback(change, target)
+
+    def animate_packet(self, packet, src, dst, latency):
+        """Callback function used by links to report a packet starting to cross."""
+        if self.animate_packet_callback:
+            self.animate_packet_callback(packet, src, dst, latency)
+
+    def affected_pairs(self, addr1, addr2):
+        """
+        Return {src: [dst]} of the pairs that a change of the link between `addr1`
+        and `addr2` may affect: those whose current route goes through either
+        endpoint, and those without a correct route.
+        """
+        affected = defaultdict(list)
+        self.routes_lock.acquire()
+        for (src, dst), (route, is_good, _) in self.routes.items():
+            if not is_good or addr1 in route or addr2 in route:
+                affected[src].append(dst)
+        self.routes_lock.release()
+        return affected
+
+    def mark_affected(self, addr1, addr2):
+        """
+        Have the clients probe again the pairs that a change of the link between
+        `addr1` and `addr2` may affect (see `affected_pairs`).
+        """
+        periods = self.probing.get("periods", 5)
+        for src, dsts in self.affected_pairs(addr1, addr2).items():
+            self.clients[src].mark_affected(dsts, periods)
 
     def update_route(self, src, dst, route):
         """
@@ -194,17 +534,185 @@ class Network:
         traceroute packets.
         """
         self.routes_lock.acquire()
-        time_ms = int(round(time.time() * 1000))
-        is_good = route in self.correct_routes[(src, dst)]
+        time_ms = int(round(self.clock() * 1000))
+        is_good = route in self.correct_routes[(src, dst)] or (
+            self.accept_equal_cost and self.is_equal_cost_route(src, dst, route)
+        )
         try:
-            _, _, current_time = self.routes[(src, dst)]
+            _, _, current_time = self.routes.get((src, dst), (None, None, -1))
             if time_ms > current_time:
                 self.routes[(src, dst)] = (route, is_good, time_ms)
-        except KeyError:
-            self.routes[(src, dst)] = (route, is_good, time_ms)
+                if self.route_history:
+                    self.route_history.record(src, dst, route, is_good, time_ms)
         finally:
             self.routes_lock.release()
 
+    def route_cost(self, route):
+        """Return the cost of `route` over links that are up, or None if it has none."""
+        cost = 0
+        for addr1, addr2 in zip(route, route[1:]):
+            if (addr1, addr2) in self.links and (addr1, addr2) not in self.down_links:
+                cost += self.links[(addr1, addr2)][2]
+            elif (addr2, addr1) in self.links and (addr2, addr1) not in self.down_links:
+                cost += self.links[(addr2, addr1)][3]
+            else:
+                return None
+        return cost
+
+    def is_equal_cost_route(self, src, dst, route):
+        """
+        Return whether `route` is an existing path from `src` to `dst` with the same
+        cost as one of the correct routes, i.e. a member of an equal-cost multipath.
+        """
+        if not route or route[0] != src or route[-1] != dst:
+            return False
+        cost = self.route_cost(route)
+        correct_routes = self.correct_routes[(src, dst)]
+        return cost is not None and any(
+            cost == self.route_cost(correct) for correct in correct_routes
+        )
+
+    def update_flow(self, flow_id, seq, sent_ms, recv_ms):
+        """
+        Callback function used by clients to report the arrival of a data packet of
+        flow `flow_id`.
+        """
+        flow = self.flows.get(flow_id)
+        if flow:
+            flow.stats.record_recv(seq, sent_ms, recv_ms)
+
+    def get_traffic_stats(self):
+        """Return the per-flow traffic statistics and their aggregate."""
+        per_flow = {
+            flow_id: flow.stats.summary() for flow_id, flow in self.flows.items()
+        }
+        sent = sum(stats["sent"] for stats in per_flow.values())
+        received = sum(stats["received"] for stats in per_flow.values())
+        total = {
+            "sent": sent,
+            "received": received,
+            "lost": sum(stats["lost"] for stats in per_flow.values()),
+            "reordered": sum(stats["reordered"] for stats in per_flow.values()),
+            "throughput_pps": sum(s["throughput_pps"] for s in per_flow.values()),
+        }
+        return per_flow, total
+
+    def get_traffic_string(self):
+        """Create a string summarizing throughput, delay, loss and reordering."""
+        per_flow, total = self.get_traffic_stats()
+
+        def fmt(value):
+            return "-" if value is None else f"{value:.1f}"
+
+        lines = ["Traffic flows:"]
+        for flow_id in sorted(per_flow, key=str):
+            flow, stats = self.flows[flow_id], per_flow[flow_id]
+            lines.append(
+                f"{flow_id} {flow.src} -> {flow.dst} ({flow.pattern}): "
+                f"sent {stats['sent']}, received {stats['received']}, "
+                f"loss {stats['loss_rate']:.2%}, reordered {stats['reordered']}, "
+                f"{stats['throughput_pps']:.1f} pkt/s, delay p50/p95/p99 "
+                f"{fmt(stats['delay_p50_ms'])}/{fmt(stats['delay_p95_ms'])}/"
+                f"{fmt(stats['delay_p99_ms'])} ms"
+            )
+        lines.append(
+            f"Total: sent {total['sent']}, received {total['received']}, "
+            f"lost {total['lost']}, reordered {total['reordered']}, "
+            f"{total['throughput_pps']:.1f} pkt/s"
+        )
+        return "\n".join(lines)
+
+    def get_control_plane_string(self):
+        """Create a string with the routing messages and bytes sent by each router."""
+        lines = ["Routing messages:"]
+        total_messages = total_bytes = 0
+        for addr in sorted(self.routers):
+            router = self.routers[addr]
+            total_messages += router.routing_messages_sent
+            total_bytes += router.routing_bytes_sent
+            lines.append(
+                f"{addr}: {router.routing_messages_sent} messages, "
+                f"{router.routing_bytes_sent} bytes"
+            )
+        lines.append(f"Total: {total_messages} messages, {total_bytes} bytes")
+        return "\n".join(lines)
+
+    def get_detection_string(self, detections=None):
+        """
+        Create a string with the time each router took to detect the "silent" link
+        changes with the hello protocol, from the `detections` of every router
+        address (default: those of the routers of this network).
+        """
+        if detections is None:
+            detections = {
+                addr: router.detections for addr, router in self.routers.items()
+            }
+        lines = ["Failure detection:"]
+        for event_ms, addr1, addr2 in self.silent_events:
+            for addr, endpoint in ((addr1, addr2), (addr2, addr1)):
+                if addr not in detections:
+                    continue
+                detected = [
+                    t for t, e in detections[addr] if e == endpoint and t >= event_ms
+                ]
+                if detected:
+                    latency = f"after {min(detected) - event_ms:.0f} ms"
+                else:
+                    latency = "not detected"
+                lines.append(f"{addr}: link to {endpoint} {latency}")
+        return "\n".join(lines)
+
+    def get_link_stats(self):
+        """Return the per-direction stats of every link, keyed by (src, dst)."""
+        stats = {}
+        for _, _, _, _, link in self.links.values():
+            stats.update(link.get_stats())
+        return stats
+
+    def get_link_string(self):
+        """
+        Create a string with the utilization, queue occupancy and drop counters of
+        every link that has a bandwidth or buffer configured.
+        """
+        lines = ["Link queues:"]
+        for _, _, _, _, link in self.links.values():
+            if not link.has_queue_model:
+                continue
+            for (src, dst), stats in link.get_stats().items():
+                lines.append(
+                    f"{src} -> {dst}: sent {stats['sent']}, "
+                    f"delivered {stats['delivered']}, "
+                    f"dropped {stats['dropped_tail']} tail/{stats['dropped_red']} red, "
+                    f"utilization {stats['utilization']:.1%}, queue "
+                    f"{stats['queue_occupancy']} (max {stats['max_queue_occupancy']})"
+                )
+        return "\n".join(lines)
+
+    def get_impairment_string(self):
+        """
+        Create a string with the loss, duplication and jitter counters of every link
+        that has impairments configured.
+        """
+        lines = ["Link impairments:"]
+        total_packets = total_lost = total_duplicated = 0
+        for _, _, _, _, link in self.links.values():
+            if not link.has_impairments:
+                continue
+            for (src, dst), stats in link.get_stats().items():
+                lines.append(
+                    f"{src} -> {dst}: {stats['packets']} packets, "
+                    f"lost {stats['lost']}, duplicated {stats['duplicated']}, "
+                    f"mean jitter {stats['mean_jitter_ms']:.1f} ms"
+                )
+                total_packets += stats["packets"]
+                total_lost += stats["lost"]
+                total_duplicated += stats["duplicated"]
+        lines.append(
+            f"Total: {total_packets} packets, lost {total_lost}, "
+            f"duplicated {total_duplicated} (seed {self.seed})"
+        )
+        return "\n".join(lines)
+
     def get_route_string(self, label_incorrect=True):
         """
         Create a string with all the current routes found by traceroute packets and
@@ -235,6 +743,42 @@ class Network:
         self.routes_lock.release()
         return route_pickle
 
+    def save_checkpoint(self, path):
+        """Save the routing state of every router and the current routes to `path`.
+
+        The routers should be stopped or converged, so that the snapshot is consistent.
+        """
+        self.routes_lock.acquire()
+        checkpoint = {
+            "router_class": type(next(iter(self.routers.values()))).__name__,
+            "routers": {addr: r.get_state() for addr, r in self.routers.items()},
+            "routes": dict(self.routes),
+        }
+        self.routes_lock.release()
+        with open(path, "wb") as f:
+            pickle.dump(checkpoint, f)
+
+    def load_checkpoint(self, path):
+        """Restore a checkpoint written by `save_checkpoint`.
+
+        Must be called before `run`. Routers that are not in the checkpoint start
+        cold. Links are not part of the checkpoint and are added from the scenario as
+        usual, on top of the restored tables.
+        """
+        with open(path, "rb") as f:
+            checkpoint = pickle.load(f)
+        for addr, router in self.routers.items():
+            if checkpoint["router_class"] != type(router).__name__:
+                raise ValueError(
+                    f"Checkpoint was made with {checkpoint['router_class']}, "
+                    f"not {type(router).__name__}"
+                )
+            if addr in checkpoint["routers"]:
+                router.set_state(checkpoint["routers"][addr])
+        self.routes_lock.acquire()
+        self.routes = dict(checkpoint["routes"])
+        self.routes_lock.release()
+
     def reset_routes(self):
         """Reset the routes found by traceroute packets."""
         self.routes_lock.acquire()
@@ -246,20 +790,110 @@ class Network:
         self.reset_routes()
         for client in self.clients.values():
             client.last_send()
-        time.sleep(4 * self.client_send_rate / 1000)
+        self.shutdown.wait(4 * self.client_send_rate / 1000)
 
     def join_all(self):
-        if self.changes:
+        """Set `shutdown` and wait for the threads of the network to finish."""
+        self.shutdown.set()
+        if self.handle_changes_thread:
             self.handle_changes_thread.join()
         for thread in self.threads:
             thread.join()
 
+    def close(self):
+        """Close the forwarding table export and the route history, if any."""
+        if self.fib_export:
+            self.fib_export.close()
+        if self.route_history:
+            self.route_history.close()
+
+    def get_results(self):
+        """Return the outcome of the run as a dict of plain, picklable values.
+
+        - "routes": the final route of each (src, dst) pair.
+        - "incorrect": the sorted pairs whose route is not correct.
+        - "success": whether there are routes and all of them are correct.
+        - "routing_messages", "routing_bytes": the control plane sent by the routers.
+        - "seed": the seed of the link impairments.
+        - "traffic": the aggregate traffic statistics, if there are flows.
+        - "links": the per-direction stats of every link, if any link has a queue
+          model or impairments.
+        """
+        self.routes_lock.acquire()
+        routes = {pair: route for pair, (route, _, _) in self.routes.items()}
+        incorrect = sorted(pair for pair, (_, ok, _) in self.routes.items() if not ok)
+        self.routes_lock.release()
+        results = {
+            "routes": routes,
+            "incorrect": incorrect,
+            "success": bool(routes) and not incorrect,
+            "routing_messages": sum(
+                router.routing_messages_sent for router in self.routers.values()
+            ),
+            "routing_bytes": sum(
+                router.routing_bytes_sent for router in self.routers.values()
+            ),
+            "seed": self.seed,
+        }
+        if self.flows:
+            results["traffic"] = self.get_traffic_stats()[1]
+        if any(
+            link.has_queue_model or link.has_impairments
+            for *_, link in self.links.values()
+        ):
+            results["links"] = self.get_link_stats()
+        return results
+
     def handle_interrupt(self, signum, frame):
         self.join_all()
         print("")
         quit()
 
 
+def router_class(name):
+    """Return the router class for "DV", "LS", "PV" or None (the default Router)."""
+    if name == "DV":
+        from DVrouter import DVrouter
+
+        return DVrouter
+    if name == "LS":
+        from LSrouter import LSrouter
+
+        return LSrouter
+    if name == "PV":
+        from PVrouter import PVrouter
+
+        return PVrouter
+    return Router
+
+
+def run_simulation(net_json_path, router=None, log=False, **options):
+    """Run a scenario to its end time and return `Network.get_results()`.
+
+    Nothing is printed and, by default, the routers do not log. The network only
+    uses its own state, so several calls can run at the same time in threads of one
+    process (see sweep.py).
+
+    Parameters
+    ----------
+    net_json_path
+        The path to the JSON file that contains the network configurations.
+    router
+        "DV", "LS", "PV" or None (the default Router).
+    log
+        Whether the routers write their log files.
+    options
+        Other keyword arguments of Network, e.g. `router_options` or `seed`.
+    """
+    net = Network(net_json_path, router_class(router), log=log, **options)
+    try:
+        net.run(quiet=True)
+        return net.get_results()
+    finally:
+        net.join_all()
+        net.close()
+
+
 def main():
     parser = argparse.ArgumentParser(description="Run a network simulation.")
     parser.add_argument(
@@ -270,64 +904,254 @@ def main():
     parser.add_argument(
         "router",
         type=str,
-        choices=["DV", "LS"],
+        choices=["DV", "LS", "PV"],
+        nargs="?",
+        default=None,
+        help="DV for DVrouter, LS for LSrouter and PV for PVrouter. If not provided, "
+        "Router is used.",
+    )
+    parser.add_argument(
+        "--flows",
+        type=str,
+        default=None,
+        help="Path to a JSON list of traffic flows to run instead of the scenario's.",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
         nargs="?",
+        const="profile",
         default=None,
-        help="DV for DVrouter and LS for LSrouter. If not provided, Router is used.",
+        metavar="PREFIX",
+        help="Profile all simulator threads and write PREFIX.pstats, "
+        "PREFIX.collapsed and PREFIX_queues.csv (default prefix: profile).",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        default=None,
+        help="Save the converged routing state to this file at the end of the run.",
+    )
+    parser.add_argument(
+        "--warm-start",
+        type=str,
+        default=None,
+        help="Start from the routing state saved in this checkpoint file.",
+    )
+    parser.add_argument(
+        "-o",
+        "--router-option",
+        type=str,
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Keyword argument for the router constructor, VALUE parsed as JSON if "
+        "possible (e.g. -o poison_reverse=false). Can be repeated.",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print the number of routing messages and bytes sent by the routers.",
+    )
+    parser.add_argument(
+        "--thread-batch",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Run N routers (or clients) per thread, for faster startup of large "
+        "scenarios (default: 1).",
+    )
+    parser.add_argument(
+        "--probe",
+        type=str,
+        choices=list(Client.PROBE_STRATEGIES),
+        default=None,
+        help="Traceroute probing strategy of the clients (default: full mesh).",
+    )
+    parser.add_argument(
+        "--probe-count",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Clients probed per period by the random and round_robin strategies.",
+    )
+    parser.add_argument(
+        "--route-history",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Stream route changes to this JSON-lines file "
+        "(query with route_history.py PATH).",
+    )
+    parser.add_argument(
+        "--memory-report",
+        type=str,
+        nargs="?",
+        const="memory",
+        default=None,
+        metavar="PREFIX",
+        help="Sample memory per subsystem with tracemalloc and deep object sizes, "
+        "print a breakdown at the end and write the samples to PREFIX.csv "
+        "(default prefix: memory).",
+    )
+    parser.add_argument(
+        "--memory-interval",
+        type=int,
+        default=1000,
+        metavar="MS",
+        help="Interval between two memory report samples (default 1000 ms).",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help='Seed of the link impairment generators, instead of the scenario "seed".',
+    )
+    parser.add_argument(
+        "--fib-export",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Publish the live forwarding tables to this memory-mapped file "
+        "(read with fib_export.py PATH).",
     )
     args = parser.parse_args()
 
-    RouterClass = Router
-    if args.router == "DV":
-        from DVrouter import DVrouter
+    RouterClass = router_class(args.router)
 
-        RouterClass = DVrouter
-    elif args.router == "LS":
-        from LSrouter import LSrouter
+    flows = None
+    if args.flows:
+        with open(args.flows, "r") as f:
+            flows = json.load(f)
 
-        RouterClass = LSrouter
+    profiler = None
+    if args.profile:
+        from profiler import Profiler
+
+        profiler = Profiler()
+
+    router_options = {}
+    for option in args.router_option:
+        key, _, value = option.partition("=")
+        try:
+            router_options[key] = json.loads(value)
+        except json.JSONDecodeError:
+            router_options[key] = value
+
+    probing = {}
+    if args.probe:
+        probing["strategy"] = args.probe
+    if args.probe_count:
+        probing["count"] = args.probe_count
+
+    net = Network(
+        args.net_json_path,
+        RouterClass,
+        visualize=False,
+        flows=flows,
+        profiler=profiler,
+        warm_start=args.warm_start,
+        router_options=router_options,
+        fib_export=args.fib_export,
+        thread_batch=args.thread_batch,
+        probing=probing,
+        route_history=args.route_history,
+        seed=args.seed,
+    )
+    memory = None
+    if args.memory_report:
+        from memory_report import MemoryReport
 
-    net = Network(args.net_json_path, RouterClass, visualize=False)
+        memory = MemoryReport(interval=args.memory_interval)
+    if profiler:
+        profiler.start(net)
+    if memory:
+        memory.start(net)
+    signal.signal(signal.SIGINT, net.handle_interrupt)
     net.run()
+    if memory:
+        memory.stop()
+        memory.write(f"{args.memory_report}.csv")
+        sys.stdout.write("\n" + memory.get_report() + "\n")
+    if args.checkpoint:
+        net.save_checkpoint(args.checkpoint)
+    if args.stats:
+        sys.stdout.write("\n" + net.get_control_plane_string() + "\n")
+    net.close()
+    if profiler:
+        profiler.stop()
+        profiler.write(args.profile)
+        sys.stdout.write("\n" + profiler.get_report() + "\n")
 
 
 class RouterThread(threading.Thread):
-    def __init__(self, router):
-        threading.Thread.__init__(self)
+    def __init__(self, router, profiler=None):
+        threading.Thread.__init__(self, name=f"router-{router.addr}")
         self.router = router
+        self.profiler = profiler
 
     def run(self):
-        self.router.run()
-
-    def join(self, timeout=None):
-        # Terrible style (think about changing) but works like a charm
-        self.router.keep_running = False
-        super(RouterThread, self).join(timeout)
+        if self.profiler:
+            self.profiler.runcall(self.router.run)
+        else:
+            self.router.run()
 
 
 class ClientThread(threading.Thread):
 
-    def __init__(self, client):
-        threading.Thread.__init__(self)
+    def __init__(self, client, profiler=None):
+        threading.Thread.__init__(self, name=f"client-{client.addr}")
         self.client = client
+        self.profiler = profiler
+
+    def run(self):
+        if self.profiler:
+            self.profiler.runcall(self.client.run)
+        else:
+            self.client.run()
+
+
+class BatchThread(threading.Thread):
+    """
+    Thread that runs the ticks of several routers or clients in turn, at the time
+    given by `clock`, until `shutdown` is set.
+    """
+
+    def __init__(self, nodes, shutdown, clock, profiler=None):
+        threading.Thread.__init__(self, name=f"batch-{nodes[0].addr}..{nodes[-1].addr}")
+        self.nodes = nodes
+        self.shutdown = shutdown
+        self.clock = clock
+        self.profiler = profiler
 
     def run(self):
-        self.client.run()
+        if self.profiler:
+            self.profiler.runcall(self.run_nodes)
+        else:
+            self.run_nodes()
 
-    def join(self, timeout=None):
-        # Terrible style (think about changing) but works like a charm
-        self.client.keep_running = False
-        super(ClientThread, self).join(timeout)
+    def run_nodes(self):
+        for node in self.nodes:
+            if hasattr(node, "setup"):
+                node.setup()
+        while not self.shutdown.wait(0.1):
+            time_ms = int(round(self.clock() * 1000))
+            for node in self.nodes:
+                node.tick(time_ms)
 
 
 class HandleChangesThread(threading.Thread):
 
-    def __init__(self, network):
-        threading.Thread.__init__(self)
+    def __init__(self, network, profiler=None):
+        threading.Thread.__init__(self, name="handle-changes")
         self.network = network
+        self.profiler = profiler
 
     def run(self):
-        self.network.handle_changes()
+        if self.profiler:
+            self.profiler.runcall(self.network.handle_changes)
+        else:
+            self.network.handle_changes()
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 import copy
+from address import addresses
 
 
 class Packet:
@@ -9,24 +10,37 @@ class Packet:
     Parameters
     ----------
     kind
-        Either Packet.TRACEROUTE or Packet.ROUTING. Use Packet.ROUTING for all packets
-        created by your implementations.
+        Packet.TRACEROUTE, Packet.ROUTING or Packet.DATA. Use Packet.ROUTING for all
+        packets created by your implementations. Packet.DATA packets are generated by
+        client traffic flows and must be forwarded like traceroute packets.
+        Packet.HELLO packets are sent and consumed by the Router base class.
     src_addr
         The address of the source of the packet.
     dst_addr
-        The address of the destination of the packet.
+        The address of the destination of the packet. Its ID in the address
+        registry, if it has one, is available as `dst_id`.
     content
         The content of the packet. Must be a string.
+    flow_id
+        Optional identifier of the traffic flow the packet belongs to. Routers with
+        equal-cost multipath forwarding hash it with the source and destination, so
+        the packets of one flow take the same path.
     """
 
     TRACEROUTE = 1
     ROUTING = 2
+    DATA = 3
+    HELLO = 4
 
-    def __init__(self, kind, src_addr, dst_addr, content=None):
+    HEADER_SIZE = 20  # Bytes counted for every packet on top of its content
+
+    def __init__(self, kind, src_addr, dst_addr, content=None, flow_id=None):
         self.kind = kind
         self.src_addr = src_addr
         self.dst_addr = dst_addr
+        self.dst_id = addresses.lookup(dst_addr)
         self.content = content
+        self.flow_id = flow_id
         self.route = [src_addr]
 
     def copy(self):
@@ -35,10 +49,15 @@ class Packet:
         This gets called automatically when the packet is sent to avoid aliasing issues.
         """
         content = copy.deepcopy(self.content)
-        p = Packet(self.kind, self.src_addr, self.dst_addr, content=content)
+        p = Packet(self.kind, self.src_addr, self.dst_addr, content, self.flow_id)
         p.route = list(self.route)
         return p
 
+    @property
+    def size(self):
+        """Size of the packet in bytes, used for link serialization delay."""
+        return Packet.HEADER_SIZE + (len(self.content) if self.content else 0)
+
     @property
     def is_traceroute(self):
         """Returns True if the packet is a traceroute packet."""
@@ -49,11 +68,16 @@ class Packet:
         """Returns True is the packet is a routing packet."""
         return self.kind == Packet.ROUTING
 
+    @property
+    def is_data(self):
+        """Returns True if the packet is a data packet of a traffic flow."""
+        return self.kind == Packet.DATA
+
+    @property
+    def is_hello(self):
+        """Returns True if the packet is a hello of the Router liveness protocol."""
+        return self.kind == Packet.HELLO
+
     def add_to_route(self, addr):
         """DO NOT CALL from DVrouter or LSrouter!"""
         self.route.append(addr)
-
-    def animate_send(self, src, dst, latency):
-        """DO NOT CALL from DVrouter or LSrouter!"""
-        if hasattr(Packet, "animate"):
-            Packet.animate(self, src, dst, latency)
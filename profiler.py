@@ -0,0 +1,155 @@
+import _thread
+import collections
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+
+
+class Profiler:
+    """
+    The Profiler class profiles every thread of a simulation and merges the results
+    into one report.
+
+    Router, client and change-handler threads, as well as the short-lived threads
+    that deliver packets on links, run their body through `runcall`. Each of them is
+    profiled with its own cProfile.Profile, merged into a single pstats.Stats when
+    the thread ends. Python 3.12+ only allows one active cProfile at a time, but
+    there a single profiler sees every thread, so one global profiler is used.
+
+    A sampling thread additionally records the stack of every running thread, for
+    collapsed-stack (flamegraph) output, and the depth of router `link_changes`
+    queues and link queues over time.
+
+    Parameters
+    ----------
+    sample_interval
+        Interval (in ms) between two stack samples.
+    queue_sample_interval
+        Interval (in ms) between two queue depth samples.
+    """
+
+    def __init__(self, sample_interval=5, queue_sample_interval=100):
+        self.sample_interval = sample_interval
+        self.queue_sample_interval = queue_sample_interval
+        self.per_thread = sys.version_info < (3, 12)
+        self.lock = threading.Lock()
+        self.stats = None
+        self.global_profile = None
+        self.stacks = collections.Counter()
+        self.queue_samples = []
+        self.network = None
+        self.sampling = False
+        self.sampler = None
+
+    def runcall(self, fn, *args):
+        """Run `fn(*args)` in the current thread while profiling it."""
+        if not self.per_thread:
+            return fn(*args)
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(fn, *args)
+        finally:
+            self._merge(profile)
+
+    def _merge(self, profile):
+        """Merge the results of `profile` into the combined stats."""
+        with self.lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+
+    def start(self, network):
+        """Start sampling stacks and queue depths of `network`."""
+        self.network = network
+        if not self.per_thread:
+            self.global_profile = cProfile.Profile()
+            self.global_profile.enable()
+        self.sampling = True
+        self.sampler = threading.Thread(target=self._sample, name="profiler")
+        self.sampler.daemon = True
+        self.sampler.start()
+
+    def stop(self):
+        """Stop sampling and collect the global profile if one is in use."""
+        self.sampling = False
+        if self.sampler:
+            self.sampler.join()
+        if self.global_profile:
+            self.global_profile.disable()
+            self._merge(self.global_profile)
+            self.global_profile = None
+
+    def _sample(self):
+        """Body of the sampling thread."""
+        own_id = _thread.get_ident()
+        start_ms = time.time() * 1000
+        next_queue_sample = start_ms
+        while self.sampling:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    location = f"{code.co_filename}:{code.co_firstlineno}"
+                    stack.append(f"{code.co_name} ({location})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, "link-delivery"))
+                self.stacks[";".join(reversed(stack))] += 1
+            now_ms = time.time() * 1000
+            if now_ms >= next_queue_sample:
+                self._sample_queues(now_ms - start_ms)
+                next_queue_sample = now_ms + self.queue_sample_interval
+            time.sleep(self.sample_interval / 1000)
+
+    def _sample_queues(self, t_ms):
+        """Record the depth of router change queues and link queues."""
+        network = self.network
+        for addr, router in network.routers.items():
+            self.queue_samples.append(
+                (t_ms, "link_changes", addr, router.link_changes.qsize())
+            )
+        for (addr1, addr2), (_, _, _, _, link) in list(network.links.items()):
+            self.queue_samples.append(
+                (t_ms, "rx_queue", f"{addr1}->{addr2}", len(link.q12))
+            )
+            self.queue_samples.append(
+                (t_ms, "rx_queue", f"{addr2}->{addr1}", len(link.q21))
+            )
+            self.queue_samples.append(
+                (t_ms, "tx_queue", f"{addr1}->{addr2}", link.tx12.occupancy())
+            )
+            self.queue_samples.append(
+                (t_ms, "tx_queue", f"{addr2}->{addr1}", link.tx21.occupancy())
+            )
+
+    def get_report(self, limit=25):
+        """Return the merged profile, sorted by cumulative time, as a string."""
+        if self.stats is None:
+            return "No profile data collected"
+        stream = io.StringIO()
+        with self.lock:
+            self.stats.stream = stream
+            self.stats.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+    def write(self, prefix):
+        """
+        Write `<prefix>.pstats`, the collapsed stacks `<prefix>.collapsed` (input for
+        flamegraph.pl or speedscope) and the queue depths `<prefix>_queues.csv`.
+        """
+        with self.lock:
+            if self.stats is not None:
+                self.stats.dump_stats(f"{prefix}.pstats")
+        with open(f"{prefix}.collapsed", "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(f"{prefix}_queues.csv", "w") as f:
+            f.write("time_ms,kind,name,depth\n")
+            for t_ms, kind, name, depth in self.queue_samples:
+                f.write(f"{t_ms:.0f},{kind},{name},{depth}\n")
@@ -0,0 +1,251 @@
+import argparse
+import json
+import sys
+import time
+
+
+class RouteHistoryWriter:
+    """
+    The RouteHistoryWriter class streams the routes found by traceroute packets to a
+    JSON-lines file while the simulation runs.
+
+    Routes are interned: the first time a route is seen, a {"path": ID, "route":
+    [...]} line defines its ID, and observations refer to it. An observation
+    {"t": ms, "src": ..., "dst": ..., "path": ID, "ok": bool} is written only when
+    the route of a pair or its correctness changes, with the time in ms since the
+    writer was created. Empty routes, which clients report when they send a probe,
+    are not observations. The last line is {"end": ms}.
+
+    Parameters
+    ----------
+    path
+        The file to write.
+    scenario
+        Optional name of the scenario, stored in the first line.
+    clock
+        Function returning the current time in seconds, the clock of the `time_ms`
+        passed to `record`.
+    """
+
+    def __init__(self, path, scenario=None, clock=time.time):
+        self.file = open(path, "w")
+        self.clock = clock
+        self.start_ms = clock() * 1000
+        self.paths = {}  # {route tuple: path ID}
+        self.current = {}  # {(src, dst): (path ID, ok)}
+        self.observations = 0
+        self._write({"start": self.start_ms, "scenario": scenario})
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def record(self, src, dst, route, is_good, time_ms):
+        """Record that the route of (`src`, `dst`) is `route` at `time_ms`."""
+        if not route:
+            return
+        key = tuple(route)
+        path_id = self.paths.get(key)
+        if path_id is None:
+            path_id = self.paths[key] = len(self.paths)
+            self._write({"path": path_id, "route": route})
+        if self.current.get((src, dst)) == (path_id, is_good):
+            return
+        self.current[(src, dst)] = (path_id, is_good)
+        t = round(time_ms - self.start_ms)
+        self._write({"t": t, "src": src, "dst": dst, "path": path_id, "ok": is_good})
+        self.observations += 1
+
+    def close(self):
+        """Write the end time and close the file."""
+        self._write({"end": round(self.clock() * 1000 - self.start_ms)})
+        self.file.close()
+
+
+def iter_records(path):
+    """Iterate over the decoded lines of a route history file, one at a time."""
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class RouteHistory:
+    """
+    The RouteHistory class answers queries over a file written by
+    RouteHistoryWriter.
+
+    Queries stream over the file with `iter_records` instead of loading it: a
+    query about one pair keeps a few values, and a query about every pair keeps a
+    few values per pair. Observations are written in time order, so queries about
+    a time stop reading at that time. Each query reads the file again, so prefer
+    `summary` and `routes_at` to calling the per-pair queries for every pair.
+
+    Parameters
+    ----------
+    path
+        The route history file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.scenario = None
+        self.end_ms = 0
+        for record in iter_records(path):
+            self.scenario = record.get("scenario")
+            break
+        self.end_ms = self._read_end()
+
+    def _read_end(self):
+        """Return the end time of the file, from its last line if it was closed."""
+        with open(self.path, "rb") as f:
+            f.seek(0, 2)
+            position = f.tell()
+            tail = b""
+            while position > 0 and tail.count(b"\n") < 2:
+                step = min(position, 4096)
+                position -= step
+                f.seek(position)
+                tail = f.read(step) + tail
+        lines = tail.strip().splitlines()
+        last = json.loads(lines[-1]) if lines else {}
+        if "end" in last:
+            return last["end"]
+        # The writer was not closed: the end is the last observation
+        end_ms = 0
+        for record in iter_records(self.path):
+            if "t" in record:
+                end_ms = max(end_ms, record["t"])
+        return end_ms
+
+    def _observations(self, pair=None, until=None):
+        """
+        Iterate over the (t, (src, dst), path ID, ok) observations, of `pair` only if
+        given, and up to time `until` (ms) if given.
+        """
+        for record in iter_records(self.path):
+            if "t" not in record:
+                continue
+            if until is not None and record["t"] > until:
+                return
+            observed = (record["src"], record["dst"])
+            if pair is None or observed == pair:
+                yield record["t"], observed, record["path"], record["ok"]
+
+    def _routes(self, path_ids):
+        """Return {path ID: route} for the IDs in `path_ids`, reading only those."""
+        path_ids = set(path_ids)
+        routes = {}
+        for record in iter_records(self.path):
+            if "path" in record and "t" not in record and record["path"] in path_ids:
+                routes[record["path"]] = record["route"]
+                if len(routes) == len(path_ids):
+                    break
+        return routes
+
+    def pairs(self):
+        """Return the (src, dst) pairs with at least one observation."""
+        return sorted({pair for _, pair, _, _ in self._observations()})
+
+    def route_at(self, src, dst, t):
+        """Return the route of (`src`, `dst`) at time `t` (ms), or None if unknown."""
+        path_id = None
+        for _, _, path_id, _ in self._observations((src, dst), until=t):
+            pass
+        if path_id is None:
+            return None
+        return self._routes([path_id])[path_id]
+
+    def routes_at(self, t):
+        """Return {(src, dst): route} at time `t` (ms) for every pair known by then."""
+        path_ids = {}
+        for _, pair, path_id, _ in self._observations(until=t):
+            path_ids[pair] = path_id
+        routes = self._routes(path_ids.values())
+        return {pair: routes[path_id] for pair, path_id in path_ids.items()}
+
+    def route_count(self):
+        """Return the number of distinct routes in the file."""
+        return sum(1 for r in iter_records(self.path) if "path" in r and "t" not in r)
+
+    def flap_count(self, src, dst):
+        """Return the number of times the route of (`src`, `dst`) changed."""
+        return self.summary([(src, dst)]).get((src, dst), (0, 0))[0]
+
+    def incorrect_time(self, src, dst, end=None):
+        """
+        Return the time (ms) during which (`src`, `dst`) was on an incorrect route,
+        from its first observation to `end` (default: the end of the file).
+        """
+        return self.summary([(src, dst)], end).get((src, dst), (0, 0))[1]
+
+    def summary(self, pairs=None, end=None):
+        """
+        Return {(src, dst): (flap count, incorrect time)} for every pair, or for the
+        pairs in `pairs`, with incorrect times up to `end` (default: the end of the
+        file), in one pass over the file.
+        """
+        end = self.end_ms if end is None else end
+        pairs = None if pairs is None else set(pairs)
+        state = {}  # {pair: [path ID, ok, time (ms), flaps, incorrect time]}
+        for t, pair, path_id, ok in self._observations():
+            if pairs is not None and pair not in pairs:
+                continue
+            current = state.get(pair)
+            if current is None:
+                state[pair] = [path_id, ok, t, 0, 0]
+                continue
+            if not current[1]:
+                current[4] += max(min(t, end) - current[2], 0)
+            if path_id != current[0]:
+                current[3] += 1
+            current[0], current[1], current[2] = path_id, ok, t
+        result = {}
+        for pair, (_, ok, t, flaps, incorrect) in state.items():
+            if not ok:
+                incorrect += max(end - t, 0)
+            result[pair] = (flaps, incorrect)
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Query a route history written with network.py --route-history."
+    )
+    parser.add_argument("path", type=str, help="Path to the route history file.")
+    parser.add_argument(
+        "--at",
+        type=float,
+        default=None,
+        metavar="T",
+        help="Print the route of every pair at T ms after the start.",
+    )
+    parser.add_argument(
+        "--pair",
+        type=str,
+        nargs=2,
+        default=None,
+        metavar=("SRC", "DST"),
+        help="Only print this pair.",
+    )
+    args = parser.parse_args()
+
+    history = RouteHistory(args.path)
+    if args.at is not None:
+        routes = history.routes_at(args.at)
+        pairs = [tuple(args.pair)] if args.pair else sorted(routes)
+        for src, dst in pairs:
+            sys.stdout.write(f"{src} -> {dst}: {routes.get((src, dst))}\n")
+    else:
+        summary = history.summary([tuple(args.pair)] if args.pair else None)
+        for (src, dst), (flaps, incorrect) in sorted(summary.items()):
+            sys.stdout.write(
+                f"{src} -> {dst}: {flaps} flaps, {incorrect} ms on incorrect routes\n"
+            )
+    sys.stdout.write(
+        f"{history.route_count()} distinct routes, {len(history.pairs())} pairs, "
+        f"{history.end_ms} ms\n"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
 import time
 import queue
+import random
+import threading
+import zlib
+from address import addresses
+from packet import Packet
 
 
 class Router:
@@ -13,21 +18,93 @@ class Router:
     - handle_new_link
     - handle_remove_link
     - handle_time
+    - send_update (optional, to use update pacing)
+    - setup (optional, for resources created in the router's thread)
     - __repr__ (optional, for your own debugging)
 
+    `run` ticks every 100 ms, at the time given by `clock`, until the `shutdown`
+    event is set. Network replaces both with its own, so that each network of a
+    process has its own clock and is stopped on its own.
+
+    The base class also offers an optional hello protocol that detects links that
+    silently stop delivering packets. Every `hello_interval` ms, the router sends a
+    Packet.HELLO on every port. A port that has heard a hello is declared dead when
+    no hello arrives for `dead_multiplier` intervals: `handle_remove_link` is called
+    as if the link had been removed. When hellos arrive again, `handle_new_link` is
+    called with the original endpoint and cost. Hellos never reach `handle_packet`.
+    Ports towards clients, which send no hellos, are never declared dead.
+
+    The base class also offers control-plane pacing. Subclasses call
+    `request_update` instead of sending a triggered update directly, and
+    `heartbeat_due` to decide when to send a periodic refresh. With the default
+    options both behave exactly like sending at once and sending every
+    `heartbeat_time` ms.
+
     Parameters
     ----------
     addr
-        The address of this router.
+        The address of this router. Its ID in the address registry is `addr_id`.
     heartbeat_time
         Routing information should be sent at least once every heartbeat_time ms.
+    min_update_interval
+        Minimum time (in ms) between two triggered updates, or None (default) to
+        send each triggered update at once. Requests made in between are coalesced
+        into one update sent when the interval has elapsed, at the end of a tick.
+    heartbeat_jitter
+        Fraction of `heartbeat_time` by which each periodic refresh is randomly
+        moved earlier or later, so that routers do not refresh in lockstep.
+    max_heartbeat_backoff
+        While no update is requested, the refresh interval doubles after every
+        refresh up to this multiple of `heartbeat_time`. The default 1 disables it.
+    hello_interval
+        Time (in ms) between two hellos, or None (default) to disable the hello
+        protocol. It can be shorter than `heartbeat_time`, down to one tick (100 ms).
+    dead_multiplier
+        Number of hello intervals without a hello after which a port is dead.
+    logger
+        The logger to use, or None (default) for subclasses to set up their own log
+        file. Network passes a logger that drops everything when logging is off.
     """
 
-    def __init__(self, addr, heartbeat_time=None):
+    def __init__(
+        self,
+        addr,
+        heartbeat_time=None,
+        min_update_interval=None,
+        heartbeat_jitter=0,
+        max_heartbeat_backoff=1,
+        hello_interval=None,
+        dead_multiplier=3,
+        logger=None,
+    ):
         self.addr = addr
+        self.addr_id = addresses.intern(addr)
         self.links = {}  # Links indexed by port
         self.link_changes = queue.Queue()  # Thread-safe queue for link changes
-        self.keep_running = True
+        self.clock = time.time  # Current time in seconds, replaced by the Network's
+        self.shutdown = threading.Event()  # Set to stop `run`, shared by the Network
+        self.logger = logger
+        self.routing_messages_sent = 0
+        self.routing_bytes_sent = 0
+        self.heartbeat_time = heartbeat_time
+        self.min_update_interval = min_update_interval
+        self.heartbeat_jitter = heartbeat_jitter
+        self.max_heartbeat_backoff = max_heartbeat_backoff
+        self.heartbeat_backoff = 1
+        self.next_heartbeat = 0
+        self.update_pending = False
+        self.last_update = 0
+        self.pacing_rng = random.Random(addr)  # Per-router, reproducible jitter
+        self.fib_export = None  # Optional FibExport to publish forwarding_table to
+        self.fib_published = None  # Entries last published
+        self.hello_interval = hello_interval
+        self.dead_multiplier = dead_multiplier
+        self.next_hello = 0
+        self.port_info = {}  # {port: (endpoint, cost)} of the links added
+        self.last_hello = {}  # {port: time (ms) of the last hello heard}
+        self.dead_links = {}  # Links declared dead by the hello protocol, by port
+        self.detections = []  # (time (ms), endpoint) of every port declared dead
+        self.hello_messages_sent = 0
 
     def change_link(self, change):
         """Add, remove, or change the cost of a link.
@@ -38,41 +115,169 @@ class Router:
 
     def add_link(self, port, endpointAddr, link, cost):
         """Add new link to router."""
-        if port in self.links:
+        if port in self.links or port in self.dead_links:
             self.remove_link(port)
         self.links[port] = link
+        self.port_info[port] = (endpointAddr, cost)
         self.handle_new_link(port, endpointAddr, cost)
 
     def remove_link(self, port):
         """Remove link from router."""
+        self.last_hello.pop(port, None)
+        self.port_info.pop(port, None)
+        if self.dead_links.pop(port, None) is not None:
+            return  # handle_remove_link was called when the port was declared dead
         self.links = {p: link for p, link in self.links.items() if p != port}
         self.handle_remove_link(port)
 
+    def setup(self):
+        """Prepare per-router resources in the router's thread, before the first tick.
+
+        Subclasses can override this method to defer work out of the constructor, so
+        that creating thousands of routers stays cheap.
+        """
+        pass
+
     def run(self):
         """Main loop of router."""
-        while self.keep_running:
-            time.sleep(0.1)
-            time_ms = int(round(time.time() * 1000))
+        self.setup()
+        while not self.shutdown.wait(0.1):
+            self.tick(int(round(self.clock() * 1000)))
+
+    def tick(self, time_ms):
+        """Apply link changes, handle received packets and timers at `time_ms`."""
+        while True:
             try:
                 change = self.link_changes.get_nowait()
-                if change[0] == "add":
-                    self.add_link(*change[1:])
-                elif change[0] == "remove":
-                    self.remove_link(*change[1:])
             except queue.Empty:
-                pass
-            for port in self.links.keys():
-                packet = self.links[port].recv(self.addr)
-                if packet:
+                break
+            if change[0] == "add":
+                self.add_link(*change[1:])
+            elif change[0] == "remove":
+                self.remove_link(*change[1:])
+        for port in list(self.links.keys()):
+            packet = self.links[port].recv(self.addr)
+            while packet:
+                if packet.kind == Packet.HELLO:
+                    self.last_hello[port] = time_ms
+                else:
                     self.handle_packet(port, packet)
-            self.handle_time(time_ms)
+                packet = self.links[port].recv(self.addr)
+        if self.hello_interval:
+            self.check_liveness(time_ms)
+        self.handle_time(time_ms)
+        self.flush_updates(time_ms)
+        if self.fib_export:
+            self.publish_forwarding_table()
+
+    def check_liveness(self, time_ms):
+        """Send due hellos, declare silent ports dead and revive dead ports."""
+        if time_ms >= self.next_hello:
+            self.next_hello = time_ms + self.hello_interval
+            for link in list(self.links.values()) + list(self.dead_links.values()):
+                link.send(Packet(Packet.HELLO, self.addr, None), self.addr)
+                self.hello_messages_sent += 1
+        dead_after = self.hello_interval * self.dead_multiplier
+        for port, last in list(self.last_hello.items()):
+            if port in self.links and time_ms - last > dead_after:
+                self.dead_links[port] = self.links.pop(port)
+                self.detections.append((time_ms, self.port_info[port][0]))
+                self.handle_remove_link(port)
+        for port in list(self.dead_links):
+            link = self.dead_links[port]
+            packet = link.recv(self.addr)
+            # Other packets on a dead port are dropped, until a hello revives it
+            while packet and packet.kind != Packet.HELLO:
+                packet = link.recv(self.addr)
+            if packet:
+                del self.dead_links[port]
+                self.links[port] = link
+                self.last_hello[port] = time_ms
+                self.handle_new_link(port, *self.port_info[port])
 
     def send(self, port, packet):
         """Send a packet out given port."""
         try:
             self.links[port].send(packet, self.addr)
         except KeyError:
-            pass
+            return
+        if packet.kind == Packet.ROUTING:
+            self.routing_messages_sent += 1
+            self.routing_bytes_sent += packet.size
+
+    def request_update(self):
+        """Ask for a triggered update, sent by `send_update` as pacing allows.
+
+        Also resets the heartbeat backoff, since the routing state changed.
+        """
+        self.heartbeat_backoff = 1
+        if self.min_update_interval is None:
+            self.send_update()
+        else:
+            self.update_pending = True
+
+    def flush_updates(self, time_ms):
+        """Send the pending triggered update if the minimum interval has elapsed."""
+        if self.update_pending and (
+            time_ms - self.last_update >= self.min_update_interval
+        ):
+            self.update_pending = False
+            self.last_update = time_ms
+            self.send_update()
+
+    def send_update(self):
+        """Send a triggered update.
+
+        Subclasses that call `request_update` should override this method.
+        """
+        pass
+
+    def heartbeat_due(self, time_ms):
+        """Return whether a periodic refresh is due at `time_ms`.
+
+        When it is, the next refresh is scheduled `heartbeat_time` ms later, scaled
+        by the current backoff and moved by a random jitter.
+        """
+        if time_ms < self.next_heartbeat:
+            return False
+        interval = self.heartbeat_time * self.heartbeat_backoff
+        if self.heartbeat_jitter:
+            jitter = self.pacing_rng.uniform(-1, 1) * self.heartbeat_jitter
+            interval *= 1 + jitter
+        self.next_heartbeat = time_ms + interval
+        self.heartbeat_backoff = min(
+            self.heartbeat_backoff * 2, self.max_heartbeat_backoff
+        )
+        return True
+
+    def publish_forwarding_table(self):
+        """Publish `forwarding_table` to `fib_export` if it changed since last time.
+
+        Called at the end of every tick when an export is set, so subclasses that keep
+        their table in a `forwarding_table` mapping are published without further
+        code, with the equal-cost ports of a `multipath` {address ID: [ports]}
+        mapping if they have one. Subclasses without a table publish nothing.
+        """
+        table = getattr(self, "forwarding_table", None)
+        if table is None:
+            return
+        entries = self.fib_export.encode(table, getattr(self, "multipath", None))
+        if entries != self.fib_published:
+            self.fib_export.publish(
+                self.addr, entries, len(table), self.clock() * 1000
+            )
+            self.fib_published = entries
+
+    def select_port(self, ports, packet):
+        """Pick one of the equal-cost `ports` for `packet`.
+
+        The choice is a stable hash (CRC-32) of the packet source, destination and flow
+        ID, salted with the router address so that consecutive routers do not all make
+        the same choice. Packets of one flow thus always leave on the same port, which
+        keeps them in order, while different flows spread over all the ports.
+        """
+        key = f"{self.addr}|{packet.src_addr}|{packet.dst_addr}|{packet.flow_id}"
+        return ports[zlib.crc32(key.encode()) % len(ports)]
 
     def handle_packet(self, port, packet):
         """Process incoming packet.
@@ -139,6 +344,23 @@ class Router:
         """
         pass
 
+    def get_state(self):
+        """Return the routing state of the router for a checkpoint.
+
+        Subclasses may override this method. The returned value must be picklable. The
+        default implementation returns an empty dict.
+        """
+        return {}
+
+    def set_state(self, state):
+        """Restore routing state returned by `get_state`.
+
+        Subclasses may override this method. It is called before the router thread
+        starts and before any link is added, so links re-added from the scenario see
+        the restored tables. The default implementation is empty.
+        """
+        pass
+
     def __repr__(self):
         """Representation for debugging in the network visualizer.
 
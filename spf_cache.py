@@ -0,0 +1,141 @@
+import collections
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class AllSourcePaths:
+    """
+    The AllSourcePaths class holds the shortest paths from every node of a graph to
+    every other node, computed together with a vectorized Floyd-Warshall pass.
+
+    Distances are kept in a (nodes x nodes) float matrix and predecessors in a
+    matrix of node indices (-1 for none), so the result for one source is a row.
+
+    Parameters
+    ----------
+    graph
+        The graph {node: {neighbor: cost}}. Every neighbor must also be a node.
+    """
+
+    def __init__(self, graph):
+        self.nodes = list(graph)
+        index = {node: i for i, node in enumerate(self.nodes)}
+        size = len(self.nodes)
+        distances = np.full((size, size), np.inf)
+        predecessors = np.full((size, size), -1, dtype=np.int32)
+        for node, links in graph.items():
+            i = index[node]
+            for neighbor, cost in links.items():
+                j = index[neighbor]
+                if cost < distances[i, j]:
+                    distances[i, j] = cost
+                    predecessors[i, j] = i
+        np.fill_diagonal(distances, 0)
+        np.fill_diagonal(predecessors, -1)
+        for k in range(size):
+            candidate = distances[:, k, None] + distances[None, k, :]
+            better = candidate < distances
+            np.copyto(distances, candidate, where=better)
+            np.copyto(predecessors, predecessors[k][None, :], where=better)
+        self.index = index
+        self.distances = distances
+        self.predecessors = predecessors
+
+    def paths(self, source):
+        """
+        Return the shortest paths from `source` as `LSrouter.dijkstra` does: the
+        distances {node: cost} (inf when unreachable) and the predecessors
+        {node: predecessor or None}.
+        """
+        row = self.index[source]
+        distances = {}
+        for node, cost in zip(self.nodes, self.distances[row].tolist()):
+            # Integer costs stay integers, as with Dijkstra
+            if cost < float("inf") and cost.is_integer():
+                cost = int(cost)
+            distances[node] = cost
+        predecessors = {
+            node: None if p < 0 else self.nodes[p]
+            for node, p in zip(self.nodes, self.predecessors[row].tolist())
+        }
+        return distances, predecessors
+
+
+class _Version:
+    """The requests for, and the shared result of, one LSDB version."""
+
+    def __init__(self):
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.result = None
+
+
+class SPFCache:
+    """
+    The SPFCache class shares shortest path computations between the LSrouters of a
+    process that hold the same link state database.
+
+    A router asks for its paths with the version key of its LSDB, e.g. the sorted
+    (router, encoded LSP) pairs, which are equal exactly when two LSDBs hold the
+    same link state packets, even across networks run in the same process. The
+    first request for a version returns None and the router runs its own Dijkstra,
+    so versions seen by only one router while flooding is in progress cost nothing
+    extra. The second request computes the paths from every source at once (see
+    AllSourcePaths), and every later request for that version only reads a row.
+    Only the `max_versions` most recently requested versions are kept.
+
+    Parameters
+    ----------
+    max_versions
+        Number of LSDB versions kept.
+    max_nodes
+        Graphs with more nodes are never shared: the all-source pass takes
+        O(nodes^3) time and O(nodes^2) memory.
+    """
+
+    def __init__(self, max_versions=16, max_nodes=1000):
+        self.max_versions = max_versions
+        self.max_nodes = max_nodes
+        self.lock = threading.Lock()
+        self.versions = collections.OrderedDict()  # {version key: _Version}
+        self.passes = 0  # All-source passes computed
+        self.hits = 0  # Requests answered from a pass
+        self.misses = 0  # Requests left to the router's own Dijkstra
+
+    @staticmethod
+    def require_numpy():
+        """Raise ImportError if NumPy, needed for the all-source pass, is missing."""
+        if np is None:
+            raise ImportError("shared_spf requires NumPy (pip install numpy)")
+
+    def shortest_paths(self, key, graph, source):
+        """
+        Return the distances and predecessors from `source` in `graph`, the graph of
+        LSDB version `key`, or None if the caller should compute them itself.
+        """
+        with self.lock:
+            version = self.versions.get(key)
+            if version is None:
+                version = self.versions[key] = _Version()
+                while len(self.versions) > self.max_versions:
+                    self.versions.popitem(last=False)
+            else:
+                self.versions.move_to_end(key)
+            version.requests += 1
+            if version.requests < 2 or len(graph) > self.max_nodes:
+                self.misses += 1
+                return None
+            self.hits += 1
+        with version.lock:
+            if version.result is None:
+                version.result = AllSourcePaths(graph)
+                with self.lock:
+                    self.passes += 1
+        return version.result.paths(source)
+
+
+spf_cache = SPFCache()
@@ -0,0 +1,195 @@
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import sys
+import time
+from network import run_simulation
+
+
+def run_job(job):
+    """
+    Run one job, a dict with "net_json_path", optionally "router" ("DV", "LS", "PV"
+    or None) and other keyword arguments of `run_simulation`. Return the results of
+    the run with its duration in "seconds", or {"success": False, "error": ...} if
+    the run raised an exception.
+    """
+    options = dict(job)
+    net_json_path = options.pop("net_json_path")
+    router = options.pop("router", None)
+    start = time.perf_counter()
+    try:
+        results = run_simulation(net_json_path, router, **options)
+    except Exception as e:
+        results = {"success": False, "error": f"{type(e).__name__}: {e}"}
+    results["seconds"] = time.perf_counter() - start
+    return results
+
+
+def run_batch(jobs):
+    """Run `jobs` at the same time, each in its own thread. Return their results."""
+    with concurrent.futures.ThreadPoolExecutor(max(len(jobs), 1)) as pool:
+        return list(pool.map(run_job, jobs))
+
+
+def run_many(jobs, processes=None, per_process=8):
+    """
+    Run every job of `jobs` (see `run_job`) and return their results in job order.
+
+    Simulations spend most of their time sleeping between ticks, so each worker
+    process runs a batch of `per_process` simulations at the same time, each one in
+    its own Network, and `processes` worker processes run batches in parallel. The
+    interpreter start-up and the imports are paid once per worker process instead
+    of once per job.
+
+    Parameters
+    ----------
+    jobs
+        Iterable of job dicts.
+    processes
+        Number of worker processes, by default the number of CPUs. With 1, the
+        batches run one after the other in this process.
+    per_process
+        Number of simulations run at the same time in each process.
+    """
+    jobs = list(jobs)
+    batches = [jobs[i : i + per_process] for i in range(0, len(jobs), per_process)]
+    processes = min(processes or os.cpu_count() or 1, max(len(batches), 1))
+    if processes <= 1:
+        results = map(run_batch, batches)
+        return [result for batch in results for result in batch]
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        results = pool.map(run_batch, batches)
+        return [result for batch in results for result in batch]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run many network simulations in a pool of worker processes."
+    )
+    parser.add_argument(
+        "net_json_paths",
+        type=str,
+        nargs="+",
+        metavar="net_json_path",
+        help="Paths to the network simulation configuration files (JSON).",
+    )
+    parser.add_argument(
+        "--routers",
+        type=str,
+        nargs="+",
+        choices=["DV", "LS", "PV"],
+        default=["DV", "LS"],
+        help="Router types to run every scenario with (default: DV LS).",
+    )
+    parser.add_argument(
+        "--seeds",
+        type=int,
+        nargs="+",
+        default=[None],
+        help="Seeds of the link impairments to run every scenario with "
+        '(default: the scenario "seed").',
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Run every combination N times (default: 1).",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Number of worker processes (default: number of CPUs).",
+    )
+    parser.add_argument(
+        "--per-process",
+        type=int,
+        default=8,
+        metavar="N",
+        help="Simulations run at the same time in each process (default: 8).",
+    )
+    parser.add_argument(
+        "-o",
+        "--router-option",
+        type=str,
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Keyword argument for the router constructor, VALUE parsed as JSON if "
+        "possible. Can be repeated.",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Write one JSON line of results per job to PATH.",
+    )
+    args = parser.parse_args()
+
+    router_options = {}
+    for option in args.router_option:
+        key, _, value = option.partition("=")
+        try:
+            router_options[key] = json.loads(value)
+        except json.JSONDecodeError:
+            router_options[key] = value
+
+    jobs = []
+    combinations = itertools.product(args.net_json_paths, args.routers, args.seeds)
+    for path, router, seed in combinations:
+        for _ in range(args.repeat):
+            jobs.append(
+                {
+                    "net_json_path": path,
+                    "router": router,
+                    "seed": seed,
+                    "router_options": router_options,
+                }
+            )
+
+    start = time.perf_counter()
+    results = run_many(jobs, args.processes, args.per_process)
+    elapsed = time.perf_counter() - start
+
+    output = open(args.output, "w") if args.output else None
+    for job, result in zip(jobs, results):
+        name = f"{job['net_json_path']} {job['router']} seed {result.get('seed')}"
+        if "error" in result:
+            status = result["error"]
+        elif result["success"]:
+            status = "SUCCESS"
+        else:
+            status = f"FAILURE ({len(result['incorrect'])} incorrect routes)"
+        sys.stdout.write(
+            f"{name}: {status}, {result.get('routing_messages', 0)} routing "
+            f"messages, {result['seconds']:.1f} s\n"
+        )
+        if output:
+            record = {
+                "scenario": job["net_json_path"],
+                "router": job["router"],
+                "seed": result.get("seed"),
+                "success": result["success"],
+                "incorrect": [list(pair) for pair in result.get("incorrect", [])],
+                "routing_messages": result.get("routing_messages"),
+                "routing_bytes": result.get("routing_bytes"),
+                "traffic": result.get("traffic"),
+                "error": result.get("error"),
+                "seconds": result["seconds"],
+            }
+            output.write(json.dumps(record) + "\n")
+    if output:
+        output.close()
+    succeeded = sum(1 for result in results if result["success"])
+    sys.stdout.write(
+        f"\n{succeeded}/{len(results)} simulations succeeded in {elapsed:.1f} s\n"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import json
+import os
+import subprocess
+
+import pytest
+
+from distributed import Coordinator
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def short_scenario(tmp_path, name, end_time=100):
+    """Write a copy of the scenario `name` that ends after `end_time` units."""
+    with open(os.path.join(HERE, name)) as f:
+        net_json = json.load(f)
+    net_json["end_time"] = end_time
+    path = tmp_path / name
+    path.write_text(json.dumps(net_json))
+    return str(path)
+
+
+def test_many_workers_connect_at_once(tmp_path, monkeypatch):
+    # One worker per router: all 6 workers connect to the coordinator at once
+    monkeypatch.chdir(tmp_path)
+    coordinator = Coordinator(
+        short_scenario(tmp_path, "05_pg242_net.json"), "LS", accept_timeout=60
+    )
+    assert coordinator.num_workers == 6
+    processes = [
+        subprocess.Popen(coordinator.worker_command())
+        for _ in range(coordinator.num_workers)
+    ]
+    try:
+        coordinator.run()
+    finally:
+        for process in processes:
+            process.wait(timeout=60)
+    assert "SUCCESS: All Routes correct!" in coordinator.get_route_string()
+
+
+def test_missing_worker_times_out(tmp_path):
+    coordinator = Coordinator(
+        short_scenario(tmp_path, "01_small_net.json"), "DV", accept_timeout=1
+    )
+    with pytest.raises(TimeoutError, match="0 of 2 workers"):
+        coordinator.accept_workers()
+    coordinator.listener.close()
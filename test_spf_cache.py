@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+import spf_cache
+from benchmark import generate_topology
+from LSrouter import LSrouter
+from network import QUIET_LOGGER
+
+pytest.importorskip("numpy")
+
+
+def make_router(addr):
+    """Create an LSrouter that logs nothing, to call dijkstra and first_hop on."""
+    return LSrouter(addr, heartbeat_time=1000, logger=QUIET_LOGGER)
+
+
+def unique_cost_graph(size, links, seed):
+    """
+    Generate a random graph with asymmetric costs that are distinct powers of two,
+    so that every shortest path is unique, and one node without links.
+    """
+    rng = random.Random(seed)
+    names = [f"r{i}" for i in range(size)]
+    graph = {name: {} for name in names + ["isolated"]}
+    costs = [2**i for i in range(2 * links)]
+    rng.shuffle(costs)
+    for i in range(links):
+        a, b = rng.sample(names, 2) if i >= size else (names[i], names[i - 1])
+        if b not in graph[a]:
+            graph[a][b] = costs.pop()
+            graph[b][a] = costs.pop()
+    return graph
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_paths_match_dijkstra_with_unique_paths(seed):
+    graph = unique_cost_graph(12, 22, seed)
+    all_paths = spf_cache.AllSourcePaths(graph)
+    for source in graph:
+        router = make_router(source)
+        expected_distances, expected_predecessors = router.dijkstra(graph, source)
+        distances, predecessors = all_paths.paths(source)
+        assert distances == expected_distances
+        for dest in graph:
+            assert router.first_hop(dest, predecessors) == router.first_hop(
+                dest, expected_predecessors
+            )
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("size", [2, 10, 60])
+def test_paths_match_dijkstra_with_equal_costs(size, seed):
+    graph = generate_topology(size, seed=seed)
+    all_paths = spf_cache.AllSourcePaths(graph)
+    routers = {source: make_router(source) for source in graph}
+    expected = {
+        source: routers[source].dijkstra(graph, source)[0] for source in graph
+    }
+    for source, router in routers.items():
+        distances, predecessors = all_paths.paths(source)
+        assert distances == expected[source]
+        for dest in graph:
+            if dest == source:
+                continue
+            # With ties, any first hop on a shortest path is as good as Dijkstra's
+            hop = router.first_hop(dest, predecessors)
+            assert graph[source][hop] + expected[hop][dest] == distances[dest]
@@ -0,0 +1,183 @@
+import json
+import random
+import threading
+from packet import Packet
+
+
+def percentile(values, p):
+    """Return the `p`-th percentile (0-100) of the already sorted `values`."""
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+class FlowStats:
+    """
+    The FlowStats class collects send/receive statistics of one data flow. It is
+    updated from the sending and the receiving client threads, so all updates are
+    guarded by a lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.received = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.max_seq = -1
+        self.seen = set()
+        self.delays = []
+        self.first_recv = None
+        self.last_recv = None
+
+    def record_send(self):
+        """Count one packet sent by the source client."""
+        with self.lock:
+            self.sent += 1
+
+    def record_recv(self, seq, sent_ms, recv_ms):
+        """Record the arrival of packet number `seq` at the destination client."""
+        with self.lock:
+            if seq in self.seen:
+                self.duplicates += 1
+                return
+            self.seen.add(seq)
+            self.received += 1
+            if seq < self.max_seq:
+                self.reordered += 1
+            else:
+                self.max_seq = seq
+            self.delays.append(recv_ms - sent_ms)
+            if self.first_recv is None:
+                self.first_recv = recv_ms
+            self.last_recv = recv_ms
+
+    def summary(self):
+        """Return a dict with throughput, delay percentiles, loss and reordering."""
+        with self.lock:
+            delays = sorted(self.delays)
+            span = (self.last_recv - self.first_recv) if self.received > 1 else 0
+            lost = max(self.sent - self.received, 0)
+            return {
+                "sent": self.sent,
+                "received": self.received,
+                "lost": lost,
+                "loss_rate": lost / self.sent if self.sent else 0.0,
+                "duplicates": self.duplicates,
+                "reordered": self.reordered,
+                "throughput_pps": self.received * 1000 / span if span > 0 else 0.0,
+                "delay_mean_ms": sum(delays) / len(delays) if delays else None,
+                "delay_p50_ms": percentile(delays, 50),
+                "delay_p95_ms": percentile(delays, 95),
+                "delay_p99_ms": percentile(delays, 99),
+            }
+
+
+class Flow:
+    """
+    The Flow class generates the data packets of one flow between two clients.
+
+    Parameters
+    ----------
+    flow_id
+        Unique identifier of the flow.
+    src, dst
+        The addresses of the source and destination clients.
+    pattern
+        One of "cbr" (constant bit rate), "poisson" or "onoff".
+    rate
+        The sending rate in packets per second (mean rate for "poisson", rate during
+        on periods for "onoff").
+    start, duration
+        When the flow starts and for how long it sends, in ms relative to the start
+        of the simulation. A `duration` of None sends until the end of the run.
+    on_time, off_time
+        Lengths (in ms) of the on and off periods of an "onoff" flow.
+    seed
+        Seed for the random generator of "poisson" flows.
+    """
+
+    PATTERNS = ("cbr", "poisson", "onoff")
+
+    def __init__(
+        self,
+        flow_id,
+        src,
+        dst,
+        pattern="cbr",
+        rate=100,
+        start=0,
+        duration=None,
+        on_time=None,
+        off_time=None,
+        seed=None,
+    ):
+        if pattern not in Flow.PATTERNS:
+            raise ValueError(f"Unknown flow pattern {pattern!r}")
+        if pattern == "onoff" and not (on_time and off_time):
+            raise ValueError("An onoff flow needs positive on_time and off_time")
+        if not (rate and rate > 0):
+            raise ValueError(f"Flow {flow_id!r} needs a positive rate, not {rate!r}")
+        self.flow_id = flow_id
+        self.src = src
+        self.dst = dst
+        self.pattern = pattern
+        self.rate = rate
+        self.interval = 1000 / rate
+        self.start = start
+        self.duration = duration
+        self.on_time = on_time
+        self.off_time = off_time
+        self.rng = random.Random(seed)
+        self.stats = FlowStats()
+        self.seq = 0
+        self.start_ms = None
+        self.end_ms = None
+        self.next_send = None
+
+    def activate(self, time_ms):
+        """Anchor the flow schedule at simulation start time `time_ms`."""
+        self.start_ms = time_ms + self.start
+        self.end_ms = None if self.duration is None else self.start_ms + self.duration
+        self.next_send = self.start_ms
+
+    def _advance(self):
+        """Move `next_send` to the time of the following packet."""
+        if self.pattern == "poisson":
+            self.next_send += self.rng.expovariate(1 / self.interval)
+            return
+        self.next_send += self.interval
+        if self.pattern == "onoff":
+            period = self.on_time + self.off_time
+            offset = (self.next_send - self.start_ms) % period
+            if offset >= self.on_time:
+                self.next_send += period - offset
+
+    def due(self, time_ms):
+        """Return how many packets should have been sent by `time_ms`."""
+        if self.next_send is None:
+            return 0
+        count = 0
+        while self.next_send <= time_ms and (
+            self.end_ms is None or self.next_send < self.end_ms
+        ):
+            count += 1
+            self._advance()
+        return count
+
+    def make_packet(self, time_ms):
+        """Create the next data packet of the flow and count it as sent."""
+        content = json.dumps({"flow": self.flow_id, "seq": self.seq, "sent": time_ms})
+        packet = Packet(Packet.DATA, self.src, self.dst, content, flow_id=self.flow_id)
+        self.seq += 1
+        self.stats.record_send()
+        return packet
+
+    def __repr__(self):
+        return (
+            f"Flow(id={self.flow_id}, {self.src}->{self.dst}, "
+            f"pattern={self.pattern}, rate={self.rate})"
+        )
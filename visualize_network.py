@@ -4,9 +4,7 @@ import tkinter.font
 import json
 import _thread
 import time
-from router import Router
-from network import Network
-from packet import Packet
+from network import Network, router_class
 
 
 class App:
@@ -15,8 +13,8 @@ class App:
     def __init__(self, root, network, network_params):
         self.network = network
         self.network_params = network_params
-        Packet.animate = self.packet_send
-        Network.visualize_changes_callback = self.visualize_changes
+        network.animate_packet_callback = self.packet_send
+        network.visualize_changes_callback = self.visualize_changes
         self.animate_rate = network_params["visualize"]["animate_rate"]
         self.latency_correction = network_params["visualize"]["latency_correction"]
         self.client_following = None
@@ -80,7 +78,7 @@ class App:
         """Draw lines corresponding to links."""
         lines = {}
         line_labels = {}
-        for addr1, addr2, _, _, c12, c21 in self.network_params["links"]:
+        for addr1, addr2, _, _, c12, c21, *_ in self.network_params["links"]:
             line, line_label = self.draw_line(addr1, addr2, c12, c21)
             lines[(addr1, addr2)] = line
             line_labels[(addr1, addr2)] = line_label
@@ -221,15 +219,22 @@ class App:
             time.sleep(self.display_current_debug_rate / 1000)
 
     def visualize_changes(self, change, target):
-        """Make color and text changes to links upon add/remove/cost changes."""
+        """Make color and text changes to links upon add/remove/cost changes.
+
+        Links that silently drop packets are drawn dashed.
+        """
         if change == "up":
-            addr1, addr2, _, _, c12, c21 = target
+            addr1, addr2, _, _, c12, c21 = target[:6]
             new_line, _ = self.draw_line(addr1, addr2, c12, c21)
             self.lines[(addr1, addr2)] = new_line
         elif change == "down":
             addr1, addr2 = target
             self.canvas.delete(self.lines[(addr1, addr2)])
             self.canvas.delete(self.line_labels[(addr1, addr2)])
+        elif change in ("silent", "restore"):
+            addr1, addr2 = target
+            dash = (4, 4) if change == "silent" else ()
+            self.canvas.itemconfig(self.lines[(addr1, addr2)], dash=dash)
 
 
 def main():
@@ -242,27 +247,18 @@ def main():
     parser.add_argument(
         "router",
         type=str,
-        choices=["DV", "LS"],
+        choices=["DV", "LS", "PV"],
         nargs="?",
         default=None,
-        help="DV for DVrouter and LS for LSrouter. If not provided, Router is used.",
+        help="DV for DVrouter, LS for LSrouter and PV for PVrouter. If not provided, "
+        "Router is used.",
     )
     args = parser.parse_args()
 
     with open(args.net_json_path, "r") as f:
         visualize_params = json.load(f)
 
-    RouterClass = Router
-    if args.router == "DV":
-        from DVrouter import DVrouter
-
-        RouterClass = DVrouter
-    elif args.router == "LS":
-        from LSrouter import LSrouter
-
-        RouterClass = LSrouter
-
-    net = Network(args.net_json_path, RouterClass, visualize=True)
+    net = Network(args.net_json_path, router_class(args.router), visualize=True)
     root = Tk()
     root.wm_title("Network Visualization")
     App(root, net, visualize_params)